@@ -0,0 +1,100 @@
+from collections import defaultdict, deque, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from health import MAX_GAP
+
+# คอลัมน์อุปกรณ์ -> สถานะที่นับว่า "ทำงาน" (ใช้คิดเวลาทำงานต่อวันและจำนวนครั้งที่เปิด)
+ACTUATORS = {'Pump': 'ON', 'Fan': 'MAX'}
+MAX_EVENTS = 2000   # จำนวนช่วงสถานะย้อนหลังที่เก็บไว้ต่ออุปกรณ์ (ใช้แสดงประวัติ)
+
+# ช่วงเวลาที่อุปกรณ์อยู่ในสถานะเดียวต่อเนื่องกัน 1 ช่วง
+# end คือเวลาที่เปลี่ยนเป็นสถานะถัดไป (None = ยังอยู่ในสถานะนี้) ; seconds ไม่นับช่วงที่ข้อมูลขาดหายเกิน MAX_GAP
+ActuatorEvent = namedtuple("ActuatorEvent", ["actuator", "state", "start", "end", "seconds"])
+# ข้อมูลที่ poller เผยแพร่ ; ทุกค่ายกเว้น time เป็น dict {อุปกรณ์: ...}
+# state: สถานะล่าสุด, last_on: เวลาที่เริ่มทำงานครั้งล่าสุด, runtime: {วันที่: วินาทีที่ทำงาน},
+# activations: {วันที่: จำนวนครั้งที่เริ่มทำงาน}, events: tuple ของ ActuatorEvent เรียงตามเวลา
+ActuatorReport = namedtuple("ActuatorReport", ["time", "state", "last_on", "runtime", "activations", "events"])
+
+
+def normalize_state(values):
+    return pd.Series(values, dtype="object").astype(str).str.strip().str.upper().to_numpy(dtype=object)
+
+
+# --- บันทึกการทำงานของอุปกรณ์ (Actuator Event Log) ---
+# เก็บเฉพาะจุดที่สถานะเปลี่ยน อัปเดตเฉพาะแถวใหม่แบบเดียวกับ TrialIndex
+# เวลาเปิดล่าสุด เวลาทำงานต่อวัน และจำนวนครั้งที่รดน้ำ จึงอ่านได้ทันทีโดยไม่ต้องสแกนข้อมูลย้อนหลัง
+class ActuatorLog:
+    def __init__(self, actuators=None, max_events=MAX_EVENTS):
+        self.actuators = dict(ACTUATORS if actuators is None else actuators)
+        self.max_events = max_events
+        self.reset()
+
+    def reset(self):
+        self.events = {a: deque(maxlen=self.max_events) for a in self.actuators}    # ช่วงที่จบแล้ว
+        self.current = {}       # อุปกรณ์ -> ช่วงที่กำลังดำเนินอยู่ [สถานะ, เวลาเริ่ม, วินาที]
+        self.last_on = {}
+        self.runtime = {a: defaultdict(float) for a in self.actuators}
+        self.activations = {a: defaultdict(int) for a in self.actuators}
+        self.last_time = None   # (เวลา, วินาที epoch) ของแถวล่าสุดที่ประมวลผลแล้ว
+
+    def update(self, chunk):
+        chunk = chunk[chunk.index.notna()]
+        cols = [a for a in self.actuators if a in chunk.columns]
+        if chunk.empty or not cols:
+            return
+        stamps = chunk.index
+        seconds = stamps.as_unit('ns').asi8 / 1e9
+        dates = stamps.tz_localize(None).normalize()
+
+        # ช่วงเวลาระหว่างแถว i-1 ถึง i นับเป็นสถานะของแถว i-1 (ค่าที่อุปกรณ์รายงานล่าสุด)
+        prev_seconds = np.concatenate([[seconds[0] if self.last_time is None else self.last_time[1]], seconds[:-1]])
+        prev_dates = dates.insert(0, dates[0] if self.last_time is None else self.last_time[0].tz_localize(None).normalize())[:-1]
+        gaps = np.clip(seconds - prev_seconds, 0, MAX_GAP)
+
+        for actuator in cols:
+            states = normalize_state(chunk[actuator])
+            active = self.actuators[actuator]
+            current = self.current.get(actuator)
+            prev_states = np.concatenate([[states[0] if current is None else current[0]], states[:-1]])
+
+            # เวลาทำงานรายวัน: รวมช่วงเวลาที่สถานะก่อนหน้าคือ "ทำงาน" ตามวันที่ของแถวก่อนหน้า
+            on = prev_states == active
+            if on.any():
+                per_day = pd.Series(gaps[on], index=prev_dates[on]).groupby(level=0).sum()
+                runtime = self.runtime[actuator]
+                for day, total in per_day.items():
+                    runtime[day.date()] += float(total)
+
+            # แบ่งแถวเป็นช่วงตามจุดที่สถานะเปลี่ยน แล้วปิดช่วงเดิม/เปิดช่วงใหม่ทีละช่วง (ปกติมีไม่กี่ช่วงต่อ chunk)
+            changes = np.flatnonzero(states != prev_states)
+            if current is None:
+                changes = np.concatenate([[0], changes[changes > 0]])
+            bounds = np.concatenate([changes, [len(states)]])
+            if current is not None:
+                current[2] += float(gaps[:bounds[0]].sum())
+            for k, lo in enumerate(changes):
+                if current is not None:
+                    current[2] += float(gaps[lo])
+                    self.events[actuator].append(ActuatorEvent(actuator, current[0], current[1], stamps[lo], current[2]))
+                state = states[lo]
+                current = [state, stamps[lo], float(gaps[lo + 1:bounds[k + 1]].sum())]
+                if state == active:
+                    self.last_on[actuator] = stamps[lo]
+                    self.activations[actuator][dates[lo].date()] += 1
+            self.current[actuator] = current
+
+        self.last_time = (stamps[-1], seconds[-1])
+
+    def report(self):
+        if self.last_time is None:
+            return None
+        events = {}
+        for actuator, closed in self.events.items():
+            current = self.current.get(actuator)
+            events[actuator] = tuple(closed) + (() if current is None else (ActuatorEvent(actuator, current[0], current[1], None, current[2]),))
+        return ActuatorReport(
+            self.last_time[0], {a: c[0] for a, c in self.current.items()}, dict(self.last_on),
+            {a: dict(r) for a, r in self.runtime.items()}, {a: dict(c) for a, c in self.activations.items()}, events
+        )
@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import smtplib
+import time
+import tomllib
+import urllib.request
+from collections import deque, namedtuple
+from email.message import EmailMessage
+
+import pandas as pd
+
+from cleaning import normalize_frame
+from devices import DEFAULT_ID, device_db_path, device_sync, load_devices
+from health import RULE_MESSAGES, RULE_NAMES, WINDOWS, HealthEngine
+from resilience import CircuitBreaker, CircuitOpenError
+from store import TIMEZONE, SensorStore
+from sync import SECRETS_PATH
+
+# ช่วงค่าที่เหมาะสม (เกณฑ์เดียวกับกราฟใน Dashboard): คอลัมน์ -> (ต่ำสุด, สูงสุด, ชื่อ, หน่วย)
+LIMITS = {
+    'AirTemp': (24, 31, 'อุณหภูมิ', '°C'),
+    'AirHumid': (50, 80, 'ความชื้นอากาศ', '%'),
+    'SoilHumid': (40, 85, 'ความชื้นดิน', '%'),
+}
+ALERT_RULES = ('mold', 'stress', 'soil')   # กฎจาก health.HealthEngine ที่แจ้งเตือนเมื่อไม่ใช่ระดับปกติ
+
+HOLD = 2 * 60               # วินาที (เวลาของข้อมูล) ที่เงื่อนไขต้องคงอยู่ก่อนแจ้งเตือน/ยกเลิก กันค่ากระพริบ
+COOLDOWN = 30 * 60          # วินาที ; ไม่แจ้งเตือนหัวข้อเดิมซ้ำภายในช่วงนี้
+MAX_PER_HOUR = 20           # จำนวนการแจ้งเตือนสูงสุดต่อชั่วโมงรวมทุกหัวข้อ
+
+# การแจ้งเตือน 1 ครั้งของแปลง device ; level คือ error / warning / resolved
+Alert = namedtuple("Alert", ["time", "device", "key", "level", "message"])
+
+
+# --- ช่องทางส่งการแจ้งเตือน (Sink) ---
+# sink คือ object ใดก็ได้ที่มีเมธอด send(alert) ; เพิ่มช่องทางใหม่ได้โดยไม่ต้องแก้ AlertMonitor
+class ConsoleSink:
+    def send(self, alert):
+        print(f"[{alert.time:%H:%M:%S}] {alert.device} {alert.level.upper()} {alert.key}: {alert.message}")
+
+
+class FileSink:
+    # เขียนต่อท้ายไฟล์ทีละบรรทัดแบบ JSON Lines
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, alert):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(alert_payload(alert), ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    # POST JSON ไปยัง URL (เช่น LINE Notify proxy, Discord, Slack หรือเซิร์ฟเวอร์ของเราเอง)
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert):
+        body = json.dumps(alert_payload(alert), ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SmtpSink:
+    # ค่าเริ่มต้นชี้ไปที่ SMTP ในเครื่อง (เช่น python -m aiosmtpd -n -l localhost:1025 สำหรับทดสอบ)
+    def __init__(self, recipients, host="localhost", port=1025, sender="morning-glory@localhost"):
+        self.recipients = list(recipients)
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    def send(self, alert):
+        message = EmailMessage()
+        message["Subject"] = f"[Morning Glory/{alert.device}] {alert.level.upper()}: {alert.message}"
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content(json.dumps(alert_payload(alert), ensure_ascii=False, indent=2))
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(message)
+
+
+def alert_payload(alert):
+    return {
+        "time": alert.time.isoformat(), "device": alert.device, "key": alert.key,
+        "level": alert.level, "message": alert.message
+    }
+
+
+def conditions(current, levels):
+    # คืน dict {หัวข้อ: (ระดับ, ข้อความ)} ; ระดับ None แปลว่าปกติ
+    result = {}
+    for col, (lo, hi, name, unit) in LIMITS.items():
+        value = current.get(col)
+        if value is None or lo <= value <= hi:
+            result[col] = (None, None)
+        else:
+            result[col] = ('warning', f"{name} {value:.1f} {unit} อยู่นอกช่วง {lo}–{hi} {unit}")
+    for rule in ALERT_RULES:
+        level = levels.get(rule, 'success')
+        if level == 'success':
+            result[rule] = (None, None)
+        else:
+            stat, desc = RULE_MESSAGES[rule][level]
+            result[rule] = (level, f"{stat}: {desc}")
+    return result
+
+
+# --- ตัวประเมินการแจ้งเตือน ---
+# ประเมินทุกแถวใหม่ด้วย HealthEngine เดียวกับ Dashboard
+# debounce: เงื่อนไขต้องคงอยู่อย่างน้อย HOLD วินาทีตามเวลาของข้อมูลจึงเปลี่ยนสถานะ
+# rate limit: หัวข้อเดิมห่างกันอย่างน้อย COOLDOWN และรวมไม่เกิน MAX_PER_HOUR ต่อชั่วโมง (ตามเวลาจริง)
+class AlertMonitor:
+    def __init__(self, sinks, device=DEFAULT_ID, hold=HOLD, cooldown=COOLDOWN, max_per_hour=MAX_PER_HOUR, clock=time.time):
+        self.sinks = list(sinks)
+        self.device = device
+        self.hold = hold
+        self.cooldown = cooldown
+        self.max_per_hour = max_per_hour
+        self.clock = clock
+        self.health = HealthEngine()
+        self.active = {}        # หัวข้อ -> ระดับที่ยืนยันแล้ว (None = ปกติ)
+        self.pending = {}       # หัวข้อ -> (ระดับใหม่, เวลาที่เริ่มเห็น)
+        self.notified = set()   # หัวข้อที่ส่งแจ้งเตือนไปแล้ว (ใช้ตัดสินว่าต้องแจ้งยกเลิกหรือไม่)
+        self.last_sent = {}
+        self.sent = deque()
+        self.suppressed = 0
+
+    def update(self, chunk, notify=True):
+        # notify=False ใช้ตอนอุ่นเครื่องด้วยข้อมูลย้อนหลัง (ปรับสถานะโดยไม่ส่งแจ้งเตือน)
+        alerts = []
+        for t, current, levels in self.health.iter_update(chunk):
+            for key, (level, message) in conditions(current, levels).items():
+                alert = self._observe(key, level, message, t)
+                if alert is not None and notify:
+                    alerts.append(alert)
+        return [alert for alert in alerts if self._dispatch(alert)]
+
+    def _observe(self, key, level, message, t):
+        if level == self.active.get(key):
+            self.pending.pop(key, None)
+            return None
+        pending_level, since = self.pending.get(key, (level, t))
+        if pending_level != level:
+            since = t
+        self.pending[key] = (level, since)
+        if t - since < self.hold:
+            return None
+
+        del self.pending[key]
+        self.active[key] = level
+        stamp = pd.Timestamp(t, unit='s', tz='UTC').tz_convert(TIMEZONE)
+        if level is None:
+            name = LIMITS[key][2] if key in LIMITS else RULE_NAMES[key]
+            return Alert(stamp, self.device, key, 'resolved', f"{name} กลับสู่ระดับปกติ")
+        return Alert(stamp, self.device, key, level, message)
+
+    def _dispatch(self, alert):
+        now = self.clock()
+        while self.sent and now - self.sent[0] > 3600:
+            self.sent.popleft()
+
+        if alert.level == 'resolved':
+            if alert.key not in self.notified:
+                return False
+        elif self._recently_sent(alert, now) or len(self.sent) >= self.max_per_hour:
+            self.suppressed += 1
+            return False
+
+        for sink in self.sinks:
+            try:
+                sink.send(alert)
+            except Exception as e:
+                print(f"[{time.strftime('%H:%M:%S')}] {type(sink).__name__} failed: {e}")
+        self.sent.append(now)
+        if alert.level == 'resolved':
+            self.notified.discard(alert.key)
+        else:
+            self.notified.add(alert.key)
+            self.last_sent[alert.key] = (now, alert.level)
+        return True
+
+    def _recently_sent(self, alert, now):
+        # ระดับเดิมของหัวข้อเดิมภายใน COOLDOWN ไม่ส่งซ้ำ (แต่ warning -> error ส่งได้ทันที)
+        sent_at, level = self.last_sent.get(alert.key, (float('-inf'), None))
+        return level == alert.level and now - sent_at < self.cooldown
+
+
+# --- worker สำหรับรันแยกจาก Streamlit (python alerts.py) ---
+# อ่านแถวใหม่จากฐานข้อมูลในเครื่องทุก interval วินาที (sync.py หรือ Dashboard เป็นผู้เขียน)
+# ตำแหน่งล่าสุดที่ประเมินแล้วเก็บใน meta "alerts_last_id" รีสตาร์ตแล้วไม่แจ้งเตือนซ้ำ
+class AlertWorker:
+    def __init__(self, store, monitor):
+        self.store = store
+        self.monitor = monitor
+        self.carry = {}
+        self.last_id = None
+
+    def _feed(self, raw, notify):
+        if raw.empty:
+            return []
+        chunk, self.carry = normalize_frame(raw, self.carry)
+        self.last_id = int(raw['_id'].iloc[-1])
+        return self.monitor.update(chunk, notify=notify)
+
+    def prime(self):
+        # อุ่นสถิติแบบหน้าต่างเวลาด้วยข้อมูลย้อนหลังก่อน แล้วแจ้งเตือนเฉพาะแถวที่ยังไม่เคยประเมิน
+        self.last_id = self.store.get_meta("alerts_last_id", self.store.version())
+        start = time.time() - max(WINDOWS.values()).total_seconds()
+        raw = self.store.load(start_ts=start, with_internal=True)
+        if not raw.empty:
+            last_id = self.last_id
+            self._feed(raw[raw['_id'] <= last_id], notify=False)
+            self.last_id = last_id
+        return self.poll()
+
+    def poll(self):
+        if self.store.version() == self.last_id:
+            return []
+        alerts = self._feed(self.store.load(after_id=self.last_id, with_internal=True), notify=True)
+        self.store.set_meta("alerts_last_id", self.last_id)
+        return alerts
+
+
+def build_sinks(config):
+    sinks = [ConsoleSink()]
+    if config.get("file"):
+        sinks.append(FileSink(config["file"]))
+    if config.get("webhook_url"):
+        sinks.append(WebhookSink(config["webhook_url"]))
+    if config.get("smtp_to"):
+        recipients = config["smtp_to"]
+        sinks.append(SmtpSink(
+            [recipients] if isinstance(recipients, str) else recipients, host=config.get("smtp_host", "localhost"),
+            port=int(config.get("smtp_port", 1025)), sender=config.get("smtp_from", "morning-glory@localhost")
+        ))
+    return sinks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate alert thresholds on newly ingested sensor rows")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between store polls")
+    parser.add_argument("--file", help="append alerts to this JSON Lines file")
+    parser.add_argument("--webhook-url", help="POST alerts as JSON to this URL")
+    parser.add_argument("--smtp-to", action="append", help="e-mail recipient (repeatable)")
+    parser.add_argument("--smtp-host")
+    parser.add_argument("--smtp-port", type=int)
+    parser.add_argument("--sync", action="store_true", help="also sync the sheet (when sync.py is not running)")
+    parser.add_argument("--secrets", default=SECRETS_PATH)
+    args = parser.parse_args()
+
+    # ค่าจาก [alerts] ใน secrets.toml ใช้เป็นค่าเริ่มต้น ค่าจาก command line มีผลก่อน
+    secrets = {}
+    if os.path.exists(args.secrets):
+        with open(args.secrets, "rb") as f:
+            secrets = tomllib.load(f)
+    config = dict(secrets.get("alerts", {}))
+    config.update({k: v for k, v in vars(args).items() if v is not None})
+
+    # 1 worker ต่อแปลง (อัตราการแจ้งเตือนนับแยกแปลง) ใช้ sink ชุดเดียวกัน
+    sinks = build_sinks(config)
+    devices = load_devices(secrets)
+    stores = {d.id: SensorStore(device_db_path(d.id)) for d in devices}
+    workers = {d.id: AlertWorker(stores[d.id], AlertMonitor(sinks, device=d.id)) for d in devices}
+    syncs = {}
+    if args.sync:
+        from sheets import SheetsConnection
+        sheets = SheetsConnection(secrets["gcp_service_account"])
+        syncs = {d.id: device_sync(sheets, d, stores[d.id]) for d in devices}
+    breakers = {device_id: CircuitBreaker(f"sync:{device_id}") for device_id in syncs}
+
+    for worker in workers.values():
+        worker.prime()
+    while True:
+        for device_id, worker in workers.items():
+            # ชีตล่มไม่ทำให้หยุดแจ้งเตือน ตรวจจากข้อมูลที่มีในฐานข้อมูลต่อไป
+            if device_id in syncs:
+                try:
+                    breakers[device_id].call(syncs[device_id])
+                except CircuitOpenError:
+                    pass
+                except Exception as e:
+                    print(f"[{time.strftime('%H:%M:%S')}] {device_id}: sync failed: {e}")
+            try:
+                worker.poll()
+            except Exception as e:
+                print(f"[{time.strftime('%H:%M:%S')}] {device_id}: alert check failed: {e}")
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,155 @@
 import streamlit as st
 import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots 
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import partial
 import re 
-from streamlit_autorefresh import st_autorefresh
+import time
 import pytz
-import numpy as np 
 
-# 60,000 มิลลิวินาที = 1 นาที
-st_autorefresh(interval=30000, key="datarefresh")
+from sheets import SheetsConnection
+from actuators import ACTUATORS
+from cleaning import chart_times
+from devices import build_fleet, load_devices
+from downsample import downsample_series
+from export import EXPORT_FORMATS, export_file
+from growth import GrowthCache, GrowthConflictError
+from health import RULE_MESSAGES, RULE_NAMES, WINDOWS, format_duration
+from metrics import METRICS, MetricsWriter
+from rollups import range_series
+from trials import trial_mean
+
+# โหมดรับข้อมูลตรงจากอุปกรณ์ (python ingest.py เขียนลงฐานข้อมูลในเครื่อง): ไม่ดึงข้อมูลจากชีต
+INGEST_MODE = bool(st.secrets.get("ingest", {}).get("enabled", False))
+# ส่วนข้อมูลสด (fragment) ตรวจ snapshot ในหน่วยความจำทุกกี่วินาที (ไม่เรียก API จึงตรวจถี่ได้)
+# แต่ละส่วน rerun เฉพาะตัวเอง กราฟ/ตารางสร้างใหม่เฉพาะเมื่อมีข้อมูลชุดใหม่ (version เปลี่ยน)
+LIVE_SECONDS = 1 if INGEST_MODE else 3
+FLEET_SECONDS = 30  # ตารางภาพรวมทุกแปลง (ตารางเล็ก) อัปเดตตามรอบเวลา
+# แผงวิเคราะห์ประสิทธิภาพ (ซ่อนไว้) เปิดด้วยการเติม ?diag=1 ท้าย URL
+DIAGNOSTICS = st.query_params.get("diag") == "1"
+page_started = time.perf_counter()
 
 # กำหนดเขตเวลาประเทศไทย
 tz_th = pytz.timezone('Asia/Bangkok')
 now_th = datetime.now(tz_th)
 
 # --- 1. การเชื่อมต่อและระบบ Cache ---
-@st.cache_data(ttl=30)
-def fetch_data_from_sheets():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    try:
-        creds_info = dict(st.secrets["gcp_service_account"])
-        if "private_key" in creds_info:
-            creds_info["private_key"] = creds_info["private_key"].replace("\\n", "\n")
-            
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_info, scope)
-        client = gspread.authorize(creds)
-        
-        spreadsheet = client.open("Project IOT")
-        sheet = spreadsheet.get_worksheet(0)
-        
-        data = sheet.get_all_records()
-        return pd.DataFrame(data)
-    except Exception as e:
-        st.error(f"❌ ระบบเชื่อมต่อมีปัญหา: {str(e)}")
-        return pd.DataFrame()
+@st.cache_resource
+def get_devices():
+    # รายการแปลงปลูกจาก [[devices]] ใน secrets.toml (ไม่กำหนด = แปลงเดียวแบบเดิม)
+    return load_devices(st.secrets)
+
+@st.cache_resource
+def get_sheets():
+    # client + worksheet ที่ authorize แล้ว ใช้ร่วมกันทุก session และทุก rerun
+    return SheetsConnection(st.secrets["gcp_service_account"])
+
+@st.cache_resource
+def get_growth_cache():
+    # ข้อมูลการเติบโต (Growth_Data) ที่ทุก session ใช้ร่วมกัน
+    return GrowthCache(lambda: get_sheets().worksheet("Growth_Data", create=True))
+
+@st.cache_resource
+def get_fleet():
+    # ตัวดึงข้อมูลเบื้องหลังชุดเดียวของทั้ง server (ทุกแปลง) ทุก session อ่าน snapshot จากตัวนี้
+    if INGEST_MODE:
+        # ingest.py เขียนลงฐานข้อมูลโดยตรง poller แค่ตรวจแถวใหม่ (SELECT MAX(_id)) ทุกครึ่งวินาที
+        fleet = build_fleet(get_devices(), sheets=None, interval=0.5)
+    else:
+        fleet = build_fleet(get_devices(), sheets=get_sheets(), interval=30)
+    fleet.start()
+    fleet.ready.wait(timeout=20)
+    return fleet
+
+@st.cache_resource
+def get_metrics_writer():
+    # เขียนค่าวัดของ process นี้ลงไฟล์ Prometheus text เป็นระยะ เมื่อกำหนด [metrics] path ใน secrets.toml
+    path = st.secrets.get("metrics", {}).get("path")
+    if not path:
+        return None
+    writer = MetricsWriter(path)
+    writer.start()
+    return writer
+
+def read_snapshot(device_id):
+    # ไม่เรียก Sheets API จาก session โดยตรง อ่านเฉพาะ snapshot ล่าสุดของ poller
+    snapshot = get_fleet().snapshot(device_id)
+    # hit = ข้อมูลชุดเดิมกับที่ session นี้เห็นครั้งก่อน (ส่วนที่คำนวณไว้แล้วใช้ต่อได้ทั้งหมด)
+    seen = st.session_state.setdefault('seen_versions', {})
+    METRICS.inc('mg_cache_total', cache='snapshot', result='hit' if seen.get(device_id) == snapshot.version else 'miss')
+    seen[device_id] = snapshot.version
+    if snapshot.error:
+        show_offline_banner(snapshot)
+    return snapshot
+
+def time_ago(seconds):
+    return f"{int(seconds)} วินาที" if seconds < 60 else format_duration(pd.Timedelta(seconds=seconds))
+
+def show_offline_banner(snapshot):
+    # เชื่อมต่อไม่ได้: หน้าจอยังใช้ข้อมูลชุดล่าสุดในเครื่อง (ฐานข้อมูล/สถานะที่บันทึกไว้) บอกอายุข้อมูลและเวลาที่จะลองใหม่
+    notes = ["⚠️ ระบบเชื่อมต่อมีปัญหา กำลังแสดงข้อมูลล่าสุดที่บันทึกไว้ในเครื่อง"]
+    if snapshot.synced_at:
+        notes.append(f"ซิงก์สำเร็จครั้งล่าสุด {time_ago(time.time() - snapshot.synced_at)}ที่แล้ว")
+    if snapshot.retry_at:
+        notes.append(f"จะลองเชื่อมต่อใหม่ในอีก {time_ago(max(0, snapshot.retry_at - time.time()))}")
+    st.warning(" · ".join(notes) + f"\n\n`{snapshot.error}`")
+
+def session_cached(name, key, build):
+    # ของที่สร้างจาก snapshot (ตาราง/กราฟ) เก็บไว้ใน session สร้างใหม่เฉพาะเมื่อ key (แปลง + version ของข้อมูล) เปลี่ยน
+    cached = st.session_state.get(name)
+    if cached is None or cached[0] != key:
+        METRICS.inc('mg_cache_total', cache=name, result='miss')
+        cached = (key, build())
+        st.session_state[name] = cached
+    else:
+        METRICS.inc('mg_cache_total', cache=name, result='hit')
+    return cached[1]
+
+def timed_frame(frame):
+    # แถวที่มีเวลาถูกต้อง (index เป็น DatetimeIndex เวลาไทยจากขั้นตอน ingest) ใช้กับกราฟและการคำนวณเวลา
+    return frame[frame.index.notna()] if frame.index.hasnans else frame
+
+def export_range_start(snapshot, export_range):
+    # epoch วินาทีของจุดเริ่มช่วงข้อมูลที่เลือก (None = ทั้งหมด)
+    df_graph = timed_frame(snapshot.frame)
+    trials = snapshot.trials
+    if export_range == 'รอบการทดลองปัจจุบัน':
+        return trials[-1].start_time.timestamp() if trials and pd.notna(trials[-1].start_time) else None
+    if df_graph.empty:
+        return None
+    if export_range == '7 วันล่าสุด':
+        return (df_graph.index[-1] - pd.Timedelta(days=7)).timestamp()
+    if export_range == '24 ชั่วโมงล่าสุด':
+        return (df_graph.index[-1] - pd.Timedelta(hours=24)).timestamp()
+    return None
+
+def export_latest(fleet, device_id, ext, export_range):
+    # เรียกตอนกดดาวน์โหลด: ช่วงเวลาคำนวณจาก snapshot ล่าสุด (ส่วน export ไม่ rerun ตามข้อมูลใหม่)
+    return export_file(fleet.pollers[device_id].store, ext, export_range_start(fleet.snapshot(device_id), export_range))
 
 # --- 2. จัดการข้อมูล ---
-try:
-    df_raw = fetch_data_from_sheets()
-    df = df_raw.copy()
-
-    # Clean ชื่อคอลัมน์
-    df.columns = df.columns.str.strip()
-    df.rename(columns={
-        'Air Humid': 'AirHumid', 'Air Humidity': 'AirHumid', 
-        'Soil Humid': 'SoilHumid', 'Soil Humidity': 'SoilHumid',
-        'Light Lux': 'LightLux', 'Lux': 'LightLux',
-        'Air Temp': 'AirTemp', 'Temp': 'AirTemp'
-    }, inplace=True)
+get_metrics_writer()
 
-    if not df.empty:
-        target_cols = ['AirTemp', 'AirHumid', 'LightLux', 'SoilHumid']
-        for col in target_cols:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace('%', '', regex=False)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                df[col] = df[col].ffill().fillna(0)
+# เลือกแปลงปลูก (แสดงตัวเลือกเมื่อมีมากกว่า 1 แปลง) ข้อมูลทุกส่วนด้านล่างเป็นของแปลงที่เลือก
+devices = get_devices()
+device_names = {d.id: d.name for d in devices}
+if len(devices) > 1:
+    device_id = st.sidebar.selectbox("🌱 แปลงปลูก", list(device_names), format_func=device_names.get, key="device_id")
+else:
+    device_id = devices[0].id
 
-    # แยกชุดข้อมูล 
-    df_graph = df.tail(2000) if len(df) > 2000 else df
-    df_predict = df.tail(300) if len(df) > 300 else df
+try:
+    # ข้อมูลจาก poller ผ่านการทำความสะอาดมาแล้ว (ทำครั้งเดียวต่อแถวใหม่ ไม่ทำซ้ำทุก rerun)
+    # ทุก session อ่านตารางชุดเดียวกันโดยตรง (ไม่ copy) หน้านี้จึงห้ามแก้ไข df
+    snapshot = get_fleet().snapshot(device_id)
+    df = snapshot.frame
+    trials = snapshot.trials
 
 except Exception as e:
     st.error(f"เกิดข้อผิดพลาดในการดึงข้อมูล: {e}")
     df = pd.DataFrame() 
+    trials = ()
 
 # --- 3. ตั้งค่าหน้าจอและ CSS ---
 st.set_page_config(page_title="Morning Glory Dashboard", layout="wide")
@@ -88,272 +171,404 @@ st.markdown("""
 # ==========================================
 # 🎯 สร้าง Tabs เพื่อแยก 2 หน้าต่างหลัก
 # ==========================================
-tab_main, tab_compare = st.tabs(["🌱 สถานะเรียลไทม์ (Real-time)", "📊 เปรียบเทียบผลการทดลอง "])
+tab_names = ["🌱 สถานะเรียลไทม์ (Real-time)", "📊 เปรียบเทียบผลการทดลอง "]
+if len(devices) > 1:
+    tab_names.append("🛰️ ภาพรวมทุกแปลง (Fleet)")
+tab_main, tab_compare, *tab_fleet = st.tabs(tab_names)
 
 # ------------------------------------------
 # ▶️ แท็บที่ 1: สถานะเรียลไทม์ (โค้ดเดิมของคุณทั้งหมด)
 # ------------------------------------------
 with tab_main:
     if not df.empty:
-        last_row = df.iloc[-1]
+        # ส่วนข้อมูลสดแต่ละส่วนเป็น fragment ที่ rerun ตามเวลาแยกกัน อ่าน snapshot ล่าสุดของ poller เอง
+        # ไม่มีการ rerun ทั้งหน้าเมื่อมีข้อมูลใหม่ (แท็บเปรียบเทียบ/ตัวเลือก export ไม่ถูกวาดใหม่)
+        # กราฟ/ตารางสร้างใหม่เฉพาะเมื่อ version เปลี่ยน รอบที่ไม่มีข้อมูลใหม่ส่งของเดิมที่ cache ไว้
+        # (Streamlit ส่งเพียง hash ของ element ขนาดใหญ่ที่เบราว์เซอร์มีอยู่แล้ว)
+        @st.fragment(run_every=LIVE_SECONDS)
+        @METRICS.timed('mg_section_seconds', section='status')
+        def live_status():
+            snapshot = read_snapshot(device_id)
+            df = snapshot.frame
+            if df.empty:
+                # ข้อมูลถูกโหลดใหม่ทั้งหมด (เช่นหัวตารางในชีตเปลี่ยน) รอข้อมูลชุดใหม่
+                st.info("⏳ กำลังโหลดข้อมูลใหม่...")
+                return
+            last_row = df.iloc[-1]
         
-        # ดึงค่าและคำนวณ PPFD ไว้ล่วงหน้า
-        cur_temp = last_row.get('AirTemp', 0)
-        cur_humid = last_row.get('AirHumid', 0)
-        cur_soil = last_row.get('SoilHumid', 0)
-        cur_light = last_row.get('LightLux', 0)
-        cur_ppfd = cur_light * 0.065 # ตัวคูณแปลง Lux ผนัง -> PPFD กลางแปลง
+            # ดึงค่าและคำนวณ PPFD ไว้ล่วงหน้า
+            cur_temp = last_row.get('AirTemp', 0)
+            cur_humid = last_row.get('AirHumid', 0)
+            cur_soil = last_row.get('SoilHumid', 0)
+            cur_light = last_row.get('LightLux', 0)
+            cur_ppfd = cur_light * 0.065 # ตัวคูณแปลง Lux ผนัง -> PPFD กลางแปลง
         
-        current_fan = str(last_row.get('Fan', 'N/A')).strip().upper()
-        current_pump = str(last_row.get('Pump', 'N/A')).strip().upper()
+            current_fan = str(last_row.get('Fan', 'N/A')).strip().upper()
+            current_pump = str(last_row.get('Pump', 'N/A')).strip().upper()
         
-        last_pump_time = "ยังไม่พบข้อมูล"
-        if 'Pump' in df.columns and 'Timestamp' in df.columns:
-            df_pump_on = df[df['Pump'].astype(str).str.strip().str.upper() == 'ON']
-            if not df_pump_on.empty:
-                last_pump_time = str(df_pump_on.iloc[-1]['Timestamp'])
-                last_pump_time = last_pump_time.replace("/2026", "").replace("/2025", "").replace("/2024", "")
-
-        header_col1, header_col2 = st.columns([2.5, 2])
+            # เวลาที่ปั๊มเริ่มทำงานครั้งล่าสุดจากบันทึกการทำงานของอุปกรณ์ใน poller (ไม่ต้องสแกนข้อมูลย้อนหลัง)
+            last_pump_on = snapshot.actuators.last_on.get('Pump') if snapshot.actuators is not None else None
+            last_pump_time = last_pump_on.strftime('%d/%m, %H:%M:%S') if last_pump_on is not None else "ยังไม่พบข้อมูล"
+
+            header_col1, header_col2 = st.columns([2.5, 2])
         
-        with header_col1:
-            st.title("🌱 Morning Glory Smart Dashboard")
-            st.caption(f"🔄 อัปเดตข้อมูลล่าสุดเมื่อ: {now_th.strftime('%H:%M:%S')} น. (อัปเดตทุก 30 วินาที)")
+            with header_col1:
+                st.title("🌱 Morning Glory Smart Dashboard")
+                last_time = df.index[-1] if pd.notna(df.index[-1]) else now_th
+                st.caption(f"🔄 ข้อมูลล่าสุดเมื่อ: {last_time.strftime('%H:%M:%S')} น. (แสดงทันทีที่มีข้อมูลใหม่)")
             
-        with header_col2:
-            fan_color = "#00D4FF" if current_fan == "MAX" else "#FFD700" 
-            pump_color = "#00FF7F" if current_pump == "ON" else "#FF4B4B" 
-            st.markdown(f"""
-                <div class="status-container">
-                    <div class="status-box">
-                        <span class="status-label">พัดลม (Fan)</span>
-                        <span class="status-value" style="color: {fan_color};">{current_fan}</span>
-                        <span class="status-time"></span> 
-                    </div>
-                    <div class="status-box">
-                        <span class="status-label">ปั๊มน้ำ (Pump)</span>
-                        <span class="status-value" style="color: {pump_color};">{current_pump}</span>
-                        <span class="status-time">ทำงานล่าสุด: {last_pump_time}</span>
+            with header_col2:
+                fan_color = "#00D4FF" if current_fan == "MAX" else "#FFD700" 
+                pump_color = "#00FF7F" if current_pump == "ON" else "#FF4B4B" 
+                st.markdown(f"""
+                    <div class="status-container">
+                        <div class="status-box">
+                            <span class="status-label">พัดลม (Fan)</span>
+                            <span class="status-value" style="color: {fan_color};">{current_fan}</span>
+                            <span class="status-time"></span> 
+                        </div>
+                        <div class="status-box">
+                            <span class="status-label">ปั๊มน้ำ (Pump)</span>
+                            <span class="status-value" style="color: {pump_color};">{current_pump}</span>
+                            <span class="status-time">ทำงานล่าสุด: {last_pump_time}</span>
+                        </div>
                     </div>
-                </div>
-            """, unsafe_allow_html=True)
+                """, unsafe_allow_html=True)
 
-        st.subheader(f"📅 วันที่ปลูก: วันที่ {last_row.get('Day', '?')}")
+            st.subheader(f"📅 วันที่ปลูก: วันที่ {last_row.get('Day', '?')}")
         
-        col1, col2, col3, col4 = st.columns(4)
-        col1.metric("🌡️ อุณหภูมิ", f"{cur_temp:.2f} °C")
-        col2.metric("💧 ความชื้นอากาศ", f"{cur_humid:.2f}%")
-        col3.metric("☀️ แสง (PPFD)", f"{cur_ppfd:.2f} µmol/m²/s", help=f"เซนเซอร์จับได้: {cur_light:.0f} lx")
-        col4.metric("🪴 ความชื้นดิน", f"{cur_soil:.2f}%")
-
-        st.divider()
-
-        # กราฟ Interactive
-        st.subheader("📊 กราฟวิเคราะห์แนวโน้ม")
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("🌡️ อุณหภูมิ", f"{cur_temp:.2f} °C")
+            col2.metric("💧 ความชื้นอากาศ", f"{cur_humid:.2f}%")
+            col3.metric("☀️ แสง (PPFD)", f"{cur_ppfd:.2f} µmol/m²/s", help=f"เซนเซอร์จับได้: {cur_light:.0f} lx")
+            col4.metric("🪴 ความชื้นดิน", f"{cur_soil:.2f}%")
+
+        @st.fragment(run_every=LIVE_SECONDS)
+        @METRICS.timed('mg_section_seconds', section='trends')
+        def live_trends():
+            snapshot = get_fleet().snapshot(device_id)
+            df_graph = timed_frame(snapshot.frame)
+            rollup_tables = snapshot.rollups
+            hot_start = snapshot.hot_start
+            trials = snapshot.trials
+            forecasts = snapshot.forecasts
+
+            # กราฟ Interactive
+            st.subheader("📊 กราฟวิเคราะห์แนวโน้ม")
+            if df_graph.empty:
+                # มีข้อมูลแต่ไม่มีแถวที่อ่านเวลาได้เลย (เช่น Timestamp ผิดรูปแบบทั้งหมด)
+                st.info("ยังไม่มีข้อมูลที่มีเวลาถูกต้องสำหรับแสดงกราฟ")
+                return
         
-        option = st.radio(
-            "เลือกดูข้อมูลที่ต้องการ:",
-            ('ทั้งหมด', 'อุณหภูมิ', 'ความชื้นอากาศ', 'แสงสว่าง', 'ความชื้นดิน'),
-            horizontal=True
-        )
+            option = st.radio(
+                "เลือกดูข้อมูลที่ต้องการ:",
+                ('ทั้งหมด', 'อุณหภูมิ', 'ความชื้นอากาศ', 'แสงสว่าง', 'ความชื้นดิน'),
+                horizontal=True
+            )
+            range_option = st.radio(
+                "ช่วงเวลา:",
+                ('6 ชั่วโมง', '24 ชั่วโมง', '7 วัน', 'ทั้งรอบการทดลอง', 'ทั้งหมด'),
+                index=1, horizontal=True
+            )
 
-        def create_plot(selected_option):
-            fig = go.Figure()
+            # จุดเริ่มของช่วงเวลาที่เลือก (ตัดข้อมูลด้วย binary search บน index เวลา)
+            time_ranges = {'6 ชั่วโมง': pd.Timedelta(hours=6), '24 ชั่วโมง': pd.Timedelta(hours=24), '7 วัน': pd.Timedelta(days=7)}
+            range_start = None
+            if range_option in time_ranges:
+                range_start = df_graph.index[-1] - time_ranges[range_option]
+            elif range_option == 'ทั้งรอบการทดลอง' and trials and pd.notna(trials[-1].start_time):
+                # รอบการทดลองปัจจุบัน (จากดัชนีรอบการทดลองของ poller)
+                range_start = trials[-1].start_time
+            # 'ทั้งหมด' (range_start = None): ประวัติทั้งหมด ใช้ตารางสรุปรายวัน/รายชั่วโมงที่เก็บไว้ครบทุกช่วง
+
+            def create_plot(selected_option):
+                fig = go.Figure()
+                resolution = 'ข้อมูลดิบ'
             
-            metrics = {
-                'อุณหภูมิ': {'col': 'AirTemp', 'color': '#FF4B4B', 'label': 'ค่าอุณหภูมิในอากาศ (°C)', 'min_ok': 24, 'max_ok': 31},
-                'ความชื้นอากาศ': {'col': 'AirHumid', 'color': '#00D4FF', 'label': 'ค่าความชื้นในอากาศ (%)', 'min_ok': 50, 'max_ok': 80},
-                'แสงสว่าง': {'col': 'LightLux', 'color': '#FFD700', 'label': 'ค่าความเข้มแสงสว่าง (lx)', 'min_ok': 1000, 'max_ok': 3000},
-                'ความชื้นดิน': {'col': 'SoilHumid', 'color': '#00FF7F', 'label': 'ค่าความชื้นในดิน (%)', 'min_ok': 40, 'max_ok': 80}
-            }
-
-            if 'Timestamp' in df_graph.columns:
-                x_axis = df_graph['Timestamp']
-            else:
-                x_axis = df_graph.index 
-
-            if selected_option == 'ทั้งหมด':
-                for name, m in metrics.items():
+                metrics = {
+                    'อุณหภูมิ': {'col': 'AirTemp', 'color': '#FF4B4B', 'label': 'ค่าอุณหภูมิในอากาศ (°C)', 'min_ok': 24, 'max_ok': 31},
+                    'ความชื้นอากาศ': {'col': 'AirHumid', 'color': '#00D4FF', 'label': 'ค่าความชื้นในอากาศ (%)', 'min_ok': 50, 'max_ok': 80},
+                    'แสงสว่าง': {'col': 'LightLux', 'color': '#FFD700', 'label': 'ค่าความเข้มแสงสว่าง (lx)', 'min_ok': 1000, 'max_ok': 3000},
+                    'ความชื้นดิน': {'col': 'SoilHumid', 'color': '#00FF7F', 'label': 'ค่าความชื้นในดิน (%)', 'min_ok': 40, 'max_ok': 80}
+                }
+
+                if selected_option == 'ทั้งหมด':
+                    for name, m in metrics.items():
+                        if m['col'] in df_graph.columns:
+                            series, _, _, resolution = range_series(df_graph, rollup_tables, m['col'], range_start, hot_start=hot_start)
+                            series = downsample_series(series)
+                            fig.add_trace(go.Scatter(x=chart_times(series.index), y=series.values, mode='lines', name=name, line=dict(color=m['color'])))
+                    y_label = "สรุปเซนเซอร์ทั้งหมด"
+                else:
+                    m = metrics[selected_option]
                     if m['col'] in df_graph.columns:
-                        fig.add_trace(go.Scatter(x=x_axis, y=df_graph[m['col']], mode='lines', name=name, line=dict(color=m['color'])))
-                y_label = "สรุปเซนเซอร์ทั้งหมด"
-            else:
-                m = metrics[selected_option]
-                if m['col'] in df_graph.columns:
-                    actual_data = df_graph[m['col']].tolist()
-                    y_label = m['label']
+                        series, lows, highs, resolution = range_series(df_graph, rollup_tables, m['col'], range_start, hot_start=hot_start)
+                        series = downsample_series(series)
+                        actual_data = series.values
+                        x_axis = chart_times(series.index)
+                        y_label = m['label']
                     
-                    fig.add_hrect(
-                        y0=m['min_ok'], y1=m['max_ok'], 
-                        fillcolor="#00FF7F", opacity=0.1,
-                        line_width=1.5, line_dash="dash", line_color="#00FF7F",
-                        annotation_text="ช่วงที่เหมาะสม", annotation_position="top left",
-                        annotation_font_color="#00FF7F", annotation_font_size=12
-                    )
+                        fig.add_hrect(
+                            y0=m['min_ok'], y1=m['max_ok'], 
+                            fillcolor="#00FF7F", opacity=0.1,
+                            line_width=1.5, line_dash="dash", line_color="#00FF7F",
+                            annotation_text="ช่วงที่เหมาะสม", annotation_position="top left",
+                            annotation_font_color="#00FF7F", annotation_font_size=12
+                        )
                     
-                    fig.add_trace(go.Scatter(
-                        x=x_axis, y=actual_data, mode='lines', 
-                        name=f'ข้อมูล {selected_option}', line=dict(color=m['color'], width=2)
-                    ))
+                        if lows is not None:
+                            # แถบค่าต่ำสุด-สูงสุดของแต่ละช่วง เพื่อไม่ให้ยอดแหลมหายไปกับค่าเฉลี่ย
+                            fig.add_trace(go.Scatter(
+                                x=chart_times(highs.index), y=highs.values, mode='lines',
+                                line=dict(width=0), showlegend=False, hoverinfo='skip'
+                            ))
+                            fig.add_trace(go.Scatter(
+                                x=chart_times(lows.index), y=lows.values, mode='lines', fill='tonexty',
+                                fillcolor='rgba(255,255,255,0.12)', line=dict(width=0),
+                                name='ช่วงต่ำสุด-สูงสุด', hoverinfo='skip'
+                            ))
                     
-                    if m['col'] in df_predict.columns:
-                        try:
-                            series_predict = df_predict[m['col']].dropna()
-                            if len(series_predict) > 10:
-                                x_idx = np.arange(len(series_predict))
-                                fit = np.polyfit(x_idx, series_predict.values, 1) 
-                                trend_line = np.poly1d(fit)
-                                
-                                last_idx = x_idx[-1]
-                                predict_values = [actual_data[-1]]
-                                
-                                last_time_str = str(x_axis.iloc[-1])
-                                try:
-                                    last_time = datetime.strptime(last_time_str, "%d/%m/%Y, %H:%M:%S")
-                                except ValueError:
-                                    last_time = datetime.strptime(last_time_str, "%d/%m/%Y, %H:%M")
-
-                                predict_times = [x_axis.iloc[-1]]
-                                
-                                for i in range(1, 37):
-                                    next_time = last_time + timedelta(minutes=10 * i)
-                                    next_val = trend_line(last_idx + i)
-                                    
-                                    if 'Humid' in m['col']: 
-                                        next_val = max(0, min(100, next_val))
-                                    if 'Lux' in m['col']: 
-                                        if next_time.hour >= 20 or next_time.hour < 6:
-                                            next_val = 0
-                                        else:
-                                            next_val = max(0, next_val)
-                                            
-                                    predict_values.append(next_val)
-                                    predict_times.append(next_time.strftime("%d/%m/%Y, %H:%M:%S"))
-
-                                fig.add_trace(go.Scatter(
-                                    x=predict_times, y=predict_values, mode='lines', 
-                                    name='แนวโน้ม (Trend 6 ชม.)',
-                                    line=dict(color='white', width=2, dash='dot')
-                                ))
-                        except:
-                            pass
-
-            fig.update_layout(
-                paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color="white"),
-                xaxis=dict(title="เวลา (Timestamp)", gridcolor='#31333F', showgrid=True, nticks=10),
-                yaxis=dict(title=y_label, gridcolor='#31333F', showgrid=True),
-                hovermode="x unified", template="plotly_dark",
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-            )
-            return fig
+                        fig.add_trace(go.Scatter(
+                            x=x_axis, y=actual_data, mode='lines', 
+                            name=f'ข้อมูล {selected_option}', line=dict(color=m['color'], width=2)
+                        ))
+                    
+                        if m['col'] in forecasts:
+                            # ค่าพยากรณ์คำนวณไว้แล้วใน poller (ค่าฐานตามเวลาของวัน + exponential smoothing)
+                            predict = forecasts[m['col']]
+                            fig.add_trace(go.Scatter(
+                                x=chart_times(predict.index), y=predict.values, mode='lines', 
+                                name='แนวโน้ม (Trend 6 ชม.)',
+                                line=dict(color='white', width=2, dash='dot')
+                            ))
+
+                fig.update_layout(
+                    paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color="white"),
+                    xaxis=dict(title="เวลา (Timestamp)", gridcolor='#31333F', showgrid=True, nticks=10),
+                    yaxis=dict(title=y_label, gridcolor='#31333F', showgrid=True),
+                    hovermode="x unified", template="plotly_dark",
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+                )
+                return fig, resolution
+
+            def create_dual_plot():
+                if 'AirTemp' not in df_graph.columns or 'AirHumid' not in df_graph.columns:
+                    return None
+                fig_dual = make_subplots(specs=[[{"secondary_y": True}]])
+                dual_temp = downsample_series(range_series(df_graph, rollup_tables, 'AirTemp', range_start, hot_start=hot_start)[0])
+                dual_humid = downsample_series(range_series(df_graph, rollup_tables, 'AirHumid', range_start, hot_start=hot_start)[0])
+            
+                fig_dual.add_trace(go.Scatter(x=chart_times(dual_temp.index), y=dual_temp.values, name="อุณหภูมิ (°C)", line=dict(color='#FF4B4B', width=2)), secondary_y=False)
+                fig_dual.add_trace(go.Scatter(x=chart_times(dual_humid.index), y=dual_humid.values, name="ความชื้นอากาศ (%)", line=dict(color='#00D4FF', width=2, dash='dot')), secondary_y=True)
+
+                fig_dual.update_layout(
+                    template="plotly_dark", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+                    hovermode="x unified", height=400,
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+                    margin=dict(l=20, r=20, t=30, b=20)
+                )
+                fig_dual.update_yaxes(title_text="<b>อุณหภูมิ (°C)</b>", secondary_y=False, color='#FF4B4B', showgrid=False)
+                fig_dual.update_yaxes(title_text="<b>ความชื้นอากาศ (%)</b>", secondary_y=True, color='#00D4FF', showgrid=True, gridcolor='#31333F')
+                return fig_dual
+
+            # สร้างกราฟใหม่เฉพาะเมื่อมีข้อมูลใหม่หรือผู้ใช้เปลี่ยนตัวเลือก รอบที่ไม่มีอะไรเปลี่ยนใช้กราฟเดิม
+            figures_key = (device_id, snapshot.version, option, range_option)
+            cached = st.session_state.get('trend_figures')
+            if cached is None or cached[0] != figures_key:
+                METRICS.inc('mg_cache_total', cache='trend_figures', result='miss')
+                with METRICS.timer('mg_section_seconds', section='trends_build'):
+                    cached = (figures_key, *create_plot(option), create_dual_plot())
+                st.session_state.trend_figures = cached
+            else:
+                METRICS.inc('mg_cache_total', cache='trend_figures', result='hit')
+            _, fig_trend, trend_resolution, fig_dual = cached
 
-        st.plotly_chart(create_plot(option), use_container_width=True)
-        
-        st.divider()
-        st.subheader("⚖️ วิเคราะห์สมดุลอากาศ (Temp vs Humid Comparison)")
-        st.caption("ดูกราฟนี้เพื่อเฝ้าระวังเชื้อรา: หากเส้นอุณหภูมิ(แดง) และความชื้น(ฟ้า) พุ่งสูงขึ้นพร้อมกัน จะเป็นจุดวิกฤตที่เชื้อราเติบโตได้ดี")
+            # เวลาที่ st.plotly_chart ใช้แปลงกราฟเป็น JSON ส่งไปเบราว์เซอร์
+            with METRICS.timer('mg_section_seconds', section='trends_render'):
+                st.plotly_chart(fig_trend, use_container_width=True)
+            st.caption(f"ความละเอียดของกราฟ: {trend_resolution}")
         
-        if 'Timestamp' in df_graph.columns and 'AirTemp' in df_graph.columns and 'AirHumid' in df_graph.columns:
-            fig_dual = make_subplots(specs=[[{"secondary_y": True}]])
-            x_axis_dual = df_graph['Timestamp']
-            
-            fig_dual.add_trace(go.Scatter(x=x_axis_dual, y=df_graph['AirTemp'], name="อุณหภูมิ (°C)", line=dict(color='#FF4B4B', width=2)), secondary_y=False)
-            fig_dual.add_trace(go.Scatter(x=x_axis_dual, y=df_graph['AirHumid'], name="ความชื้นอากาศ (%)", line=dict(color='#00D4FF', width=2, dash='dot')), secondary_y=True)
-
-            fig_dual.update_layout(
-                template="plotly_dark", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
-                hovermode="x unified", height=400,
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-                margin=dict(l=20, r=20, t=30, b=20)
-            )
-            fig_dual.update_yaxes(title_text="<b>อุณหภูมิ (°C)</b>", secondary_y=False, color='#FF4B4B', showgrid=False)
-            fig_dual.update_yaxes(title_text="<b>ความชื้นอากาศ (%)</b>", secondary_y=True, color='#00D4FF', showgrid=True, gridcolor='#31333F')
-            
-            st.plotly_chart(fig_dual, use_container_width=True)
+            st.divider()
+            st.subheader("⚖️ วิเคราะห์สมดุลอากาศ (Temp vs Humid Comparison)")
+            st.caption("ดูกราฟนี้เพื่อเฝ้าระวังเชื้อรา: หากเส้นอุณหภูมิ(แดง) และความชื้น(ฟ้า) พุ่งสูงขึ้นพร้อมกัน จะเป็นจุดวิกฤตที่เชื้อราเติบโตได้ดี")
+            if fig_dual is not None:
+                with METRICS.timer('mg_section_seconds', section='trends_render'):
+                    st.plotly_chart(fig_dual, use_container_width=True)
+
+        @st.fragment(run_every=LIVE_SECONDS)
+        @METRICS.timed('mg_section_seconds', section='health')
+        def live_health():
+            snapshot = get_fleet().snapshot(device_id)
+            health = snapshot.health
+
+            st.subheader("🛡️ ระบบประเมินความเสี่ยงและสุขภาพพืช (Plant Health & Risk)")
+
+            # ระดับความเสี่ยงประเมินไว้แล้วใน poller ด้วยสถิติแบบหน้าต่างเวลาเลื่อน (อัปเดตทีละแถวใหม่)
+            # ข้อความของแต่ละหัวข้อและตารางประวัติสร้างครั้งเดียวต่อข้อมูลชุดใหม่
+            def build_health_view():
+                rules = {}
+                for rule in RULE_MESSAGES:
+                    level = health.levels.get(rule, 'success')
+                    since = format_duration(health.time - health.since[rule]) if rule in health.since else None
+                    rules[rule] = (level, *RULE_MESSAGES[rule][level], since)
+                history = pd.DataFrame(
+                    [(t.time.tz_localize(None), RULE_NAMES[t.rule], RULE_MESSAGES[t.rule][t.level][0])
+                     for t in reversed(health.transitions[-50:])],
+                    columns=['เวลา', 'หัวข้อ', 'สถานะ']
+                )
+                return rules, history
+
+            if health is not None:
+                rules, history = session_cached('health_view', (device_id, snapshot.version), build_health_view)
+
+            def show_rule(rule):
+                level, stat, desc, since = rules[rule]
+                if level == "error": st.error(f"**{stat}**: {desc}")
+                elif level == "warning": st.warning(f"**{stat}**: {desc}")
+                else: st.success(f"**{stat}**: {desc}")
+                if since is not None:
+                    st.caption(f"⏱️ อยู่ในสถานะนี้มาแล้ว {since}")
+
+            exposure_hours = WINDOWS['exposure'] / pd.Timedelta(hours=1)
+            col_risk1, col_risk2 = st.columns(2)
+            with col_risk1:
+                if health is None:
+                    st.info("ยังไม่มีข้อมูลที่มีเวลาถูกต้องเพียงพอสำหรับประเมินความเสี่ยง")
+                else:
+                    st.markdown(f"#### 🦠 ความเสี่ยงโรคราคอดิน (Mold Risk)")
+                    show_rule('mold')
+                    st.caption(f"💧 ความชื้นอากาศเกิน 80% สะสม {health.exposure[('AirHumid', '>', 80)]:.1f} ชม. ใน {exposure_hours:.0f} ชม. ล่าสุด")
+                
+                    st.markdown("---")
+                    st.markdown(f"#### ☀️ ความเครียดจากสภาพแวดล้อม (Plant Stress)")
+                    show_rule('stress')
+                    st.caption(f"🌡️ อุณหภูมิเกิน 30°C สะสม {health.exposure[('AirTemp', '>', 30)]:.1f} ชม. ใน {exposure_hours:.0f} ชม. ล่าสุด")
+
+                    with st.expander("📜 ประวัติการเปลี่ยนระดับความเสี่ยง"):
+                        st.dataframe(history, hide_index=True, use_container_width=True)
+
+            with col_risk2:
+                if health is not None:
+                    st.markdown(f"#### 🪴 สถานะความชื้นในดิน (Soil Status)")
+                    show_rule('soil')
+
+                    st.markdown("---")
+                    st.metric("🏆 ภาพรวมสภาพแวดล้อม (Overall Status)", f"{health.env_score} %")
+
+        @st.fragment
+        def data_export():
+            # ตัวเลือกการ export อยู่นอกส่วนที่ rerun ตามเวลา (ค่าที่ผู้ใช้กำลังเลือกไม่ถูกรีเซ็ต)
+            snapshot = get_fleet().snapshot(device_id)
 
-        st.divider()
-        st.subheader("🛡️ ระบบประเมินความเสี่ยงและสุขภาพพืช (Plant Health & Risk)")
-
-        recent_data = df.tail(20)
-        avg_temp = recent_data['AirTemp'].mean()
-        avg_humid = recent_data['AirHumid'].mean()
-
-        if avg_temp > 30 and avg_humid > 80:
-            mold_stat, mold_desc, mold_color = "🔴 เสี่ยงสูงมาก (High Risk)", "อากาศร้อนชื้นจัดอย่างต่อเนื่อง เสี่ยงเกิดโรคโคนเน่า", "error"
-        elif avg_temp > 28 and avg_humid > 75:
-            mold_stat, mold_desc, mold_color = "🟡 เฝ้าระวัง (Warning)", "อากาศเริ่มอบอ้าวสะสม ควรรักษาการถ่ายเทอากาศให้ดี", "warning"
-        else:
-            mold_stat, mold_desc, mold_color = "🟢 ปลอดภัย (Safe)", "สภาพอากาศโดยเฉลี่ยถ่ายเทดี อยู่ในเกณฑ์ปกติ", "success"
-
-        if cur_temp > 33 and cur_ppfd > 150:
-            stress_stat, stress_desc, stress_color = "🔴 พืชเครียดจัด (Severe Stress)", "แดดแรงและร้อนจัด ระวังใบไหม้ ควรพรางแสง", "error"
-        elif cur_temp > 31 and cur_soil < 50:
-            stress_stat, stress_desc, stress_color = "🟡 เสี่ยงขาดน้ำ (Water Stress)", "ร้อนแต่ดินเริ่มแห้ง พืชสูญเสียน้ำเร็วกว่าดูดซึม", "warning"
-        else:
-            stress_stat, stress_desc, stress_color = "🟢 สภาพปกติ (Optimal)", "พืชสังเคราะห์แสงและคายน้ำได้ดี", "success"
-
-        if cur_soil < 40:
-            soil_stat, soil_desc, soil_color = "🔴 ดินแห้งเกินไป", "ควรรดน้ำทันทีเพื่อป้องกันรากแห้งตาย", "error"
-        elif cur_soil > 85:
-            soil_stat, soil_desc, soil_color = "🟡 ดินแฉะเกินไป", "ดินอุ้มน้ำมากเกินไประวังรากขาดออกซิเจน", "warning"
-        else:
-            soil_stat, soil_desc, soil_color = "🟢 ดินชุ่มชื้นพอดี", "ความชื้นเหมาะสมต่อการดูดซึมธาตุอาหาร", "success"
-
-        col_risk1, col_risk2 = st.columns(2)
-        with col_risk1:
-            st.markdown(f"#### 🦠 ความเสี่ยงโรคราคอดิน (Mold Risk)")
-            if mold_color == "error": st.error(f"**{mold_stat}**: {mold_desc}")
-            elif mold_color == "warning": st.warning(f"**{mold_stat}**: {mold_desc}")
-            else: st.success(f"**{mold_stat}**: {mold_desc}")
-            
-            st.markdown("---")
-            st.markdown(f"#### ☀️ ความเครียดจากสภาพแวดล้อม (Plant Stress)")
-            if stress_color == "error": st.error(f"**{stress_stat}**: {stress_desc}")
-            elif stress_color == "warning": st.warning(f"**{stress_stat}**: {stress_desc}")
-            else: st.success(f"**{stress_stat}**: {stress_desc}")
-
-        with col_risk2:
-            st.markdown(f"#### 🪴 สถานะความชื้นในดิน (Soil Status)")
-            if soil_color == "error": st.error(f"**{soil_stat}**: {soil_desc}")
-            elif soil_color == "warning": st.warning(f"**{soil_stat}**: {soil_desc}")
-            else: st.success(f"**{soil_stat}**: {soil_desc}")
-
-            st.markdown("---")
-            env_score = 100
-            if cur_temp > 30 or cur_temp < 24: env_score -= 15
-            if cur_humid > 80 or cur_humid < 50: env_score -= 15
-            if cur_soil < 50 or cur_soil > 85: env_score -= 20
-            
-            st.metric("🏆 ภาพรวมสภาพแวดล้อม (Overall Status)", f"{env_score} %")
-            
-            st.markdown("---")
             st.markdown("#### 📥 นำข้อมูลไปวิเคราะห์ต่อ (Data Export)")
-            csv_data = df.to_csv(index=False).encode('utf-8-sig') 
+            # ไฟล์ถูกสร้างเฉพาะตอนกดดาวน์โหลด โดยอ่านจากฐานข้อมูลทีละก้อน (ไม่สร้างทุก rerun)
+            col_range, col_format = st.columns(2)
+            export_range = col_range.selectbox(
+                "ช่วงข้อมูล", ('ทั้งหมด', 'รอบการทดลองปัจจุบัน', '7 วันล่าสุด', '24 ชั่วโมงล่าสุด')
+            )
+            export_format = col_format.selectbox("รูปแบบไฟล์", list(EXPORT_FORMATS))
+            export_ext, export_mime = EXPORT_FORMATS[export_format]
+
+            if export_range in ('7 วันล่าสุด', '24 ชั่วโมงล่าสุด') and timed_frame(snapshot.frame).empty:
+                st.info("ยังไม่มีข้อมูลที่มีเวลาถูกต้อง ไฟล์จะมีข้อมูลทั้งหมด")
+
             st.download_button(
-                label="📄 ดาวน์โหลดข้อมูลย้อนหลังทั้งหมด (.csv)",
-                data=csv_data,
-                file_name=f"MorningGlory_Data_{now_th.strftime('%Y%m%d_%H%M')}.csv",
-                mime='text/csv',
+                label=f"📄 ดาวน์โหลดข้อมูลย้อนหลัง (.{export_ext})",
+                data=partial(export_latest, get_fleet(), device_id, export_ext, export_range),
+                file_name=f"MorningGlory{'' if len(devices) == 1 else '_' + device_id}_Data_{now_th.strftime('%Y%m%d_%H%M')}.{export_ext}",
+                mime=export_mime,
+                on_click="ignore",
                 use_container_width=True 
             )
+
+        @st.fragment(run_every=LIVE_SECONDS)
+        @METRICS.timed('mg_section_seconds', section='actuators')
+        def live_actuators():
+            snapshot = get_fleet().snapshot(device_id)
+            actuators = snapshot.actuators
+
+            st.subheader("⚙️ ประวัติการทำงานของอุปกรณ์ (Actuator History)")
+            if actuators is None or not actuators.state:
+                st.info("ยังไม่พบข้อมูลสถานะพัดลม/ปั๊มน้ำ")
+                return
+
+            # ทุกค่าสรุปไว้แล้วใน poller (อัปเดตเฉพาะจุดที่สถานะเปลี่ยน) หน้านี้แค่อ่านค่า
+            names = {'Pump': '💧 ปั๊มน้ำ (Pump)', 'Fan': '🌀 พัดลม (Fan)'}
+            today = actuators.time.date()
+            for col_act, actuator in zip(st.columns(len(actuators.state)), actuators.state):
+                active = ACTUATORS[actuator]
+                last_on = actuators.last_on.get(actuator)
+                with col_act:
+                    st.metric(
+                        f"{names.get(actuator, actuator)} : เวลาที่ {active} วันนี้",
+                        format_duration(pd.Timedelta(seconds=actuators.runtime[actuator].get(today, 0))),
+                        f"{actuators.activations[actuator].get(today, 0)} ครั้งวันนี้", delta_color="off"
+                    )
+                    st.caption(
+                        f"สถานะปัจจุบัน: {actuators.state[actuator]} · "
+                        f"เริ่ม {active} ล่าสุด: {last_on.strftime('%d/%m, %H:%M') if last_on is not None else '-'}"
+                    )
+
+            # กราฟเวลาทำงานรายวันและตารางประวัติสร้างครั้งเดียวต่อข้อมูลชุดใหม่
+            def build_actuator_view():
+                days = pd.date_range(end=pd.Timestamp(today), periods=14, freq='D').date
+                fig_runtime = go.Figure()
+                for actuator in actuators.state:
+                    fig_runtime.add_trace(go.Bar(
+                        x=days, y=[actuators.runtime[actuator].get(d, 0) / 60 for d in days],
+                        customdata=[actuators.activations[actuator].get(d, 0) for d in days],
+                        hovertemplate="%{y:.0f} นาที (%{customdata} ครั้ง)", name=names.get(actuator, actuator)
+                    ))
+                fig_runtime.update_layout(
+                    barmode='group', template="plotly_dark", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+                    title="เวลาทำงานรายวัน (14 วันล่าสุด)", yaxis_title="นาที", hovermode="x unified", height=320,
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+                )
+                recent = sorted((e for events in actuators.events.values() for e in events[-50:]), key=lambda e: e.start, reverse=True)
+                history = pd.DataFrame(
+                    [(names.get(e.actuator, e.actuator), e.state, e.start.tz_localize(None),
+                      e.end.tz_localize(None) if e.end is not None else None, format_duration(pd.Timedelta(seconds=e.seconds)))
+                     for e in recent[:100]],
+                    columns=['อุปกรณ์', 'สถานะ', 'เริ่ม', 'สิ้นสุด', 'ระยะเวลา']
+                )
+                return fig_runtime, history
+
+            fig_runtime, history = session_cached('actuator_view', (device_id, snapshot.version), build_actuator_view)
+            st.plotly_chart(fig_runtime, use_container_width=True)
+
+            with st.expander("📜 ช่วงการทำงานล่าสุด"):
+                st.dataframe(history, hide_index=True, use_container_width=True)
+
+        live_status()
+        st.divider()
+        live_trends()
+        st.divider()
+        live_health()
+        data_export()
+        st.divider()
+        live_actuators()
     else:
         st.warning("🌙 ไม่พบข้อมูลในระบบ กำลังรอสัญญาณจาก ESP32...")
 
+        @st.fragment(run_every=LIVE_SECONDS)
+        def wait_for_data():
+            # ข้อมูลชุดแรกมาถึงแล้ว วาดทั้งหน้าใหม่ครั้งเดียว
+            if not read_snapshot(device_id).frame.empty:
+                st.rerun()
+        wait_for_data()
+
 
 # ------------------------------------------
 # ▶️ แท็บที่ 2: หน้าเปรียบเทียบผลการทดลอง
 # ------------------------------------------
 with tab_compare:
+    compare_started = time.perf_counter()
     st.header("📈 วิเคราะห์เปรียบเทียบผลการทดลอง (Interactive Data)")
     st.markdown("เปรียบเทียบข้อมูลการเจริญเติบโต และสภาพแวดล้อมโดยเฉลี่ยจากข้อมูลที่จัดเก็บในฐานข้อมูลเดียวกัน")
     
     # --- 0. ตรวจจับจำนวนรอบการทดลองจาก Database ก่อน ---
-    total_detected_trials = 0
-    if not df.empty and 'Day' in df.columns:
-        df['Day_Numeric'] = pd.to_numeric(df['Day'], errors='coerce').fillna(0)
-        condition_new_trial = df['Day_Numeric'].diff() < -1
-        df['Trial_Number'] = condition_new_trial.cumsum() + 1
-        total_detected_trials = df['Trial_Number'].max()
+    # ขอบเขตและผลรวมของแต่ละรอบคำนวณไว้แล้วใน poller (อัปเดตเฉพาะแถวใหม่)
+    total_detected_trials = len(trials) if not df.empty else 0
 
     st.subheader("🌱 1. อัตราการเจริญเติบโต (กายภาพ)")
     st.caption("ปรับจำนวนรอบการทดลอง และกรอกตัวเลขในตารางด้านล่าง ระบบจะสร้างกราฟเปรียบเทียบให้อัตโนมัติ")
@@ -372,51 +587,35 @@ with tab_compare:
         if total_detected_trials > 0:
             st.success(f"ฐานข้อมูลพบ {total_detected_trials} รอบ")
 
-    # --- 1. ฟังก์ชันโหลดและบันทึกข้อมูลตารางลง Google Sheets ---
-    def get_growth_sheet():
-        try:
-            creds_info = dict(st.secrets["gcp_service_account"])
-            if "private_key" in creds_info:
-                creds_info["private_key"] = creds_info["private_key"].replace("\\n", "\n")
-            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_info, scope)
-            client = gspread.authorize(creds)
-            spreadsheet = client.open("Project IOT")
-            
-            try:
-                sheet = spreadsheet.worksheet("Growth_Data")
-            except gspread.exceptions.WorksheetNotFound:
-                sheet = spreadsheet.add_worksheet(title="Growth_Data", rows="100", cols="20")
-            return sheet
-        except Exception as e:
-            st.error(f"เชื่อมต่อ Google Sheets ส่วนข้อมูลการเติบโตไม่สำเร็จ: {e}")
-            return None
-
-    def load_growth_data():
-        sheet = get_growth_sheet()
-        if sheet:
-            data = sheet.get_all_records()
-            if data:
-                # ✅ บังคับให้ข้อมูลทุกคอลัมน์ (ยกเว้น Period) เป็นเลขทศนิยม (Float) เสมอ
-                loaded_df = pd.DataFrame(data)
-                for col in loaded_df.columns:
-                    if col != 'Period':
-                        loaded_df[col] = pd.to_numeric(loaded_df[col], errors='coerce').astype(float)
-                return loaded_df
-        return pd.DataFrame()
-
-    def save_growth_data(df_to_save):
-        sheet = get_growth_sheet()
-        if sheet:
-            sheet.clear()
-            sheet.update([df_to_save.columns.values.tolist()] + df_to_save.values.tolist())
-            return True
-        return False
-
-    if 'cloud_growth_data' not in st.session_state:
-        st.session_state.cloud_growth_data = load_growth_data()
-
-    if st.session_state.cloud_growth_data.empty:
+    # --- 1. โหลดข้อมูลตารางจาก cache กลาง (ทุก session ใช้ชุดเดียวกัน ไม่เรียก API ซ้ำ) ---
+    growth_cache = get_growth_cache()
+    try:
+        latest_growth_data, latest_version = growth_cache.get()
+    except Exception as e:
+        st.error(f"เชื่อมต่อ Google Sheets ส่วนข้อมูลการเติบโตไม่สำเร็จ: {e}")
+        latest_growth_data, latest_version = pd.DataFrame(), None
+
+    # ข้อมูลชุดที่ผู้ใช้เริ่มแก้ไข (base) เก็บใน session เปลี่ยนเฉพาะตอนโหลดครั้งแรก หลังบันทึกสำเร็จ หรือเมื่อกดโหลดข้อมูลล่าสุด
+    # ตารางแก้ไขจึงไม่ถูกสลับข้อมูลระหว่างที่ผู้ใช้กำลังแก้ ; version ของ base ใช้ตรวจการบันทึกทับกัน
+    def set_growth_base(frame, version):
+        st.session_state.growth_base = (frame, version)
+        # key ใหม่ = ตารางแก้ไขชุดใหม่ที่เริ่มจาก base (ไม่นำการแก้ไขของตารางเดิมมาใช้ซ้ำ)
+        st.session_state.growth_editor = st.session_state.get('growth_editor', 0) + 1
+
+    if st.session_state.get('growth_base', (None, None))[1] is None:
+        set_growth_base(latest_growth_data, latest_version)
+    base_growth_data, base_version = st.session_state.growth_base
+    cloud_growth_data = base_growth_data.copy()
+
+    if latest_version is not None and latest_version != base_version:
+        # มีคนบันทึกหลังจากที่ผู้ใช้เริ่มแก้ไข: ไม่สลับข้อมูลให้เอง (การแก้ไขที่ยังไม่บันทึกจะหาย) ให้ผู้ใช้เลือกโหลดใหม่
+        col_conflict, col_reload = st.columns([4, 1])
+        col_conflict.warning("⚠️ มีผู้ใช้อื่นบันทึกข้อมูลการเติบโตหลังจากที่คุณเริ่มแก้ไข ตารางด้านล่างยังเป็นข้อมูลชุดเดิม (บันทึกทับไม่ได้) กรุณาโหลดข้อมูลล่าสุดก่อนแก้ไขต่อ")
+        if col_reload.button("🔄 โหลดข้อมูลล่าสุด", use_container_width=True):
+            set_growth_base(latest_growth_data, latest_version)
+            st.rerun()
+
+    if cloud_growth_data.empty:
         default_periods = ['วันที่ 4', 'วันที่ 6', 'วันที่ 8', 'วันที่ 10']
         init_data = {'Period': default_periods}
         default_stems_t1 = [2.0, 5.0, 8.0, 12.0]
@@ -435,18 +634,28 @@ with tab_compare:
                 init_data[f'Stem_Trial{i}'] = [0.0] * len(default_periods)
                 init_data[f'Leaf_Trial{i}'] = [0.0] * len(default_periods)
         
-        st.session_state.cloud_growth_data = pd.DataFrame(init_data)
-        save_growth_data(st.session_state.cloud_growth_data)
+        cloud_growth_data = pd.DataFrame(init_data)
+        if base_version is not None:
+            try:
+                set_growth_base(cloud_growth_data, growth_cache.save(cloud_growth_data, base_version))
+            except GrowthConflictError:
+                # มีผู้ใช้อื่นสร้างตารางเริ่มต้นไปก่อนแล้ว ใช้ข้อมูลของชีตแทน
+                set_growth_base(*growth_cache.get())
+                st.rerun()
+            except Exception as e:
+                st.error(f"เกิดข้อผิดพลาดในการบันทึกข้อมูล: {e}")
+            cloud_growth_data, base_version = st.session_state.growth_base
+            cloud_growth_data = cloud_growth_data.copy()
 
     display_cols = ['Period']
     for i in range(1, num_trials + 1):
-        if f'Stem_Trial{i}' not in st.session_state.cloud_growth_data.columns:
-            st.session_state.cloud_growth_data[f'Stem_Trial{i}'] = 0.0
-            st.session_state.cloud_growth_data[f'Leaf_Trial{i}'] = 0.0
+        if f'Stem_Trial{i}' not in cloud_growth_data.columns:
+            cloud_growth_data[f'Stem_Trial{i}'] = 0.0
+            cloud_growth_data[f'Leaf_Trial{i}'] = 0.0
             
         display_cols.extend([f'Stem_Trial{i}', f'Leaf_Trial{i}'])
         
-    df_input = st.session_state.cloud_growth_data[display_cols]
+    df_input = cloud_growth_data[display_cols]
     
     st.markdown("**(แก้ไขตัวเลขในตาราง แล้วกดปุ่มบันทึกด้านล่าง ข้อมูลจะถูกเซฟขึ้นระบบ Cloud ทันที)**")
     
@@ -467,12 +676,13 @@ with tab_compare:
         num_rows="dynamic", 
         use_container_width=True, 
         hide_index=True,
-        column_config=column_config # นำการตั้งค่ามาใช้
+        column_config=column_config, # นำการตั้งค่ามาใช้
+        key=f"growth_editor_{st.session_state.growth_editor}"
     )
     
     if st.button("💾 บันทึกข้อมูลการเจริญเติบโต", type="primary"):
         with st.spinner("กำลังบันทึกข้อมูลลง Google Sheets..."):
-            updated_full_df = st.session_state.cloud_growth_data.copy()
+            updated_full_df = cloud_growth_data.copy()
             
             if len(edited_df) > len(updated_full_df):
                 extra_rows = len(edited_df) - len(updated_full_df)
@@ -488,12 +698,14 @@ with tab_compare:
                 else:
                     updated_full_df[col] = edited_df[col].values
                 
-            st.session_state.cloud_growth_data = updated_full_df
-            
-            if save_growth_data(updated_full_df):
+            try:
+                set_growth_base(updated_full_df, growth_cache.save(updated_full_df, base_version))
                 st.success("✅ บันทึกข้อมูลเรียบร้อยแล้ว!")
-            else:
-                st.error("เกิดข้อผิดพลาดในการบันทึกข้อมูล")
+            except GrowthConflictError:
+                # มีผู้ใช้อื่นบันทึกก่อน: ไม่เขียนทับของคนอื่น และไม่ล้างตารางที่ผู้ใช้แก้ไขไว้
+                st.error("⚠️ มีผู้ใช้อื่นบันทึกข้อมูลก่อนหน้านี้ การแก้ไขของคุณยังไม่ถูกบันทึก กรุณาโหลดข้อมูลล่าสุดแล้วแก้ไขอีกครั้ง")
+            except Exception as e:
+                st.error(f"เกิดข้อผิดพลาดในการบันทึกข้อมูล: {e}")
 
     # --- 3. สร้างกราฟจากข้อมูลในตาราง ---
     col_chart1, col_chart2 = st.columns(2)
@@ -564,19 +776,19 @@ with tab_compare:
         fig_sensor = go.Figure()
         
         for i in range(1, num_trials + 1):
-            df_chunk = df[df['Trial_Number'] == i]
+            trial = trials[i - 1] if i <= len(trials) else None
             
-            if not df_chunk.empty:
-                avg_temp = df_chunk['AirTemp'].mean()
-                avg_hum = df_chunk['AirHumid'].mean()
-                avg_soil = df_chunk['SoilHumid'].mean()
+            if trial is not None and trial.count > 0:
+                avg_temp = trial_mean(trial, 'AirTemp')
+                avg_hum = trial_mean(trial, 'AirHumid')
+                avg_soil = trial_mean(trial, 'SoilHumid')
                 # ✅ 3. เพิ่มการคำนวณค่าเฉลี่ยแสงสว่าง (Lux)
-                avg_light = df_chunk['LightLux'].mean() if 'LightLux' in df_chunk.columns else 0
+                avg_light = trial_mean(trial, 'LightLux')
                 
                 fig_sensor.add_trace(go.Bar(
                     x=['อุณหภูมิ (°C)', 'ความชื้นอากาศ (%)', 'ความชื้นดิน (%)', 'แสงสว่าง (lx)'],
                     y=[avg_temp, avg_hum, avg_soil, avg_light],
-                    name=f'รอบที่ {i} (จำนวน {len(df_chunk)} ข้อมูล)', 
+                    name=f'รอบที่ {i} (จำนวน {trial.count} ข้อมูล)', 
                     marker_color=colors[(i-1)%len(colors)]
                 ))
                 
@@ -589,4 +801,87 @@ with tab_compare:
         )
         st.plotly_chart(fig_sensor, use_container_width=True)
     else:
-        st.info("กำลังรอข้อมูลเซนเซอร์สะสมให้เพียงพอ หรือไม่พบคอลัมน์ 'Day' ในฐานข้อมูล...")
\ No newline at end of file
+        st.info("กำลังรอข้อมูลเซนเซอร์สะสมให้เพียงพอ หรือไม่พบคอลัมน์ 'Day' ในฐานข้อมูล...")
+    METRICS.observe('mg_section_seconds', time.perf_counter() - compare_started, section='compare')
+
+
+# ------------------------------------------
+# ▶️ แท็บที่ 3: ภาพรวมทุกแปลง (แสดงเมื่อมีมากกว่า 1 แปลง)
+# ------------------------------------------
+if tab_fleet:
+    with tab_fleet[0]:
+        st.header("🛰️ ภาพรวมทุกแปลงปลูก (Fleet Overview)")
+        st.caption("ค่าล่าสุดของแต่ละแปลงจาก snapshot ในหน่วยความจำ (ไม่เรียก API เพิ่ม) เลือกแปลงที่แถบด้านข้างเพื่อดูรายละเอียด")
+
+        @st.fragment(run_every=FLEET_SECONDS)
+        @METRICS.timed('mg_section_seconds', section='fleet')
+        def fleet_overview():
+            fleet = get_fleet()
+            rows = []
+            for device in devices:
+                device_snapshot = fleet.snapshot(device.id)
+                frame = device_snapshot.frame
+                row = {'แปลง': device.name, 'รหัส': device.id}
+                timed = timed_frame(frame)
+                if not frame.empty:
+                    last = frame.iloc[-1]
+                    row.update({
+                        'ข้อมูลล่าสุด': timed.index[-1].tz_localize(None) if not timed.empty else None,
+                        'อุณหภูมิ (°C)': last.get('AirTemp'),
+                        'ความชื้นอากาศ (%)': last.get('AirHumid'),
+                        'ความชื้นดิน (%)': last.get('SoilHumid'),
+                        'แสง (lx)': last.get('LightLux'),
+                        'พัดลม': str(last.get('Fan', 'N/A')).strip().upper(),
+                        'ปั๊มน้ำ': str(last.get('Pump', 'N/A')).strip().upper(),
+                    })
+                if device_snapshot.actuators is not None and 'Pump' in device_snapshot.actuators.last_on:
+                    row['ปั๊มทำงานล่าสุด'] = device_snapshot.actuators.last_on['Pump'].tz_localize(None)
+                health = device_snapshot.health
+                if health is not None:
+                    row['ความเสี่ยงเชื้อรา'] = RULE_MESSAGES['mold'][health.levels.get('mold', 'success')][0]
+                    row['ภาพรวม (%)'] = health.env_score
+                if not device_snapshot.error:
+                    row['การเชื่อมต่อ'] = "✅ ปกติ"
+                elif device_snapshot.retry_at:
+                    row['การเชื่อมต่อ'] = f"⏸️ ออฟไลน์ (ลองใหม่ใน {time_ago(max(0, device_snapshot.retry_at - time.time()))}): {device_snapshot.error}"
+                else:
+                    row['การเชื่อมต่อ'] = f"❌ {device_snapshot.error}"
+                rows.append(row)
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+        fleet_overview()
+
+METRICS.observe('mg_section_seconds', time.perf_counter() - page_started, section='page')
+
+
+# ------------------------------------------
+# 🔧 แผงวิเคราะห์ประสิทธิภาพ (แสดงเมื่อเปิด URL ด้วย ?diag=1 เท่านั้น)
+# ------------------------------------------
+if DIAGNOSTICS:
+    with st.sidebar.expander("🔧 Diagnostics", expanded=True):
+        @st.fragment(run_every=5)
+        def diagnostics():
+            counters, timings = METRICS.snapshot()
+            st.metric("Sheets API (ครั้ง/นาที)", f"{METRICS.per_minute('mg_sheets_api_calls_total'):.0f}")
+
+            # เวลาที่ใช้ของแต่ละส่วน: Sheets I/O, ขั้นตอนของ poller, การวาดหน้าจอ
+            st.markdown("**เวลาที่ใช้ (ms)**")
+            st.dataframe(pd.DataFrame(
+                [(name.removeprefix('mg_').removesuffix('_seconds'), ' '.join(f"{k}={v}" for k, v in labels.items()),
+                  count, total / count * 1000, peak * 1000, last * 1000)
+                 for name, labels, (count, total, peak, last) in timings],
+                columns=['ค่าวัด', 'label', 'ครั้ง', 'เฉลี่ย', 'สูงสุด', 'ล่าสุด']
+            ).round(1), hide_index=True, use_container_width=True)
+
+            st.markdown("**ตัวนับ**")
+            st.dataframe(pd.DataFrame(
+                [(name.removeprefix('mg_'), ' '.join(f"{k}={v}" for k, v in labels.items()), value)
+                 for name, labels, value in counters],
+                columns=['ค่าวัด', 'label', 'ค่า']
+            ), hide_index=True, use_container_width=True)
+
+            st.download_button(
+                "⬇️ metrics.prom", METRICS.render(), file_name="metrics.prom", mime="text/plain",
+                on_click="ignore", use_container_width=True
+            )
+        diagnostics()
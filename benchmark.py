@@ -0,0 +1,251 @@
+import argparse
+import gc
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from actuators import ActuatorLog
+from cleaning import SensorCleaner, chart_times
+from downsample import downsample_series
+from export import export_file
+from forecast import SensorForecaster
+from health import HealthEngine
+from rollups import RollupSet, range_series
+from sheets import SheetTail
+from store import TIMESTAMP_FORMATS, TIMEZONE, SensorStore
+from sync import sync_once
+from trials import TrialIndex
+
+HEADER = ['Timestamp', 'Day', 'AirTemp', 'AirHumid', 'LightLux', 'SoilHumid', 'Fan', 'Pump']
+SIZES = [10_000, 100_000, 1_000_000]
+STEP = 30               # วินาที ; ช่วงห่างระหว่างแถว (ESP32 ส่งทุก 30 วินาที)
+TRIALS = 3              # จำนวนรอบการทดลองในข้อมูลจำลอง
+TRIAL_DAYS = 30         # ค่า Day สูงสุดของแต่ละรอบ (นับใหม่จาก 1 เมื่อเริ่มรอบใหม่)
+PERCENT_SHARE = 0.3     # สัดส่วนค่าความชื้นที่ ESP32 ส่งมาเป็นข้อความติด '%' เช่น "65.2%"
+BLANK_SHARE = 0.005     # สัดส่วนช่องว่าง (เซนเซอร์อ่านค่าไม่ได้) ให้ขั้นตอน ffill ได้ทำงาน
+CHART_RANGES = {'6 ชั่วโมง': pd.Timedelta(hours=6), '24 ชั่วโมง': pd.Timedelta(hours=24), '7 วัน': pd.Timedelta(days=7), 'ทั้งหมด': None}
+
+# ขั้นตอนที่จับเวลา เรียงตามลำดับที่ข้อมูลไหลผ่านจริง (ชีต -> ฐานข้อมูล -> poller -> หน้าจอ/ไฟล์)
+STAGES = ['sync', 'load', 'cleaning', 'trials', 'actuators', 'pump_lookup', 'rollups', 'charts', 'forecast', 'health', 'export_csv']
+
+# ผลการวัด 1 ขนาดข้อมูล ; seconds คือ dict {ขั้นตอน: วินาที (ค่าที่ดีที่สุดจากการวัดซ้ำ)}
+Result = namedtuple("Result", ["rows", "seconds"])
+
+
+# --- ข้อมูลจำลองแบบเดียวกับที่ ESP32 เขียนลงชีต ---
+def synthetic_rows(n, step=STEP, trials=TRIALS, seed=0, start="2026-01-01"):
+    # คืนค่า (หัวตาราง, แถว) ; ทุกค่าเป็นข้อความแบบที่ gspread get_values() คืนมา
+    rng = np.random.default_rng(seed)
+    times = pd.Timestamp(start, tz=TIMEZONE) + pd.to_timedelta(np.arange(n) * step, unit='s')
+    hours = (times.hour + times.minute / 60).to_numpy()
+    sun = np.sin(2 * np.pi * (hours - 6) / 24)
+
+    # แบ่งแถวเป็นรอบการทดลองเท่า ๆ กัน ค่า Day ในแต่ละรอบไล่จาก 1 ถึง TRIAL_DAYS
+    trial_rows = -(-n // trials)
+    position = np.arange(n) % trial_rows
+    day = 1 + position * TRIAL_DAYS // trial_rows
+
+    temp = 28 + 4 * sun + rng.normal(0, 0.6, n)
+    humid = np.clip(70 - 12 * sun + rng.normal(0, 2, n), 0, 100)
+    lux = np.clip(2500 * sun + rng.normal(0, 80, n), 0, None)
+    # ดินแห้งลงเรื่อย ๆ แล้วปั๊มรดน้ำทุก 6 ชั่วโมง ครั้งละ 5 นาที
+    since_water = (np.arange(n) * step) % (6 * 3600)
+    pump = since_water < 5 * 60
+    soil = np.clip(82 - since_water / 600 + rng.normal(0, 1, n), 0, 100)
+    # พัดลมเร่งเป็น MAX เมื่ออากาศร้อน (ค่าเดียวกับที่อุปกรณ์จริงส่งมา: MAX/LOW) ให้ขั้นตอน actuators ได้นับเวลาทำงาน
+    fan = temp > 30
+
+    def sensor_text(values, percent=False):
+        text = np.char.mod('%.1f', values).astype(object)
+        if percent:
+            marked = rng.random(n) < PERCENT_SHARE
+            text[marked] = text[marked] + '%'
+        text[rng.random(n) < BLANK_SHARE] = ''
+        return text
+
+    columns = [
+        times.strftime(TIMESTAMP_FORMATS[0]).to_numpy(dtype=object),
+        day.astype(str).astype(object),
+        sensor_text(temp),
+        sensor_text(humid, percent=True),
+        sensor_text(lux),
+        sensor_text(soil, percent=True),
+        np.where(fan, 'MAX', 'LOW').astype(object),
+        np.where(pump, 'ON', 'OFF').astype(object),
+    ]
+    return list(HEADER), [list(row) for row in zip(*columns)]
+
+
+# --- worksheet จำลองในหน่วยความจำ (แทน gspread.Worksheet ไม่ต้องใช้เครือข่าย) ---
+# รองรับเฉพาะเมธอดที่ SheetTail และ ingest.SheetsMirror เรียกใช้ ; ช่วงข้อมูลคืนทุกคอลัมน์ (ไม่ตัดตามช่วง)
+class MockWorksheet:
+    def __init__(self, header, rows, latency=0.0):
+        self.header = list(header)
+        self.rows = rows
+        self.latency = latency      # วินาทีต่อการเรียก API 1 ครั้ง (จำลองเวลาเดินทางของเครือข่าย)
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def row_values(self, row):
+        self._call()
+        return list(self.header) if row == 1 else list(self.rows[row - 2])
+
+    def _values(self, rng):
+        # รองรับช่วงแบบ "1:1" (หัวตาราง) และ "A<แถวแรก>:<คอลัมน์สุดท้าย>" ที่ SheetTail ใช้
+        if rng == "1:1":
+            return [list(self.header)]
+        first = int(re.match(r"[A-Z]+(\d+)", rng).group(1))
+        return self.rows[max(first - 2, 0):]
+
+    def get_values(self, rng):
+        self._call()
+        return self._values(rng)
+
+    def batch_get(self, ranges):
+        self._call()
+        return [self._values(rng) for rng in ranges]
+
+    def append_rows(self, values, value_input_option=None):
+        self._call()
+        self.rows.extend([str(v) for v in row] for row in values)
+
+
+def build_trend_figure(frame, tables, forecasts, start=None):
+    # กราฟแนวโน้มแบบ "ทั้งหมด" ของหน้าหลัก (เลือกความละเอียด -> ลดจุด -> สร้าง trace) แล้ว serialize
+    # แบบเดียวกับที่ st.plotly_chart ส่งไปเบราว์เซอร์
+    fig = go.Figure()
+    for col in ('AirTemp', 'AirHumid', 'LightLux', 'SoilHumid'):
+        if col in frame.columns:
+            series = downsample_series(range_series(frame, tables, col, start)[0])
+            fig.add_trace(go.Scatter(x=chart_times(series.index), y=series.values, mode='lines', name=col))
+        if col in forecasts:
+            predict = forecasts[col]
+            fig.add_trace(go.Scatter(x=chart_times(predict.index), y=predict.values, mode='lines', line=dict(dash='dot')))
+    fig.update_layout(template="plotly_dark", hovermode="x unified")
+    return fig.to_json()
+
+
+class Timer:
+    def __init__(self):
+        self.seconds = {}
+
+    def __call__(self, stage, func, *args):
+        gc.collect()
+        started = time.perf_counter()
+        result = func(*args)
+        self.seconds[stage] = time.perf_counter() - started
+        return result
+
+
+def run_pipeline(header, rows, folder, latency=0.0):
+    # เดินข้อมูลผ่านทุกขั้นตอนหนึ่งรอบด้วยอ็อบเจกต์ใหม่ทั้งหมด (เหมือนเปิด dashboard ครั้งแรก)
+    timer = Timer()
+    store = SensorStore(os.path.join(folder, "bench.sqlite"))
+    sheet = MockWorksheet(header, rows, latency)
+    timer('sync', sync_once, SheetTail(sheet), store)
+
+    raw = timer('load', store.load, None, None, None, True)
+    frame = timer('cleaning', SensorCleaner().update, raw)
+    del raw
+    timer('trials', TrialIndex().update, frame)
+    actuators = ActuatorLog()
+    timer('actuators', actuators.update, frame)
+    timer('pump_lookup', lambda: actuators.report().last_on.get('Pump'))
+    rollups = RollupSet()
+    timer('rollups', rollups.update, frame)
+
+    forecaster = SensorForecaster()
+    timer('forecast', lambda: (forecaster.update(frame), forecaster.forecasts())[1])
+    forecasts = forecaster.forecasts()
+    tables = rollups.tables()
+    end = frame.index[-1]
+    timer('charts', lambda: [
+        build_trend_figure(frame, tables, forecasts, None if span is None else end - span)
+        for span in CHART_RANGES.values()
+    ])
+    timer('health', HealthEngine().update, frame)
+
+    timer('export_csv', lambda: len(export_file(store, 'csv')))
+    store.connection().close()
+    return timer.seconds
+
+
+def benchmark(n, repeat=1, latency=0.0, seed=0):
+    header, rows = synthetic_rows(n, seed=seed)
+    best = {}
+    for _ in range(repeat):
+        folder = tempfile.mkdtemp(prefix="mg-bench-")
+        try:
+            # ชีตจำลองใช้ list แถวชุดเดียวกันทุกรอบ (SheetTail ไม่แก้ไขแถวที่ได้รับ)
+            seconds = run_pipeline(header, rows, folder, latency)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+        for stage, s in seconds.items():
+            best[stage] = min(s, best.get(stage, s))
+    return Result(n, {stage: best[stage] for stage in STAGES if stage in best})
+
+
+def print_table(results):
+    width = max(len(s) for s in STAGES)
+    print(f"{'stage':<{width}}" + "".join(f"{r.rows:>12,}" for r in results))
+    for stage in STAGES:
+        print(f"{stage:<{width}}" + "".join(f"{r.seconds.get(stage, float('nan')):>11.3f}s" for r in results))
+    print(f"{'total':<{width}}" + "".join(f"{sum(r.seconds.values()):>11.3f}s" for r in results))
+
+
+def compare(results, baseline, tolerance):
+    # เทียบกับผลที่บันทึกไว้ ; ขั้นตอนที่ช้ากว่าเดิมเกิน tolerance เท่า (และเกิน 10 ms) ถือว่าถดถอย
+    regressions = []
+    for r in results:
+        before = baseline.get(str(r.rows), {})
+        for stage, s in r.seconds.items():
+            old = before.get(stage)
+            if old is not None and s > old * tolerance and s - old > 0.01:
+                regressions.append(f"{r.rows:,} rows / {stage}: {old:.3f}s -> {s:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each dashboard stage on synthetic sensor data")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in SIZES), help="comma separated row counts")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size (best time is kept)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every mock sheet API call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a JSON file written by --save")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor against the baseline")
+    args = parser.parse_args()
+
+    results = []
+    for n in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"[{time.strftime('%H:%M:%S')}] {n:,} rows x{args.repeat}")
+        results.append(benchmark(n, args.repeat, args.latency, args.seed))
+    print_table(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({str(r.rows): r.seconds for r in results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
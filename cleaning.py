@@ -0,0 +1,235 @@
+import numpy as np
+import pandas as pd
+
+from store import TIMEZONE
+
+SENSOR_COLS = ['AirTemp', 'AirHumid', 'LightLux', 'SoilHumid']
+CATEGORY_COLS = ['Fan', 'Pump']     # คอลัมน์สถานะอุปกรณ์ มีค่าไม่กี่แบบ (ON/OFF, MAX/LOW) เก็บเป็น category
+COLUMN_ALIASES = {
+    'Air Humid': 'AirHumid', 'Air Humidity': 'AirHumid',
+    'Soil Humid': 'SoilHumid', 'Soil Humidity': 'SoilHumid',
+    'Light Lux': 'LightLux', 'Lux': 'LightLux',
+    'Air Temp': 'AirTemp', 'Temp': 'AirTemp'
+}
+
+
+def to_sensor_values(values):
+    # แปลงเป็นตัวเลขทั้งคอลัมน์ในครั้งเดียว ใช้ string ops เฉพาะค่าที่ติด '%' หรือเป็นข้อความ
+    values = pd.Series(values, dtype="object")
+    numbers = pd.to_numeric(values, errors='coerce').astype('float64')
+    bad = numbers.isna() & values.notna()
+    if bad.any():
+        text = values[bad].astype(str).str.replace('%', '', regex=False).str.strip()
+        numbers[bad] = pd.to_numeric(text, errors='coerce')
+    return numbers
+
+
+def to_time_index(epoch_seconds):
+    ts = pd.to_numeric(pd.Series(epoch_seconds, dtype="object"), errors='coerce')
+    index = pd.DatetimeIndex(pd.to_datetime(ts, unit='s', utc=True)).tz_convert(TIMEZONE)
+    return index.rename('Time')
+
+
+def chart_times(index):
+    # เวลาไทยแบบไม่มี timezone สำหรับแกน x ของ Plotly (แสดงตามเวลาท้องถิ่นตรงตัว)
+    return index.tz_localize(None)
+
+
+def slice_time(frame, start=None, end=None):
+    # ตัดช่วงเวลา [start, end) ด้วย binary search เมื่อ index เรียงตามเวลา ไม่ต้องสแกนทั้งตาราง
+    # index ที่ไม่เรียง (นาฬิกาอุปกรณ์ย้อน, แก้ไขแถวเก่าในชีต) หรือมี NaT ใช้การกรองทั้งตารางแทน (ผลถูกต้องเสมอ)
+    index = frame.index
+    if not index.is_monotonic_increasing:
+        mask = np.ones(len(index), dtype=bool)
+        if start is not None:
+            mask &= index >= start
+        if end is not None:
+            mask &= index < end
+        return frame[mask]
+    lo = 0 if start is None else index.searchsorted(start, side='left')
+    hi = len(index) if end is None else index.searchsorted(end, side='left')
+    return frame.iloc[lo:hi]
+
+
+def normalize_frame(raw, carry=None):
+    # แปลงข้อมูลดิบเป็นตารางที่พร้อมใช้: ชื่อคอลัมน์มาตรฐาน, เซนเซอร์เป็น float32, index เป็นเวลา
+    # carry คือค่าล่าสุดที่อ่านได้ของแต่ละเซนเซอร์จากชุดก่อนหน้า (ใช้ ffill ต่อเนื่องข้ามชุด)
+    carry = {} if carry is None else carry
+    df = raw.copy(deep=False)
+    df.columns = [str(c).strip() for c in df.columns]
+    df = df.rename(columns=COLUMN_ALIASES)
+
+    if '_ts' in df.columns:
+        df.index = to_time_index(df['_ts'])
+    df = df.drop(columns=[c for c in ('_id', '_ts', '_sheet_row') if c in df.columns])
+
+    for col in SENSOR_COLS:
+        if col in df.columns:
+            numbers = to_sensor_values(df[col])
+            valid = numbers.dropna()
+            if col in carry and len(numbers) and np.isnan(numbers.iloc[0]):
+                numbers.iloc[0] = carry[col]
+            if not valid.empty:
+                carry[col] = float(valid.iloc[-1])
+            df[col] = numbers.ffill().fillna(0).astype('float32').values
+    return df, carry
+
+
+def compact_frame(df):
+    # รูปแบบที่ประหยัดหน่วยความจำสำหรับตารางที่ poller เก็บไว้ใช้ร่วมกันทุก session
+    # เวลาอยู่ใน index แล้ว (int64 epoch ns) จึงไม่เก็บสตริง Timestamp ซ้ำ, Day เป็น Int32, Fan/Pump เป็น category
+    df = df.drop(columns=[c for c in ('Timestamp',) if c in df.columns])
+    if 'Day' in df.columns:
+        day = df['Day']
+        complete = True
+        if not pd.api.types.is_numeric_dtype(day):
+            text = day.astype(str).str.strip()
+            present = day.notna() & (text != '')
+            day = pd.to_numeric(text.where(present), errors='coerce')
+            complete = day.notna().sum() == present.sum()
+        # แปลงเฉพาะเมื่อทุกค่าเป็นจำนวนเต็ม (ค่าอื่นเก็บแบบเดิม ไม่ทำให้ข้อมูลหาย)
+        if complete and (day.dropna() % 1 == 0).all():
+            df['Day'] = day.astype('Int32')
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            values = df[col]
+            text = values.astype(str).str.strip().str.upper()
+            df[col] = text.where(values.notna()).astype('category')
+    return df
+
+
+def _buffer_values(series):
+    # ค่าของคอลัมน์ในรูปแบบที่เขียนต่อท้ายลง buffer ได้: float (numpy), category/Int32/เวลา (pandas array)
+    # ชนิดอื่น (ข้อความ ฯลฯ) เก็บเป็น object ; str ของ pandas 3 แก้ไขทีละช่วงไม่ได้ (ต้อง copy ทั้ง array)
+    values = series.array
+    if isinstance(values.dtype, (pd.CategoricalDtype, pd.DatetimeTZDtype)) or values.dtype.kind in 'iub' and pd.api.types.is_extension_array_dtype(values.dtype):
+        return values
+    values = np.asarray(values)
+    return values if values.dtype.kind == 'f' else values.astype(object)
+
+
+def _empty_like(values, capacity):
+    # array ว่าง (ค่า NA ทั้งหมด) ชนิดเดียวกับ values
+    if isinstance(values, np.ndarray):
+        out = np.empty(capacity, dtype=values.dtype)
+        out[:] = np.nan if values.dtype.kind == 'f' else None
+        return out
+    return values.take(np.full(capacity, -1), allow_fill=True)
+
+
+def _resize(values, start, stop, capacity):
+    out = _empty_like(values, capacity)
+    out[:stop - start] = values[start:stop]
+    return out
+
+
+def _fit(buffer, values):
+    # ปรับ buffer ให้รับ values ได้ (เพิ่ม category ใหม่ หรือเปลี่ยนเป็น object เมื่อชนิดไม่ตรงกัน) ; เกิดไม่บ่อย
+    if isinstance(buffer.dtype, pd.CategoricalDtype) and isinstance(values.dtype, pd.CategoricalDtype):
+        if values.categories.difference(buffer.categories).empty:
+            return buffer
+        return buffer.set_categories(buffer.categories.union(values.categories))
+    if buffer.dtype == values.dtype or (isinstance(buffer, np.ndarray) and buffer.dtype.kind == values.dtype.kind == 'f'):
+        return buffer
+    return np.asarray(buffer, dtype=object)
+
+
+# --- ขั้นตอนทำความสะอาดข้อมูลแบบต่อเนื่อง (Incremental) ---
+# ทำความสะอาดทั้งตารางเพียงครั้งแรก หลังจากนั้นประมวลผลเฉพาะแถวที่เข้ามาใหม่
+# ผลลัพธ์ผูกกับเลข _id ล่าสุดของฐานข้อมูล (last_id) ใช้เป็น version ของข้อมูล
+# แถวที่ทำความสะอาดแล้วเก็บใน buffer ต่อคอลัมน์ที่จองพื้นที่เผื่อไว้ (ขยายทีละ GROWTH เท่า)
+# แถวใหม่เขียนต่อท้ายในที่ว่าง ไม่ต้อง pd.concat ทั้งตารางทุกรอบ ; frame คือ DataFrame ที่อ้างถึง buffer
+# (ไม่ copy) ช่วงแถวที่เผยแพร่แล้วไม่ถูกแก้ไขอีก session ที่อ่าน frame เดิมอยู่จึงเห็นข้อมูลชุดเดิมเสมอ
+class SensorCleaner:
+    MIN_CAPACITY = 1024
+    GROWTH = 1.5
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.index = None       # buffer ของเวลา (DatetimeArray)
+        self.columns = {}       # ชื่อคอลัมน์ -> buffer
+        self.size = 0           # จำนวนแถวที่ใช้งานใน buffer
+        self.frame = pd.DataFrame()
+        self.carry = {}
+        self.last_id = 0
+
+    def _capacity(self):
+        return 0 if self.index is None else len(self.index)
+
+    def _reserve(self, rows):
+        capacity = max(self.size + rows, int(self._capacity() * self.GROWTH), self.MIN_CAPACITY)
+        self.index = _resize(self.index, 0, self.size, capacity)
+        self.columns = {col: _resize(values, 0, self.size, capacity) for col, values in self.columns.items()}
+
+    def _append(self, chunk):
+        n, k = self.size, len(chunk)
+        if self.index is None:
+            self.index = _empty_like(chunk.index.array, 0)
+        if n + k > self._capacity():
+            self._reserve(k)
+        self.index[n:n + k] = chunk.index.array
+        for col in chunk.columns:
+            values = _buffer_values(chunk[col])
+            buffer = self.columns.get(col)
+            # คอลัมน์ใหม่: แถวก่อนหน้าเป็น NA ; คอลัมน์ที่ chunk ไม่มีเป็น NA อยู่แล้ว (ที่ว่างท้าย buffer)
+            buffer = _empty_like(values, self._capacity()) if buffer is None else _fit(buffer, values)
+            if isinstance(buffer.dtype, pd.CategoricalDtype):
+                # chunk ที่คืนไปใช้ชุด category เดียวกับตารางหลัก (ขั้นตอนถัดไปรวมผลกันได้ตรง)
+                if buffer.dtype != values.dtype:
+                    values = values.set_categories(buffer.categories)
+                    chunk[col] = values
+            elif isinstance(buffer, np.ndarray) and buffer.dtype == object:
+                values = np.asarray(values, dtype=object)
+            buffer[n:n + k] = values
+            self.columns[col] = buffer
+        self.size = n + k
+        self._publish()
+
+    def _publish(self):
+        n = self.size
+        index = pd.DatetimeIndex(self.index[:n], copy=False, name='Time')
+        self.frame = pd.DataFrame({col: values[:n] for col, values in self.columns.items()}, index=index, copy=False)
+
+    def __getstate__(self):
+        # บันทึกเฉพาะแถวที่ใช้งาน (ไม่รวมที่ว่างท้าย buffer) ; frame สร้างใหม่จาก buffer ตอนโหลด
+        state = self.__dict__.copy()
+        del state['frame']
+        if self.index is not None:
+            state['index'] = self.index[:self.size].copy()
+            state['columns'] = {col: values[:self.size].copy() for col, values in self.columns.items()}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.frame = pd.DataFrame()
+        if self.index is not None:
+            self._publish()
+
+    def update(self, raw):
+        # raw ต้องมีคอลัมน์ _id และ _ts (จาก SensorStore.load(with_internal=True))
+        # คืนค่าเฉพาะแถวใหม่ที่ทำความสะอาดแล้ว ให้ขั้นตอนถัดไปอัปเดตต่อแบบ incremental
+        if raw.empty:
+            return raw.iloc[0:0]
+        last_id = int(raw['_id'].iloc[-1])
+        chunk, self.carry = normalize_frame(raw, self.carry)
+        chunk = compact_frame(chunk)
+        self._append(chunk)
+        self.last_id = last_id
+        return chunk
+
+    def trim(self, before):
+        # เก็บเฉพาะแถวตั้งแต่ before (ข้อมูลเก่ากว่านั้นยังอยู่ในฐานข้อมูล อ่านได้จาก store เมื่อจำเป็น)
+        # ตัดตามตำแหน่งแถวแรกที่ใหม่กว่า before แถวที่ไม่มีเวลาหลังจากนั้นยังอยู่ครบ
+        newer = np.flatnonzero(self.frame.index >= before)
+        start = newer[0] if len(newer) else self.size
+        if start:
+            # ย้ายแถวที่เหลือไป buffer ใหม่ (ปล่อยหน่วยความจำของแถวเก่า) ; ตัดเป็นช่วง ๆ ตาม retention จึงไม่เกิดทุกรอบ
+            live = self.size - start
+            capacity = max(int(live * self.GROWTH), self.MIN_CAPACITY)
+            self.index = _resize(self.index, start, self.size, capacity)
+            self.columns = {col: _resize(values, start, self.size, capacity) for col, values in self.columns.items()}
+            self.size = live
+            self._publish()
+        return start
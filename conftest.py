@@ -0,0 +1,27 @@
+# ให้ pytest import โมดูลของโปรเจกต์ (app/poller/...) จากโฟลเดอร์นี้ได้โดยตรง
+import pytest
+
+from benchmark import synthetic_rows
+from cleaning import SensorCleaner
+from store import SensorStore
+
+SENSOR_ROWS = 3000      # 25 ชั่วโมง แถวละ 30 วินาที รอบการทดลองใหม่เริ่มที่แถว 1000 และ 2000
+# จุดแบ่ง chunk สำหรับทดสอบการอัปเดตแบบ incremental: แถวเดียว, กลางช่วงเวลา, ตรงจุดเริ่มรอบใหม่
+# และตรงจุดที่ปั๊มเริ่มรดน้ำ (แถว 1440 = 12 ชม.)
+SENSOR_SPLITS = [0, 1, 7, 500, 1000, 1001, 1440, 2000, 2500, SENSOR_ROWS]
+
+
+@pytest.fixture(scope="session")
+def sensor_frame(tmp_path_factory):
+    # ข้อมูลจำลองที่ทำความสะอาดแล้วแบบเดียวกับที่ poller ส่งให้ขั้นตอนถัดไป (ห้ามแก้ไขในการทดสอบ)
+    header, rows = synthetic_rows(SENSOR_ROWS)
+    store = SensorStore(str(tmp_path_factory.mktemp("sensors") / "sensors.sqlite"))
+    store.append_rows(header, rows)
+    cleaner = SensorCleaner()
+    cleaner.update(store.load(with_internal=True))
+    return cleaner.frame
+
+
+@pytest.fixture(scope="session")
+def sensor_chunks(sensor_frame):
+    return [sensor_frame.iloc[lo:hi] for lo, hi in zip(SENSOR_SPLITS, SENSOR_SPLITS[1:])]
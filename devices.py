@@ -0,0 +1,128 @@
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from poller import SensorPoller
+from sheets import SheetTail
+from store import DB_PATH, SensorStore
+from sync import sync_once
+
+DEFAULT_ID = "default"
+DEVICE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+MAX_WORKERS = 4     # จำนวนแปลงที่ดึงข้อมูลพร้อมกันสูงสุด (จำกัดการเรียก Sheets API พร้อมกัน)
+
+# แปลงปลูก/อุปกรณ์ 1 ชุด ; spreadsheet/worksheet คือที่อยู่ชีตที่ ESP32 ของแปลงนั้นเขียนข้อมูล
+# worksheet เป็นชื่อชีตหรือลำดับชีต (None = ชีตแรก)
+Device = namedtuple("Device", ["id", "name", "spreadsheet", "worksheet"])
+
+DEFAULT_DEVICE = Device(DEFAULT_ID, "แปลงหลัก", "Project IOT", None)
+
+
+def load_devices(secrets):
+    # อ่านรายการแปลงจาก [[devices]] ใน secrets.toml ; ถ้าไม่กำหนดใช้แปลงเดียวแบบเดิม
+    entries = secrets.get("devices") or []
+    if not entries:
+        return [DEFAULT_DEVICE]
+
+    devices = []
+    for entry in entries:
+        device_id = str(entry["id"])
+        if not DEVICE_ID.match(device_id):
+            raise ValueError(f"invalid device id: {device_id!r}")
+        devices.append(Device(
+            device_id, entry.get("name", device_id),
+            entry.get("spreadsheet", DEFAULT_DEVICE.spreadsheet), entry.get("worksheet")
+        ))
+    if len({d.id for d in devices}) != len(devices):
+        raise ValueError("duplicate device id in [[devices]]")
+    return devices
+
+
+def device_db_path(device_id):
+    # แต่ละแปลงมีไฟล์ฐานข้อมูลของตัวเอง (แปลงหลักใช้ไฟล์เดิม ข้อมูลเก่าจึงใช้ต่อได้)
+    if device_id == DEFAULT_ID:
+        return DB_PATH
+    return os.path.join(os.path.dirname(DB_PATH), "devices", f"{device_id}.sqlite")
+
+
+def device_sync(sheets, device, store):
+    # ฟังก์ชัน sync ชีตของแปลงนี้ลงฐานข้อมูลของแปลงนี้
+    def sync():
+        worksheet = lambda: sheets.worksheet(device.worksheet, spreadsheet=device.spreadsheet)
+        return sheets.run(lambda: sync_once(SheetTail(worksheet()), store, device.id))
+    return sync
+
+
+# --- ตัวดึงข้อมูลของทุกแปลง (1 thread จัดคิว + thread pool จำกัดขนาด) ---
+# แต่ละแปลงมี SensorPoller (สถานะ cleaner/rollup/trial/...) ของตัวเอง และถูกนัดดึงข้อมูลแยกกัน
+# แปลงที่ช้าหรือล่มไม่ทำให้แปลงอื่นรอ เวลาต่อแปลงจึงคงที่แม้จำนวนแปลงเพิ่มขึ้น (ตราบที่ไม่เกิน pool)
+class FleetPoller(threading.Thread):
+    def __init__(self, pollers, interval=30, max_workers=MAX_WORKERS):
+        super().__init__(name="fleet-poller", daemon=True)
+        self.pollers = dict(pollers)
+        self.interval = interval
+        self.pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(self.pollers))), thread_name_prefix="device-poll")
+        self.polled = set()
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        if all(p.ready.is_set() for p in self.pollers.values()):
+            # ทุกแปลงโหลดสถานะที่บันทึกไว้แล้ว (warm start) หน้าจอแสดงผลได้ทันทีไม่ต้องรอ poll รอบแรก
+            self.ready.set()
+
+    def snapshot(self, device_id):
+        return self.pollers[device_id].snapshot
+
+    def _poll(self, device_id):
+        poller = self.pollers[device_id]
+        try:
+            poller.poll_once()
+        except Exception as e:
+            poller.snapshot = poller.snapshot._replace(error=str(e))
+        return device_id
+
+    def run(self):
+        due = dict.fromkeys(self.pollers, 0.0)
+        running = {}
+        while not self.stopped.is_set():
+            now = time.monotonic()
+            for device_id in self.pollers:
+                if device_id not in running and due[device_id] <= now:
+                    running[device_id] = self.pool.submit(self._poll, device_id)
+
+            # รอจนกว่าจะมีแปลงที่ดึงเสร็จ หรือถึงเวลานัดของแปลงถัดไป
+            idle = [due[d] for d in self.pollers if d not in running]
+            timeout = max(0.0, min(idle, default=now + self.interval) - now)
+            done, _ = wait(list(running.values()), timeout=timeout, return_when=FIRST_COMPLETED) if running else (set(), set())
+            if not running:
+                self.stopped.wait(timeout)
+            for future in done:
+                device_id = future.result()
+                del running[device_id]
+                due[device_id] = time.monotonic() + self.interval
+                self.polled.add(device_id)
+            if len(self.polled) == len(self.pollers):
+                self.ready.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.pool.shutdown(wait=False)
+
+
+def device_state_path(device_id):
+    # ไฟล์สถานะของ poller (warm start) อยู่คู่กับฐานข้อมูลของแปลงนั้น
+    return f"{device_db_path(device_id)}.state"
+
+
+def build_fleet(devices, sheets=None, interval=30, max_workers=MAX_WORKERS):
+    # sheets=None คือโหมด ingest: ไม่ sync จากชีต อ่านจากฐานข้อมูลของแต่ละแปลงอย่างเดียว
+    pollers = {}
+    for device in devices:
+        store = SensorStore(device_db_path(device.id))
+        sync = None if sheets is None else device_sync(sheets, device, store)
+        poller = SensorPoller(store, sync=sync, interval=interval, device_id=device.id, state_path=device_state_path(device.id))
+        poller.restore()
+        pollers[device.id] = poller
+    return FleetPoller(pollers, interval=interval, max_workers=max_workers)
@@ -0,0 +1,64 @@
+import numpy as np
+
+# จำนวนจุดสูงสุดต่อเส้นกราฟ (ประมาณความกว้างพิกเซลของกราฟแบบ wide layout)
+MAX_POINTS = 1500
+
+
+def lttb_indices(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: เลือกจุดที่ทำให้พื้นที่สามเหลี่ยมกับ bucket ข้าง ๆ ใหญ่ที่สุด
+    # คงรูปทรงของกราฟและยอดแหลม (เช่นความชื้นดินพุ่งตอนปั๊มทำงาน) ไว้ได้ดีกว่าการสุ่มทุก n แถว
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # จุดเฉลี่ยของ bucket ถัดไป (bucket สุดท้ายใช้จุดท้ายสุด)
+        if i + 2 < len(edges):
+            avg_x = x[end:edges[i + 2]].mean()
+            avg_y = y[end:edges[i + 2]].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def minmax_indices(y, n_out):
+    # แบ่งเป็น n_out/2 ช่วง แล้วเก็บจุดต่ำสุดและสูงสุดของแต่ละช่วง (ค่ายอดไม่หายแน่นอน)
+    n = len(y)
+    buckets = max(1, n_out // 2)
+    if n_out >= n:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype='float64')
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(buckets, size)
+    valid = ~np.all(np.isnan(grid), axis=1)
+    offsets = np.arange(buckets)[valid] * size
+    lo = offsets + np.nanargmin(grid[valid], axis=1)
+    hi = offsets + np.nanargmax(grid[valid], axis=1)
+    return np.unique(np.concatenate([lo, hi, [0, n - 1]]))
+
+
+def downsample_series(series, n_out=MAX_POINTS, method='lttb'):
+    # ลดจำนวนจุดของ Series ที่มี DatetimeIndex ให้เหลือประมาณ n_out จุดก่อนส่งไปที่เบราว์เซอร์
+    if len(series) <= n_out:
+        return series
+    if method == 'minmax':
+        picked = minmax_indices(series.values, n_out)
+    else:
+        picked = lttb_indices(series.index.asi8, series.values, n_out)
+    return series.iloc[picked]
@@ -0,0 +1,82 @@
+import gzip
+import tempfile
+
+from cleaning import COLUMN_ALIASES, SENSOR_COLS, normalize_frame, to_sensor_values
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet เป็นตัวเลือกเสริม ใช้ได้เมื่อติดตั้ง pyarrow
+    pa = pq = None
+
+# ชื่อที่แสดง -> (นามสกุลไฟล์, MIME type)
+EXPORT_FORMATS = {
+    'CSV (.csv)': ('csv', 'text/csv'),
+    'CSV บีบอัด (.csv.gz)': ('csv.gz', 'application/gzip'),
+}
+if pq is not None:
+    EXPORT_FORMATS['Parquet (.parquet)'] = ('parquet', 'application/vnd.apache.parquet')
+
+SPOOL_LIMIT = 16 * 1024 * 1024  # ไฟล์เล็กกว่านี้อยู่ในหน่วยความจำ ใหญ่กว่านี้เขียนลงดิสก์ชั่วคราว
+
+
+def seed_carry(store, start_ts):
+    # ค่าล่าสุดที่อ่านได้ของแต่ละเซนเซอร์ก่อนแถวแรกของช่วงที่ export
+    # ช่องว่างต้นช่วงจึงได้ค่าเดียวกับตารางที่ทำความสะอาดแล้วของ Dashboard (ไม่ใช่ 0)
+    carry = {}
+    first = store.first_id(start_ts)
+    if first is None:
+        return carry
+    for col in store.columns():
+        name = COLUMN_ALIASES.get(str(col).strip(), str(col).strip())
+        if name in SENSOR_COLS and name not in carry:
+            valid = to_sensor_values(store.recent_values(col, first)).dropna()
+            if not valid.empty:
+                carry[name] = float(valid.iloc[0])
+    return carry
+
+
+def iter_clean_chunks(store, start_ts=None, end_ts=None, chunksize=10000):
+    # อ่านจากฐานข้อมูลทีละก้อนแล้วทำความสะอาดแบบเดียวกับ Dashboard (ffill ต่อเนื่องข้ามก้อน)
+    carry = {} if start_ts is None else seed_carry(store, start_ts)
+    for raw in store.iter_chunks(start_ts, end_ts, chunksize=chunksize, with_internal=True):
+        chunk, carry = normalize_frame(raw, carry)
+        yield chunk
+
+
+def _write_csv(chunks, stream):
+    stream.write(b'\xef\xbb\xbf')  # BOM ให้ Excel อ่านภาษาไทยได้ (เหมือน utf-8-sig เดิม)
+    for i, chunk in enumerate(chunks):
+        stream.write(chunk.to_csv(index=False, header=(i == 0)).encode('utf-8'))
+
+
+def _write_parquet(chunks, out):
+    writer = None
+    for chunk in chunks:
+        # คอลัมน์ข้อความ (Day/Fan/Pump/Timestamp) แปลงเป็น string ทั้งหมดให้ schema ทุกก้อนตรงกัน
+        chunk = chunk.reset_index()
+        for col in chunk.columns:
+            if col not in SENSOR_COLS and col != 'Time':
+                chunk[col] = chunk[col].astype(str)
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(out, table.schema, compression='zstd')
+        writer.write_table(table.cast(writer.schema))
+    if writer is not None:
+        writer.close()
+
+
+def export_file(store, fmt, start_ts=None, end_ts=None, chunksize=10000):
+    # สร้างไฟล์ export ทีละก้อนจากฐานข้อมูล เรียกเฉพาะตอนผู้ใช้กดดาวน์โหลดเท่านั้น
+    # คืนค่าเป็น bytes (st.download_button แบบ deferred รับเฉพาะ bytes/str/ไฟล์จริง ไม่รับ SpooledTemporaryFile)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_LIMIT) as out:
+        chunks = iter_clean_chunks(store, start_ts, end_ts, chunksize)
+        if fmt == 'parquet':
+            _write_parquet(chunks, out)
+        elif fmt == 'csv.gz':
+            with gzip.GzipFile(fileobj=out, mode='wb') as gz:
+                _write_csv(chunks, gz)
+        else:
+            _write_csv(chunks, out)
+        out.seek(0)
+        return out.read()
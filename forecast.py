@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from cleaning import SENSOR_COLS
+
+STEP = '10min'                      # ความละเอียดของโมเดลและของเส้นพยากรณ์
+SLOTS_PER_DAY = 24 * 6              # จำนวนช่วง 10 นาทีใน 1 วัน
+HORIZON_STEPS = 36                  # พยากรณ์ล่วงหน้า 36 x 10 นาที = 6 ชม.
+MIN_BUCKETS = 6                     # ต้องมีข้อมูลอย่างน้อย 1 ชม. ก่อนแสดงเส้นพยากรณ์
+BASELINE_WEIGHT = 0.2               # น้ำหนักของวันล่าสุดในค่าฐานรายวัน (จำย้อนหลังประมาณ 5 วัน)
+LEVEL_TAU = 1.0                     # ชม. ; ความไวของค่าส่วนต่างจากค่าฐาน (exponential smoothing)
+DECAY_TAU = 2.0                     # ชม. ; ส่วนต่างจะค่อย ๆ กลับสู่ค่าฐานเมื่อพยากรณ์ไกลขึ้น
+
+# ขอบเขตค่าที่เป็นไปได้ของแต่ละเซนเซอร์ (ตัดค่าพยากรณ์ให้อยู่ในช่วงนี้)
+BOUNDS = {'AirHumid': (0, 100), 'SoilHumid': (0, 100), 'LightLux': (0, None)}
+
+
+# --- โมเดลพยากรณ์ 6 ชม. (ค่าฐานตามเวลาของวัน + exponential smoothing) ---
+# ค่าฐาน: ค่าเฉลี่ยถ่วงน้ำหนักของแต่ละช่วง 10 นาทีของวัน (กลางวัน/กลางคืนของแสง อุณหภูมิ ฯลฯ)
+# ส่วนต่าง: ค่าจริงลบค่าฐาน ปรับแบบ exponential smoothing ตามเวลาจริงที่ผ่านไป (ข้อมูลขาดช่วงก็ไม่เพี้ยน)
+# อัปเดตเฉพาะแถวใหม่ และคำนวณทุกเซนเซอร์พร้อมกันเป็น array เดียว
+class SensorForecaster:
+    def __init__(self, cols=SENSOR_COLS):
+        self.cols = list(cols)
+        self.reset()
+
+    def reset(self):
+        n = len(self.cols)
+        self.baseline = np.full((SLOTS_PER_DAY, n), np.nan)
+        self.level = np.zeros(n)
+        self.level_time = None          # เวลาของช่วงล่าสุดที่รวมเข้าโมเดลแล้ว
+        self.buckets = 0
+        # ช่วง 10 นาทีปัจจุบันที่ยังไม่ครบ (เก็บผลรวมไว้ก่อน รวมเข้าโมเดลเมื่อมีข้อมูลช่วงถัดไป)
+        self.pending_time = None
+        self.pending_sum = np.zeros(n)
+        self.pending_count = 0
+        self.last_time = None
+        self.last_values = np.full(n, np.nan)
+
+    def _slot(self, t):
+        return (t.hour * 60 + t.minute) // 10
+
+    def _smoothed(self, level, level_time, t, values):
+        # ค่าส่วนต่างใหม่หลังรวมค่าที่เวลา t (alpha ขึ้นกับระยะเวลาที่ผ่านไปจริง)
+        base = self.baseline[self._slot(t)]
+        resid = np.where(np.isnan(base), 0.0, values - base)
+        if level_time is None:
+            return resid
+        hours = (t - level_time) / pd.Timedelta(hours=1)
+        alpha = 1 - np.exp(-max(hours, 0) / LEVEL_TAU)
+        return level + alpha * (resid - level)
+
+    def _fold(self, t, values):
+        slot = self._slot(t)
+        self.level = self._smoothed(self.level, self.level_time, t, values)
+        self.level_time = t
+        base = self.baseline[slot]
+        self.baseline[slot] = np.where(np.isnan(base), values, base + BASELINE_WEIGHT * (values - base))
+        self.buckets += 1
+
+    def update(self, chunk):
+        cols = [c for c in self.cols if c in chunk.columns]
+        chunk = chunk[chunk.index.notna()]
+        if chunk.empty or not cols:
+            return
+
+        values = chunk.reindex(columns=self.cols).to_numpy(dtype='float64')
+        buckets = chunk.index.floor(STEP)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        sums = np.add.reduceat(values, starts, axis=0)
+        counts = np.diff(np.r_[starts, len(values)])
+
+        for t, s, c in zip(buckets[starts], sums, counts):
+            if self.pending_time is not None and t != self.pending_time:
+                self._fold(self.pending_time, self.pending_sum / self.pending_count)
+                self.pending_sum = np.zeros(len(self.cols))
+                self.pending_count = 0
+            self.pending_time = t
+            self.pending_sum = self.pending_sum + s
+            self.pending_count += c
+
+        self.last_time = chunk.index[-1]
+        self.last_values = values[-1]
+
+    def forecasts(self):
+        # คืน dict {คอลัมน์: Series ค่าพยากรณ์ 6 ชม. ข้างหน้า} เริ่มจากค่าล่าสุดที่วัดได้
+        if self.buckets < MIN_BUCKETS or self.last_time is None:
+            return {}
+
+        level = self.level
+        if self.pending_count:
+            level = self._smoothed(level, self.level_time, self.pending_time, self.pending_sum / self.pending_count)
+        steps = pd.to_timedelta(np.arange(1, HORIZON_STEPS + 1) * 10, unit='min')
+        times = self.last_time + steps
+        slots = np.asarray((times.hour * 60 + times.minute) // 10)
+        decay = np.exp(-np.asarray(steps / pd.Timedelta(hours=1)) / DECAY_TAU)
+
+        base = self.baseline[slots]
+        predicted = np.where(np.isnan(base), self.last_values, base + decay[:, None] * level)
+        index = pd.DatetimeIndex([self.last_time]).append(times).rename('Time')
+
+        result = {}
+        for i, col in enumerate(self.cols):
+            if np.isnan(self.last_values[i]):
+                continue
+            future = predicted[:, i]
+            if col in BOUNDS:
+                future = np.clip(future, *BOUNDS[col])
+            values = np.concatenate([[self.last_values[i]], future])
+            result[col] = pd.Series(values, index=index, name=col)
+        return result
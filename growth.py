@@ -0,0 +1,173 @@
+import hashlib
+import json
+import math
+import threading
+import time
+
+import pandas as pd
+from gspread.utils import ValueRenderOption, a1_range_to_grid_range, rowcol_to_a1
+
+from metrics import METRICS
+
+
+class GrowthConflictError(Exception):
+    # ข้อมูลบนชีตถูกแก้ไขโดยผู้ใช้อื่นหลังจากที่เราโหลดมา
+    pass
+
+
+def _canonical(value):
+    # เทียบค่าแบบไม่สนรูปแบบ: 2, 2.0, "2" ถือว่าเท่ากัน ; None/NaN/"" คือช่องว่าง
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    try:
+        return repr(float(value))
+    except (TypeError, ValueError):
+        return str(value).strip()
+
+
+def _trim(grid):
+    # ตัดช่องว่างท้ายแถวและแถวว่างท้ายตาราง ให้ตรงกับสิ่งที่ Google Sheets คืนมา
+    rows = [[_canonical(v) for v in row] for row in grid]
+    rows = [row[:max((i + 1 for i, v in enumerate(row) if v), default=0)] for row in rows]
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+def grid_version(grid):
+    return hashlib.sha1(json.dumps(_trim(grid), ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def frame_to_grid(df):
+    values = df.astype(object).where(df.notna(), '')
+    return [list(map(str, df.columns))] + values.values.tolist()
+
+
+def grid_to_frame(grid):
+    if len(grid) < 2:
+        return pd.DataFrame()
+    loaded_df = pd.DataFrame(grid[1:], columns=grid[0])
+    # ✅ บังคับให้ข้อมูลทุกคอลัมน์ (ยกเว้น Period) เป็นเลขทศนิยม (Float) เสมอ
+    for col in loaded_df.columns:
+        if col != 'Period':
+            loaded_df[col] = pd.to_numeric(loaded_df[col], errors='coerce').astype(float)
+    return loaded_df
+
+
+def read_growth_grid(sheet):
+    return sheet.get_all_values(value_render_option=ValueRenderOption.unformatted)
+
+
+def load_growth(sheet):
+    # คืนค่า (DataFrame, version, grid) ; version ใช้ตรวจการแก้ไขชนกันตอนบันทึก grid คือค่าในชีตตอนโหลด
+    grid = read_growth_grid(sheet)
+    return grid_to_frame(grid), grid_version(grid), grid
+
+
+def changed_ranges(old_grid, new_grid):
+    # หาช่วงเซลล์ที่เปลี่ยนแปลง (ติดกันในแถวเดียวกันรวมเป็นช่วงเดียว) สำหรับ batch_update
+    n_rows = max(len(old_grid), len(new_grid))
+    n_cols = max([len(r) for r in old_grid] + [len(r) for r in new_grid] + [0])
+    updates = []
+    for r in range(n_rows):
+        old_row = list(old_grid[r]) if r < len(old_grid) else []
+        new_row = list(new_grid[r]) if r < len(new_grid) else []
+        old_row += [''] * (n_cols - len(old_row))
+        new_row += [''] * (n_cols - len(new_row))
+        c = 0
+        while c < n_cols:
+            if _canonical(old_row[c]) == _canonical(new_row[c]):
+                c += 1
+                continue
+            start = c
+            while c < n_cols and _canonical(old_row[c]) != _canonical(new_row[c]):
+                c += 1
+            updates.append({
+                'range': f"{rowcol_to_a1(r + 1, start + 1)}:{rowcol_to_a1(r + 1, c)}",
+                'values': [new_row[start:c]]
+            })
+    return updates
+
+
+def _row_values(row, width):
+    # ค่าแบบเทียบได้ของ width เซลล์แรก (Google Sheets ตัดช่องว่างท้ายแถวออก)
+    row = list(row) + [''] * (width - len(row))
+    return [_canonical(v) for v in row[:width]]
+
+
+def _range_values(grid, a1_range):
+    # ค่าในช่วงเซลล์ (แถวเดียว แบบที่ changed_ranges สร้าง) ของ grid ; เซลล์นอกตารางถือเป็นช่องว่าง
+    bounds = a1_range_to_grid_range(a1_range)
+    row = grid[bounds['startRowIndex']] if bounds['startRowIndex'] < len(grid) else []
+    return _row_values(row, bounds['endColumnIndex'])[bounds['startColumnIndex']:]
+
+
+def save_growth(sheet, df, base_version, base_grid=None):
+    # บันทึกเฉพาะเซลล์ที่เปลี่ยน ด้วย batch_update ครั้งเดียว (ไม่ clear ชีต จึงไม่มีช่วงที่ชีตว่าง)
+    # base_grid คือค่าในชีตตอนโหลด: อ่านซ้ำเฉพาะช่วงที่จะเขียน (batch_get ครั้งเดียว ไม่โหลดทั้งชีต)
+    # ถ้าค่าในช่วงนั้นไม่ตรงกับที่โหลดมา แปลว่ามีคนแก้เซลล์เดียวกันก่อน -> GrowthConflictError
+    # (เซลล์อื่นที่คนอื่นแก้ไม่ถูกเขียนทับอยู่แล้ว) ; ไม่มี base_grid อ่านทั้งชีตแล้วเทียบ version แทน
+    # ข้อจำกัด: Sheets API ไม่มีการเขียนแบบมีเงื่อนไข การตรวจกับการเขียนเป็นคนละ request
+    # process อื่นที่เขียนเซลล์เดียวกันในช่วงระหว่างสอง request นี้ยังถูกทับได้ (ช่วงสั้นลง แต่ไม่ใช่ atomic)
+    new_grid = frame_to_grid(df)
+    if base_grid is None:
+        base_grid = read_growth_grid(sheet)
+        if grid_version(base_grid) != base_version:
+            raise GrowthConflictError("Growth_Data was changed by another user")
+        updates = changed_ranges(base_grid, new_grid)
+    else:
+        updates = changed_ranges(base_grid, new_grid)
+        if updates:
+            current = sheet.batch_get([u['range'] for u in updates], value_render_option=ValueRenderOption.unformatted)
+            for update, values in zip(updates, current):
+                expected = _range_values(base_grid, update['range'])
+                if _row_values(values[0] if values else [], len(expected)) != expected:
+                    raise GrowthConflictError("Growth_Data was changed by another user")
+    if updates:
+        sheet.batch_update(updates)
+    return grid_version(new_grid)
+
+
+# --- cache ข้อมูลการเติบโตที่ใช้ร่วมกันทุก session ---
+# ทุก session อ่านจากที่นี่ (ไม่เรียก API ซ้ำ) และเห็นการบันทึกของกันและกันทันที
+# version เปลี่ยนทุกครั้งที่มีการบันทึก ใช้ตรวจว่าผู้ใช้กำลังแก้ไขข้อมูลชุดล่าสุดอยู่หรือไม่
+class GrowthCache:
+    MAX_AGE = 10 * 60  # โหลดจากชีตใหม่เป็นระยะ เผื่อมีคนแก้ไขในชีตโดยตรง
+
+    def __init__(self, get_sheet):
+        self.get_sheet = get_sheet
+        self.lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        self.frame = None
+        self.version = None
+        self.grid = None        # ค่าในชีตที่ตรงกับ frame ใช้หาเซลล์ที่เปลี่ยนตอนบันทึก
+        self.loaded_at = 0
+
+    def get(self):
+        # คืนค่า (สำเนา DataFrame, version) ให้ session นำไปแก้ไขได้โดยไม่กระทบ cache
+        with self.lock:
+            if self.frame is None or time.monotonic() - self.loaded_at > self.MAX_AGE:
+                METRICS.inc('mg_cache_total', cache='growth', result='miss')
+                self.frame, self.version, self.grid = load_growth(self.get_sheet())
+                self.loaded_at = time.monotonic()
+            else:
+                METRICS.inc('mg_cache_total', cache='growth', result='hit')
+            return self.frame.copy(), self.version
+
+    def save(self, df, base_version):
+        with self.lock:
+            if self.frame is not None and base_version != self.version:
+                # อีก session บันทึกไปแล้ว ไม่ต้องเรียก API ก็รู้ว่าชนกัน
+                raise GrowthConflictError("Growth_Data was changed by another session")
+            try:
+                version = save_growth(self.get_sheet(), df, base_version, self.grid)
+            except GrowthConflictError:
+                self.invalidate()
+                raise
+            self.frame = df.copy()
+            self.grid = frame_to_grid(df)
+            self.version = version
+            self.loaded_at = time.monotonic()
+            return version
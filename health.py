@@ -0,0 +1,222 @@
+import math
+import operator
+from collections import deque, namedtuple
+
+import pandas as pd
+
+OPERATORS = {'>': operator.gt, '<': operator.lt}
+MAX_GAP = 10 * 60   # วินาที ; ช่วงที่ข้อมูลขาดหายนานกว่านี้ไม่นับเป็นเวลาที่เกินเกณฑ์
+
+# ช่วงเวลาของสถิติแบบเลื่อน (ปรับได้ผ่าน HealthEngine(windows=...))
+WINDOWS = {
+    'mold': pd.Timedelta(minutes=20),       # ค่าเฉลี่ยอุณหภูมิ/ความชื้นสะสมสำหรับความเสี่ยงเชื้อรา
+    'exposure': pd.Timedelta(hours=6),      # เวลาที่ค่าอยู่นอกเกณฑ์สะสม
+}
+# เกณฑ์ที่นับเวลาสะสม: คอลัมน์ -> ((เครื่องหมาย, ค่า), ...)
+EXPOSURE_LIMITS = {
+    'AirTemp': (('>', 30),),
+    'AirHumid': (('>', 80),),
+    'SoilHumid': (('<', 40), ('>', 85)),
+}
+
+# ข้อความของแต่ละกฎตามระดับ (error / warning / success ตรงกับ st.error / st.warning / st.success)
+RULE_MESSAGES = {
+    'mold': {
+        'error': ("🔴 เสี่ยงสูงมาก (High Risk)", "อากาศร้อนชื้นจัดอย่างต่อเนื่อง เสี่ยงเกิดโรคโคนเน่า"),
+        'warning': ("🟡 เฝ้าระวัง (Warning)", "อากาศเริ่มอบอ้าวสะสม ควรรักษาการถ่ายเทอากาศให้ดี"),
+        'success': ("🟢 ปลอดภัย (Safe)", "สภาพอากาศโดยเฉลี่ยถ่ายเทดี อยู่ในเกณฑ์ปกติ"),
+    },
+    'stress': {
+        'error': ("🔴 พืชเครียดจัด (Severe Stress)", "แดดแรงและร้อนจัด ระวังใบไหม้ ควรพรางแสง"),
+        'warning': ("🟡 เสี่ยงขาดน้ำ (Water Stress)", "ร้อนแต่ดินเริ่มแห้ง พืชสูญเสียน้ำเร็วกว่าดูดซึม"),
+        'success': ("🟢 สภาพปกติ (Optimal)", "พืชสังเคราะห์แสงและคายน้ำได้ดี"),
+    },
+    'soil': {
+        'error': ("🔴 ดินแห้งเกินไป", "ควรรดน้ำทันทีเพื่อป้องกันรากแห้งตาย"),
+        'warning': ("🟡 ดินแฉะเกินไป", "ดินอุ้มน้ำมากเกินไประวังรากขาดออกซิเจน"),
+        'success': ("🟢 ดินชุ่มชื้นพอดี", "ความชื้นเหมาะสมต่อการดูดซึมธาตุอาหาร"),
+    },
+}
+
+RULE_NAMES = {'mold': 'โรคราคอดิน', 'stress': 'ความเครียดของพืช', 'soil': 'ความชื้นในดิน'}
+
+# การเปลี่ยนระดับของกฎ 1 ครั้ง (เช่น mold: warning -> error)
+Transition = namedtuple("Transition", ["time", "rule", "level"])
+# ผลประเมินล่าสุดที่ poller เผยแพร่
+# levels/since: ระดับปัจจุบันของแต่ละกฎ และเวลาที่เริ่มอยู่ในระดับนั้น
+# exposure: {(คอลัมน์, เครื่องหมาย, ค่า): ชั่วโมงที่เกินเกณฑ์ในช่วง exposure}
+HealthReport = namedtuple("HealthReport", ["time", "levels", "since", "env_score", "means", "exposure", "transitions"])
+
+
+# --- สถิติแบบหน้าต่างเวลาเลื่อน (Rolling Window) ---
+# เพิ่มแถวใหม่และตัดแถวที่หลุดหน้าต่างออก ใช้เวลา O(1) ต่อแถว (amortized)
+# mean จากผลรวมสะสม, max จาก monotonic deque, เวลาที่เกินเกณฑ์จากผลรวมของช่วงเวลาระหว่างแถว
+class RollingStats:
+    def __init__(self, window, limits=()):
+        self.window = window.total_seconds()
+        self.limits = tuple(limits)
+        self.samples = deque()      # (เวลา, ค่า, ระยะเวลาที่เกินแต่ละเกณฑ์)
+        self.peaks = deque()        # (เวลา, ค่า) เรียงค่ามากไปน้อย
+        self.total = 0.0
+        self.above = [0.0] * len(self.limits)
+        self.last_time = None
+
+    def update(self, t, value):
+        if math.isnan(value):
+            return
+        dt = 0.0 if self.last_time is None else min(max(t - self.last_time, 0.0), MAX_GAP)
+        self.last_time = t
+        over = tuple(dt if OPERATORS[op](value, limit) else 0.0 for op, limit in self.limits) if self.limits else ()
+        self.samples.append((t, value, over))
+        self.total += value
+        for i, d in enumerate(over):
+            self.above[i] += d
+        while self.peaks and self.peaks[-1][1] <= value:
+            self.peaks.pop()
+        self.peaks.append((t, value))
+
+        cutoff = t - self.window
+        while self.samples[0][0] <= cutoff:
+            _, old, old_over = self.samples.popleft()
+            self.total -= old
+            for i, d in enumerate(old_over):
+                self.above[i] -= d
+        while self.peaks[0][0] <= cutoff:
+            self.peaks.popleft()
+
+    def mean(self):
+        return self.total / len(self.samples) if self.samples else float('nan')
+
+    def max(self):
+        return self.peaks[0][1] if self.peaks else float('nan')
+
+    def time_above(self, op, limit):
+        # วินาทีที่ค่าเข้าเงื่อนไข (op, limit) ภายในหน้าต่าง
+        return max(self.above[self.limits.index((op, limit))], 0.0)
+
+
+def mold_level(avg_temp, avg_humid):
+    if avg_temp > 30 and avg_humid > 80:
+        return 'error'
+    if avg_temp > 28 and avg_humid > 75:
+        return 'warning'
+    return 'success'
+
+
+def stress_level(temp, soil, ppfd):
+    if temp > 33 and ppfd > 150:
+        return 'error'
+    if temp > 31 and soil < 50:
+        return 'warning'
+    return 'success'
+
+
+def soil_level(soil):
+    if soil < 40:
+        return 'error'
+    if soil > 85:
+        return 'warning'
+    return 'success'
+
+
+def env_score(temp, humid, soil):
+    score = 100
+    if temp > 30 or temp < 24: score -= 15
+    if humid > 80 or humid < 50: score -= 15
+    if soil < 50 or soil > 85: score -= 20
+    return score
+
+
+# --- ระบบประเมินความเสี่ยงและสุขภาพพืช ---
+# ประเมินกฎทุกข้อทีละแถวใหม่ด้วยสถิติแบบเลื่อน แล้วบันทึกเฉพาะตอนที่ระดับเปลี่ยน
+# จึงรู้ได้ทันทีว่าอยู่ในสถานะ High Risk มานานเท่าไรโดยไม่ต้องสแกนข้อมูลย้อนหลัง
+class HealthEngine:
+    def __init__(self, windows=None, limits=None, max_transitions=1000):
+        self.windows = dict(WINDOWS, **(windows or {}))
+        self.limits = EXPOSURE_LIMITS if limits is None else limits
+        self.max_transitions = max_transitions
+        self.reset()
+
+    def reset(self):
+        self.mold = {c: RollingStats(self.windows['mold']) for c in ('AirTemp', 'AirHumid')}
+        self.exposure = {c: RollingStats(self.windows['exposure'], lim) for c, lim in self.limits.items()}
+        self.current = {}
+        self.levels = {}
+        self.since = {}
+        self.transitions = deque(maxlen=self.max_transitions)
+        self.last_time = None
+
+    def update(self, chunk):
+        for _ in self.iter_update(chunk):
+            pass
+
+    def iter_update(self, chunk):
+        # อัปเดตทีละแถว คืนค่า (เวลาเป็นวินาที, ค่าล่าสุดของแต่ละเซนเซอร์, ระดับของแต่ละกฎ) ทุกแถว
+        # ให้ผู้ใช้ภายนอก (เช่น alerts.AlertMonitor) ประเมินเงื่อนไขของตัวเองไปพร้อมกันได้
+        chunk = chunk[chunk.index.notna()]
+        if chunk.empty:
+            return
+        cols = sorted(set(self.mold) | set(self.exposure) | {'AirTemp', 'AirHumid', 'SoilHumid', 'LightLux'})
+        cols = [c for c in cols if c in chunk.columns]
+        times = chunk.index.as_unit('ns').asi8 / 1e9
+        values = {c: chunk[c].to_numpy(dtype='float64').tolist() for c in cols}
+        stamps = chunk.index
+
+        for i, t in enumerate(times.tolist()):
+            for c in cols:
+                v = values[c][i]
+                if not math.isnan(v):
+                    self.current[c] = v
+                if c in self.mold:
+                    self.mold[c].update(t, v)
+                if c in self.exposure:
+                    self.exposure[c].update(t, v)
+            levels = self._levels()
+            if levels != self.levels:
+                self._record(stamps[i], levels)
+            yield t, self.current, levels
+        self.last_time = stamps[-1]
+
+    def _levels(self):
+        cur = self.current.get
+        temp, humid, soil = cur('AirTemp', 0), cur('AirHumid', 0), cur('SoilHumid', 0)
+        levels = {
+            'stress': stress_level(temp, soil, cur('LightLux', 0) * 0.065),
+            'soil': soil_level(soil),
+        }
+        if all(s.samples for s in self.mold.values()):
+            levels['mold'] = mold_level(self.mold['AirTemp'].mean(), self.mold['AirHumid'].mean())
+        return levels
+
+    def _record(self, stamp, levels):
+        for rule, level in levels.items():
+            if self.levels.get(rule) != level:
+                self.levels[rule] = level
+                self.since[rule] = stamp
+                self.transitions.append(Transition(stamp, rule, level))
+
+    def report(self):
+        if self.last_time is None:
+            return None
+        cur = self.current.get
+        exposure = {
+            (c, op, limit): stats.time_above(op, limit) / 3600
+            for c, stats in self.exposure.items() for op, limit in stats.limits
+        }
+        means = {c: stats.mean() for c, stats in self.mold.items()}
+        return HealthReport(
+            self.last_time, dict(self.levels), dict(self.since),
+            env_score(cur('AirTemp', 0), cur('AirHumid', 0), cur('SoilHumid', 0)),
+            means, exposure, tuple(self.transitions)
+        )
+
+
+def format_duration(delta):
+    minutes = int(delta.total_seconds() // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days} วัน {hours} ชม."
+    if hours:
+        return f"{hours} ชม. {minutes} นาที"
+    return f"{minutes} นาที"
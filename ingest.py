@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import time
+import tomllib
+from collections import defaultdict, namedtuple
+from functools import partial
+
+import pandas as pd
+
+from cleaning import CATEGORY_COLS, COLUMN_ALIASES, SENSOR_COLS
+from devices import device_db_path, load_devices
+from metrics import METRICS
+from resilience import CircuitBreaker, CircuitOpenError
+from store import TIMESTAMP_FORMATS, TIMEZONE, SensorStore
+from sync import SECRETS_PATH
+
+TOPIC = "readings"
+MAX_BODY = 1024 * 1024          # ไบต์ ; ขนาด request สูงสุดต่อครั้ง
+WRITE_TIMEOUT = 10              # วินาที ; รอบันทึกลงฐานข้อมูลนานสุดก่อนตอบ 503
+MIRROR_INTERVAL = 10            # วินาที ; รวมแถวแล้วเขียนลงชีตครั้งเดียว (ไม่ติดโควต้า API)
+MIRROR_MAX_PENDING = 50000      # แถวที่รอเขียนลงชีตสูงสุด (ชีตล่มนาน ๆ จะทิ้งแถวเก่าสุด)
+
+# คอลัมน์ที่อุปกรณ์ส่งมาได้เสมอ (นอกจากนี้รับเฉพาะคอลัมน์ที่ฐานข้อมูลของแปลงมีอยู่แล้ว เช่นหัวตารางจากชีต)
+# กันไม่ให้ request ที่ผิดพลาดหรือไม่หวังดีเพิ่มคอลัมน์ในตารางได้ตามใจ
+KNOWN_COLUMNS = ['Timestamp', 'Day', *SENSOR_COLS, *CATEGORY_COLS, *COLUMN_ALIASES]
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+# ข้อมูล 1 ชุดของแปลง device ที่ส่งผ่าน broker ; done คือ Future ที่ StoreWriter ตอบกลับเมื่อบันทึกเสร็จ
+Batch = namedtuple("Batch", ["device", "header", "records", "done"])
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+# --- broker ในเครื่อง (แทน MQTT broker) ---
+# publish/subscribe ตามชื่อ topic ภายใน process ; ผู้รับแต่ละรายมีคิวของตัวเอง
+class ReadingBroker:
+    def __init__(self):
+        self.subscribers = defaultdict(list)
+
+    def subscribe(self, topic):
+        queue = asyncio.Queue()
+        self.subscribers[topic].append(queue)
+        return queue
+
+    def publish(self, topic, message):
+        for queue in self.subscribers[topic]:
+            queue.put_nowait(message)
+
+
+def format_timestamp(epoch_seconds):
+    # รูปแบบเดียวกับคอลัมน์ Timestamp ในชีต ("dd/mm/YYYY, HH:MM:SS" เวลาไทย)
+    stamp = pd.Timestamp(epoch_seconds, unit='s', tz='UTC').tz_convert(TIMEZONE)
+    return stamp.strftime(TIMESTAMP_FORMATS[0])
+
+
+def to_records(payload, received_at=None, allowed=KNOWN_COLUMNS):
+    # รับได้ทั้ง {"readings": [...]}, list ของ reading หรือ reading เดียว
+    # reading คือ dict {ชื่อคอลัมน์: ค่า} แบบเดียวกับหัวตารางในชีต ; คอลัมน์ต้องอยู่ใน allowed และค่าต้องเป็น scalar
+    # เวลา: "Timestamp" (รูปแบบเดียวกับชีต) หรือ "ts" (epoch วินาที) ถ้าไม่มีใช้เวลาที่ server ได้รับ
+    if isinstance(payload, dict):
+        payload = payload.get("readings", [payload])
+    if not isinstance(payload, list) or not all(isinstance(r, dict) for r in payload):
+        raise ValueError("expected a reading object or a list of readings")
+
+    received_at = time.time() if received_at is None else received_at
+    readings = []
+    for reading in payload:
+        reading = dict(reading)
+        reading.pop("device", None)
+        ts = reading.pop("ts", None)
+        for key, value in reading.items():
+            if key.startswith("_"):
+                raise ValueError(f"reserved column: {key}")
+            if key not in allowed:
+                raise ValueError(f"unknown column: {key}")
+            if not isinstance(value, SCALAR_TYPES):
+                raise ValueError(f"value of {key} must be a number, string or null")
+        if "Timestamp" not in reading:
+            reading["Timestamp"] = format_timestamp(received_at if ts is None else float(ts))
+        readings.append(reading)
+
+    header = list(dict.fromkeys(k for r in readings for k in r))
+    return header, [[r.get(h) for h in header] for r in readings]
+
+
+# --- ผู้รับที่บันทึกลงฐานข้อมูล ---
+# ดึงทุก batch ที่รอในคิวมาเขียนใน transaction เดียวต่อแปลง (ยิ่งส่งถี่ ยิ่งรวมได้มาก)
+class StoreWriter:
+    def __init__(self, stores, broker):
+        self.stores = stores        # dict {รหัสแปลง: SensorStore}
+        self.queue = broker.subscribe(TOPIC)
+
+    def write(self, batches):
+        # คืนค่า dict {รหัสแปลง: ข้อผิดพลาด (None = บันทึกสำเร็จ)} ; แต่ละแปลงสำเร็จ/ย้อนกลับแยกกัน
+        by_device = defaultdict(list)
+        for batch in batches:
+            by_device[batch.device].append(batch)
+        errors = {}
+        for device_id, device_batches in by_device.items():
+            store = self.stores[device_id]
+            try:
+                with METRICS.timer('mg_ingest_write_seconds', device=device_id), store.transaction():
+                    for batch in device_batches:
+                        store.append_rows(batch.header, batch.records)
+                errors[device_id] = None
+            except Exception as e:
+                errors[device_id] = e
+        return errors
+
+    async def run(self):
+        while True:
+            batches = [await self.queue.get()]
+            while not self.queue.empty():
+                batches.append(self.queue.get_nowait())
+            try:
+                errors = await asyncio.to_thread(self.write, batches)
+            except Exception as e:
+                errors = dict.fromkeys((b.device for b in batches), e)
+            # ตอบเฉพาะ batch ของแปลงที่ย้อนกลับจริงว่าล้มเหลว (แปลงที่ commit แล้วห้ามตอบ 503 ไม่งั้นอุปกรณ์จะส่งซ้ำ)
+            for batch in batches:
+                if batch.done.done():
+                    continue
+                error = errors.get(batch.device)
+                if error is None:
+                    batch.done.set_result(len(batch.records))
+                else:
+                    batch.done.set_exception(error)
+
+
+# --- ผู้รับที่สำเนาข้อมูลลงชีต (ตัวเลือกเสริม) ---
+# ชีตเป็นแค่สำเนา: เขียนรวมทุก MIRROR_INTERVAL วินาทีด้วย append_rows ครั้งเดียว
+# ห้ามรัน sync.py คู่กับโหมดนี้ (แถวที่สำเนาลงชีตจะถูก sync กลับเข้าฐานข้อมูลซ้ำ)
+class SheetsMirror:
+    def __init__(self, sheets, broker, devices, interval=MIRROR_INTERVAL):
+        self.sheets = sheets
+        self.queue = broker.subscribe(TOPIC)
+        self.devices = devices      # dict {รหัสแปลง: devices.Device} ใช้หาชีตของแต่ละแปลง
+        self.interval = interval
+        self.pending = defaultdict(list)
+        self.headers = {}
+        # ชีตล่มติดกันจะเว้นการเขียนไปก่อน (exponential backoff) แถวยังรออยู่ใน pending
+        self.breakers = {device_id: CircuitBreaker(f"mirror:{device_id}") for device_id in devices}
+
+    def append(self, device_id, rows):
+        device = self.devices[device_id]
+        def write():
+            sheet = self.sheets.worksheet(device.worksheet, spreadsheet=device.spreadsheet)
+            if device_id not in self.headers:
+                self.headers[device_id] = sheet.row_values(1)
+            header = self.headers[device_id]
+            values = [['' if row.get(h) is None else row.get(h) for h in header] for row in rows]
+            sheet.append_rows(values, value_input_option='USER_ENTERED')
+        self.sheets.run(write)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            while not self.queue.empty():
+                batch = self.queue.get_nowait()
+                self.pending[batch.device].extend(dict(zip(batch.header, r)) for r in batch.records)
+            for device_id, rows in list(self.pending.items()):
+                if len(rows) > MIRROR_MAX_PENDING:
+                    del rows[:-MIRROR_MAX_PENDING]
+                if not rows:
+                    continue
+                try:
+                    await asyncio.to_thread(self.breakers[device_id].call, partial(self.append, device_id, rows))
+                    self.pending[device_id] = []
+                except CircuitOpenError:
+                    pass
+                except Exception as e:
+                    self.headers.pop(device_id, None)
+                    print(f"[{time.strftime('%H:%M:%S')}] sheet mirror failed for {device_id} ({len(rows)} rows pending): {e}")
+
+
+# --- HTTP server ขนาดเล็กบน asyncio (ไม่ต้องติดตั้งแพ็กเกจเพิ่ม) ---
+# POST /ingest/<รหัสแปลง> (หรือ /ingest กับ "device" ใน JSON) รับข้อมูลแล้วตอบ 200 หลังบันทึกลงฐานข้อมูลแล้วเท่านั้น
+# GET  /health  ตรวจสถานะ
+# GET  /metrics ค่าวัดประสิทธิภาพของ process นี้ในรูปแบบ Prometheus text (ต้องใช้ token เดียวกับ /ingest)
+class IngestServer:
+    def __init__(self, broker, stores, token=None):
+        self.broker = broker
+        self.stores = stores        # dict {รหัสแปลง: SensorStore} ใช้อ่านคอลัมน์ที่แปลงนั้นมีอยู่แล้ว
+        self.device_ids = list(stores)
+        self.token = token
+        self.accepted = 0
+
+    def authorized(self, headers):
+        return not self.token or headers.get('authorization') == f"Bearer {self.token}"
+
+    def columns(self, device_id):
+        # อ่านจากฐานข้อมูลทุก request: คอลัมน์ที่ sync จากชีตเพิ่มภายหลังรับได้ทันทีโดยไม่ต้องรีสตาร์ท
+        return set(KNOWN_COLUMNS) | set(self.stores[device_id].columns())
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, _ = line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = header.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                path = path.split('?', 1)[0]
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if path == '/metrics' and method == 'GET':
+                    # รหัสแปลง จำนวน request และเวลาที่ใช้ ไม่เปิดให้อ่านโดยไม่มี token
+                    if not self.authorized(headers):
+                        await self.respond(writer, 401, {"error": "invalid token"}, keep_alive)
+                    else:
+                        await self.respond(writer, 200, METRICS.render(), keep_alive, content_type='text/plain; version=0.0.4')
+                else:
+                    status, result = await self.route(method, path, headers, body)
+                    METRICS.inc('mg_ingest_requests_total', status=status)
+                    await self.respond(writer, status, result, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, headers, body):
+        if path == '/health' and method == 'GET':
+            return 200, {"ok": True, "accepted": self.accepted}
+        route, _, path_device = path.strip('/').partition('/')
+        if route != 'ingest' or method != 'POST':
+            return 404, {"error": "not found"}
+        if not self.authorized(headers):
+            return 401, {"error": "invalid token"}
+
+        try:
+            payload = json.loads(body or b'null')
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        device_id = path_device or (payload.get("device") if isinstance(payload, dict) else None)
+        if device_id is None and len(self.device_ids) == 1:
+            device_id = self.device_ids[0]
+        if device_id not in self.device_ids:
+            return 404, {"error": f"unknown device: {device_id}"}
+        try:
+            header, records = to_records(payload, allowed=self.columns(device_id))
+        except (ValueError, TypeError) as e:
+            return 400, {"error": str(e)}
+        if not records:
+            return 200, {"accepted": 0}
+
+        done = asyncio.get_running_loop().create_future()
+        self.broker.publish(TOPIC, Batch(device_id, header, records, done))
+        try:
+            accepted = await asyncio.wait_for(asyncio.shield(done), WRITE_TIMEOUT)
+        except Exception as e:
+            return 503, {"error": str(e) or type(e).__name__}
+        self.accepted += accepted
+        METRICS.inc('mg_ingest_rows_total', accepted, device=device_id)
+        return 200, {"accepted": accepted}
+
+    async def respond(self, writer, status, result, keep_alive=True, content_type='application/json'):
+        body = (result if isinstance(result, str) else json.dumps(result)).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(devices, host, port, token=None, sheets=None):
+    broker = ReadingBroker()
+    stores = {d.id: SensorStore(device_db_path(d.id)) for d in devices}
+    tasks = [asyncio.create_task(StoreWriter(stores, broker).run())]
+    if sheets is not None:
+        tasks.append(asyncio.create_task(SheetsMirror(sheets, broker, {d.id: d for d in devices}).run()))
+    server = await asyncio.start_server(IngestServer(broker, stores, token).handle, host, port)
+    print(f"[{time.strftime('%H:%M:%S')}] ingest listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accept sensor readings over HTTP and write them to the local store")
+    parser.add_argument("--host", default="127.0.0.1", help="use 0.0.0.0 to accept devices on the network ([ingest] token required)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--mirror", action="store_true", help="also append readings to the Google Sheet")
+    parser.add_argument("--secrets", default=SECRETS_PATH)
+    args = parser.parse_args()
+
+    secrets = {}
+    if os.path.exists(args.secrets):
+        with open(args.secrets, "rb") as f:
+            secrets = tomllib.load(f)
+
+    sheets = None
+    if args.mirror:
+        from sheets import SheetsConnection
+        sheets = SheetsConnection(secrets["gcp_service_account"])
+
+    token = secrets.get("ingest", {}).get("token")
+    if not token and not is_loopback(args.host):
+        parser.error(f"refusing to listen on {args.host} without [ingest] token in {args.secrets}")
+    asyncio.run(serve(load_devices(secrets), args.host, args.port, token=token, sheets=sheets))
+
+
+if __name__ == "__main__":
+    main()
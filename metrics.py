@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+WRITE_INTERVAL = 15     # วินาที ; เขียนไฟล์ .prom ใหม่ทุกกี่วินาที
+RATE_WINDOW = 60        # วินาที ; ช่วงเวลาที่ใช้นับ "ครั้งต่อนาที"
+
+# คำอธิบายของค่าวัดแต่ละตัว (บรรทัด # HELP ในรูปแบบ Prometheus)
+HELP = {
+    'mg_sheets_api_calls_total': "Google Sheets/Drive API requests",
+    'mg_sheets_api_errors_total': "Google Sheets/Drive API requests that failed",
+    'mg_sheets_api_bytes_total': "Response bytes received from the Sheets/Drive API",
+    'mg_sheets_api_seconds': "Sheets/Drive API request latency",
+    'mg_sync_seconds': "Sheet-to-store sync duration per device",
+    'mg_sync_rows_total': "Rows copied from the sheet into the store",
+    'mg_poll_seconds': "Poller stage duration per device",
+    'mg_poll_rows_total': "Rows processed by the poller",
+    'mg_section_seconds': "Dashboard section render time",
+    'mg_cache_total': "Dashboard cache lookups by result",
+    'mg_ingest_requests_total': "Ingest HTTP requests by status",
+    'mg_ingest_rows_total': "Readings accepted by the ingest server",
+    'mg_ingest_write_seconds': "Ingest store write duration",
+    'mg_breaker_open_total': "Times a circuit breaker opened after repeated failures",
+    'mg_breaker_rejected_total': "Calls skipped while a circuit breaker was open",
+    'mg_process_start_time_seconds': "Start time of this process (Unix seconds)",
+}
+# ตัวนับที่ต้องแสดงเป็น "ครั้งต่อนาที" ด้วย (เช่นโควต้า Sheets API คิดเป็นต่อนาที)
+PER_MINUTE = ('mg_sheets_api_calls_total', 'mg_ingest_requests_total')
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escape = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels) + '}'
+
+
+# --- ตัวเก็บค่าวัดประสิทธิภาพ (ใช้ร่วมกันทั้ง process) ---
+# ตัวนับ (counter) และเวลาที่ใช้ (จำนวนครั้ง/ผลรวม/ค่าสูงสุด/ค่าล่าสุด) แยกตาม label
+# ทุกเมธอดใช้เวลาน้อยมาก เรียกได้จากทุก thread (poller, session, ingest)
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = defaultdict(float)      # (ชื่อ, labels) -> ค่า
+        self.timings = {}                       # (ชื่อ, labels) -> [จำนวนครั้ง, ผลรวม, สูงสุด, ล่าสุด]
+        self.recent = defaultdict(lambda: deque(maxlen=10000))  # ชื่อ -> เวลาที่นับ (สำหรับครั้งต่อนาที)
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, _labels(labels))] += value
+            if name in PER_MINUTE:
+                self.recent[name].append(time.monotonic())
+
+    def observe(self, name, seconds, **labels):
+        with self.lock:
+            stats = self.timings.setdefault((name, _labels(labels)), [0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] = seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        # decorator ของ timer() สำหรับจับเวลาทั้งฟังก์ชัน
+        def decorate(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def per_minute(self, name):
+        with self.lock:
+            recent = self.recent[name]
+            cutoff = time.monotonic() - RATE_WINDOW
+            while recent and recent[0] < cutoff:
+                recent.popleft()
+            return len(recent) * 60 / RATE_WINDOW
+
+    def snapshot(self):
+        # สำเนาค่าปัจจุบันสำหรับแสดงผล: (counters, timings) เป็น list ของ (ชื่อ, dict labels, ค่า)
+        with self.lock:
+            counters = [(name, dict(labels), value) for (name, labels), value in sorted(self.counters.items())]
+            timings = [(name, dict(labels), tuple(stats)) for (name, labels), stats in sorted(self.timings.items())]
+        return counters, timings
+
+    def render(self):
+        # ข้อความรูปแบบ Prometheus text exposition (version 0.0.4)
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        lines = []
+        seen = set()
+
+        def header(name, kind, text=None):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {text or HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), (count, total, peak, _) in timings:
+            header(name, 'summary')
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+        for (name, labels), (count, total, peak, _) in timings:
+            header(f"{name}_max", 'gauge', f"{HELP.get(name, name)} (maximum)")
+            lines.append(f"{name}_max{_format_labels(labels)} {peak:.6f}")
+        for name in PER_MINUTE:
+            header(f"{name.removesuffix('_total')}_per_minute", 'gauge', f"{HELP.get(name, name)} in the last minute")
+            lines.append(f"{name.removesuffix('_total')}_per_minute {self.per_minute(name):g}")
+        header('mg_process_start_time_seconds', 'gauge')
+        lines.append(f"mg_process_start_time_seconds {self.started:.0f}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+def write_textfile(path, metrics=METRICS):
+    # เขียนแบบไฟล์ชั่วคราวแล้ว rename ผู้อ่าน (เช่น node_exporter textfile collector) จะไม่เห็นไฟล์ที่เขียนไม่ครบ
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(metrics.render())
+    os.replace(tmp, path)
+
+
+# --- เขียนค่าวัดลงไฟล์เป็นระยะ (สำหรับ process ที่ไม่มี HTTP endpoint ของตัวเอง เช่น Streamlit) ---
+class MetricsWriter(threading.Thread):
+    def __init__(self, path, interval=WRITE_INTERVAL, metrics=METRICS):
+        super().__init__(name="metrics-writer", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                write_textfile(self.path, self.metrics)
+            except OSError as e:
+                print(f"[{time.strftime('%H:%M:%S')}] metrics write failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from actuators import ActuatorLog
+from cleaning import SensorCleaner
+from forecast import SensorForecaster
+from health import HealthEngine
+from metrics import METRICS
+from resilience import CircuitBreaker, load_state, save_state
+from rollups import RollupSet
+from trials import TrialIndex
+
+# ข้อมูลชุดล่าสุดที่ poller เผยแพร่ให้ทุก session อ่าน (ห้ามแก้ไข ให้ copy ก่อนถ้าต้องเปลี่ยน)
+# frame คือข้อมูลที่ทำความสะอาดแล้ว (เซนเซอร์เป็น float32, Fan/Pump เป็น category, index เป็นเวลาไทย)
+#   เก็บเฉพาะช่วง retention ล่าสุด ; hot_start คือเวลาเริ่มของ frame เมื่อถูกตัด (None = มีครบทุกแถว)
+# rollups คือ dict ของตารางสรุปตามความละเอียด (ดู rollups.RESOLUTIONS)
+# trials คือ tuple ของ trials.Trial เรียงตามรอบการทดลอง
+# forecasts คือ dict {เซนเซอร์: Series ค่าพยากรณ์ 6 ชม.} คำนวณไว้ครั้งเดียวต่อข้อมูลชุดใหม่
+# health คือ health.HealthReport ผลประเมินความเสี่ยงล่าสุด (None ถ้ายังไม่มีข้อมูล)
+# actuators คือ actuators.ActuatorReport ประวัติการทำงานของปั๊ม/พัดลม (None ถ้ายังไม่มีข้อมูล)
+# synced_at คือเวลา (epoch) ที่ sync ชีตสำเร็จครั้งล่าสุด ; error คือข้อความผิดพลาดล่าสุด (None = ปกติ)
+# retry_at คือเวลา (epoch) ที่จะลองเชื่อมต่อชีตใหม่เมื่อตัดวงจรอยู่ (None = ไม่ได้ตัดวงจร)
+Snapshot = namedtuple("Snapshot", [
+    "frame", "hot_start", "rollups", "trials", "forecasts", "health", "actuators", "version", "synced_at", "error", "retry_at"
+])
+
+EMPTY_SNAPSHOT = Snapshot(pd.DataFrame(), None, {}, (), {}, None, None, 0, None, None, None)
+
+# ข้อมูลดิบที่เก็บในหน่วยความจำย้อนหลังกี่วัน (เก่ากว่านั้นอยู่ในฐานข้อมูลบนดิสก์ และในตารางสรุปรายชั่วโมง/รายวัน)
+RETENTION = pd.Timedelta(days=float(os.environ.get("MG_RETENTION_DAYS", 8)))
+TRIM_SLACK = pd.Timedelta(days=1)   # ตัดเมื่อเกิน retention มากกว่านี้ (ไม่ต้อง copy ตารางทุกรอบ)
+LOAD_BATCH = 50000                  # แถวต่อครั้งที่อ่านจากฐานข้อมูล (เริ่มครั้งแรกกับข้อมูลหลายเดือนไม่ใช้หน่วยความจำพุ่ง)
+SAVE_INTERVAL = 300                 # วินาที ; บันทึกสถานะลงดิสก์สำหรับ warm start อย่างมากทุกกี่วินาที
+
+
+# --- ตัวดึงข้อมูลเบื้องหลัง 1 ตัวต่อ 1 process ---
+# ดึงชีตตามรอบเวลาแล้วเผยแพร่ Snapshot ใหม่ ทุก session แค่อ่าน snapshot ล่าสุด
+# จำนวนครั้งที่เรียก Sheets API จึงคงที่ ไม่ว่าจะเปิดดูกี่หน้าจอ
+class SensorPoller(threading.Thread):
+    def __init__(self, store, sync=None, interval=30, device_id="default", retention=RETENTION, state_path=None):
+        super().__init__(name="sensor-poller", daemon=True)
+        self.store = store
+        self.device_id = device_id  # ใช้เป็น label ของค่าวัดเวลาแต่ละขั้นตอน (metrics)
+        self.sync = sync            # ฟังก์ชัน sync ชีตลงฐานข้อมูล (None = อ่านจากฐานข้อมูลอย่างเดียว)
+        self.interval = interval
+        self.retention = retention  # None = เก็บข้อมูลดิบทั้งหมดในหน่วยความจำ
+        self.breaker = CircuitBreaker(f"sync:{device_id}")
+        self.state_path = state_path    # ไฟล์สถานะสำหรับ warm start (None = ไม่บันทึก)
+        self.saved_at = None
+        self.hot_start = None
+        self.cleaner = SensorCleaner()
+        self.rollups = RollupSet()
+        self.trials = TrialIndex()
+        self.forecaster = SensorForecaster()
+        self.health = HealthEngine()
+        self.actuators = ActuatorLog()
+        self.snapshot = EMPTY_SNAPSHOT
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+
+    def _timer(self, stage):
+        return METRICS.timer('mg_poll_seconds', device=self.device_id, stage=stage)
+
+    def _update(self, chunk):
+        with self._timer('rollups'):
+            self.rollups.update(chunk)
+        with self._timer('trials'):
+            self.trials.update(chunk)
+        with self._timer('forecast'):
+            self.forecaster.update(chunk)
+        with self._timer('health'):
+            self.health.update(chunk)
+        with self._timer('actuators'):
+            self.actuators.update(chunk)
+        METRICS.inc('mg_poll_rows_total', len(chunk), device=self.device_id)
+
+    def _retain(self):
+        # ตัดข้อมูลดิบและตารางสรุปละเอียด (1 นาที) ที่เก่ากว่า retention ออกจากหน่วยความจำ
+        # ขั้นตอนอื่น (trial/forecast/health/actuator) เก็บเป็นค่าสะสม ไม่ต้องใช้แถวเก่า
+        index = self.cleaner.frame.index
+        if self.retention is None or index.empty or index.isna().all():
+            return
+        cutoff = index.max() - self.retention
+        if index.min() < cutoff - TRIM_SLACK:
+            with self._timer('retention'):
+                self.cleaner.trim(cutoff)
+                self.rollups.trim(cutoff)
+            self.hot_start = cutoff
+
+    def _sync(self):
+        with self._timer('sync'):
+            self.sync()
+
+    def _reports(self):
+        return self.forecaster.forecasts(), self.health.report(), self.actuators.report()
+
+    def _publish(self, version, synced_at, error, reports):
+        # แทนที่ทั้งก้อนในครั้งเดียว session ที่อ่านอยู่จะเห็นข้อมูลชุดเดิมครบถ้วนเสมอ
+        forecasts, health, actuators = reports
+        retry_in = self.breaker.retry_in()
+        self.snapshot = Snapshot(
+            self.cleaner.frame, self.hot_start, self.rollups.tables(), self.trials.snapshot(), forecasts, health, actuators,
+            version, synced_at, error, time.time() + retry_in if retry_in else None
+        )
+        self.ready.set()
+        return self.snapshot
+
+    def save_state(self):
+        # บันทึกไม่สำเร็จ (เช่นดิสก์เต็ม) ไม่กระทบการแสดงผล แค่เริ่มใหม่ครั้งหน้าจะช้ากว่า
+        self.saved_at = time.monotonic()
+        try:
+            with self._timer('save_state'):
+                save_state(self.state_path, {
+                    'cleaner': self.cleaner, 'rollups': self.rollups, 'trials': self.trials, 'forecaster': self.forecaster,
+                    'health': self.health, 'actuators': self.actuators, 'hot_start': self.hot_start,
+                    'synced_at': self.snapshot.synced_at,
+                })
+        except OSError as e:
+            print(f"[{time.strftime('%H:%M:%S')}] {self.device_id}: state save failed: {e}")
+
+    def restore(self):
+        # warm start: เผยแพร่สถานะที่บันทึกไว้ทันที แล้วรอบ poll ถัดไปประมวลผลต่อเฉพาะแถวที่เพิ่มหลังจากนั้น
+        # ข้ามไฟล์สถานะถ้าฐานข้อมูลถูกสร้างใหม่ (มีแถวน้อยกว่าที่สถานะเคยประมวลผลไปแล้ว)
+        state = None if self.state_path is None else load_state(self.state_path)
+        if state is None or state['cleaner'].last_id > self.store.version():
+            return False
+        self.cleaner, self.rollups, self.trials = state['cleaner'], state['rollups'], state['trials']
+        self.forecaster, self.health, self.actuators = state['forecaster'], state['health'], state['actuators']
+        self.hot_start = state['hot_start']
+        self.saved_at = time.monotonic()
+        self._publish(self.cleaner.last_id, state['synced_at'], None, self._reports())
+        return True
+
+    def poll_once(self):
+        error = None
+        if self.sync is not None:
+            # ระหว่างตัดวงจร (ชีตล่มติดกันหลายครั้ง) ไม่เรียกชีต ใช้ข้อมูลในฐานข้อมูลต่อและแสดงข้อผิดพลาดล่าสุด
+            try:
+                self.breaker.call(self._sync)
+            except Exception as e:
+                error = str(e)
+
+        current = self.snapshot
+        version = self.store.version()
+        if version < self.cleaner.last_id:
+            # ฐานข้อมูลถูกสร้างใหม่ ต้องทำความสะอาดข้อมูลใหม่ทั้งหมด
+            self.cleaner.reset()
+            self.rollups = RollupSet()
+            self.trials.reset()
+            self.forecaster.reset()
+            self.health.reset()
+            self.actuators.reset()
+            self.hot_start = None
+        if version != self.cleaner.last_id:
+            # ทำความสะอาดเฉพาะแถวที่ยังไม่เคยประมวลผล แล้วอัปเดตตารางสรุปด้วยแถวชุดเดียวกัน
+            while self.cleaner.last_id < version:
+                with self._timer('load'):
+                    raw = self.store.load(after_id=self.cleaner.last_id, with_internal=True, limit=LOAD_BATCH)
+                if raw.empty:
+                    break
+                with self._timer('cleaning'):
+                    chunk = self.cleaner.update(raw)
+                del raw
+                self._update(chunk)
+                self._retain()
+            reports = self._reports()
+        else:
+            reports = current.forecasts, current.health, current.actuators
+        synced_at = current.synced_at if error else time.time()
+        snapshot = self._publish(version, synced_at, error, reports)
+
+        if self.state_path is not None and version != current.version and (
+                self.saved_at is None or time.monotonic() - self.saved_at >= SAVE_INTERVAL):
+            self.save_state()
+        return snapshot
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.snapshot = self.snapshot._replace(error=str(e))
+                self.ready.set()
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
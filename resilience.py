@@ -0,0 +1,110 @@
+import os
+import pickle
+import random
+import threading
+import time
+
+from metrics import METRICS
+
+FAILURE_THRESHOLD = 3   # ล้มเหลวติดกันกี่ครั้งจึงตัดวงจร (ก่อนหน้านั้นลองใหม่ตามรอบปกติ)
+BASE_DELAY = 60         # วินาที ; เวลารอครั้งแรกหลังตัดวงจร แล้วเพิ่มเป็น 2 เท่าทุกครั้งที่ลองแล้วยังล้มเหลว
+MAX_DELAY = 15 * 60     # วินาที ; เวลารอสูงสุด
+JITTER = 0.2            # สุ่มเวลารอ ±20% ไม่ให้ทุก process/แปลงกลับมาเรียก API พร้อมกัน
+STATE_VERSION = 2       # เปลี่ยนเมื่อรูปแบบสถานะที่บันทึกไว้เปลี่ยน (ไฟล์เก่าจะถูกข้ามแล้วเริ่มใหม่)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# --- ตัวตัดวงจร (Circuit Breaker) + exponential backoff สำหรับการเรียก API ภายนอก ---
+# closed: เรียกได้ตามปกติ ; open: ล้มเหลวติดกันเกิน threshold ไม่เรียกเลยจนถึงเวลาลองใหม่
+# half-open: ถึงเวลาลองใหม่แล้ว ปล่อยให้เรียก 1 ครั้ง สำเร็จ = กลับเป็น closed, ล้มเหลว = open ด้วยเวลารอที่นานขึ้น
+# ชีตล่มจึงไม่ถูกเรียกซ้ำทุกรอบ poll/ทุก rerun ระหว่างนั้นหน้าจอใช้ข้อมูลในเครื่องต่อไป
+class CircuitBreaker:
+    def __init__(self, name="sheets", threshold=FAILURE_THRESHOLD, base_delay=BASE_DELAY, max_delay=MAX_DELAY, jitter=JITTER):
+        self.name = name            # ใช้เป็น label ของค่าวัด (metrics)
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.retry_at = 0.0         # time.monotonic() ที่ลองใหม่ได้
+        self.probing = False
+        self.last_error = None
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.failures < self.threshold:
+                return "closed"
+            return "open" if self.probing or time.monotonic() < self.retry_at else "half-open"
+
+    def retry_in(self):
+        # วินาทีก่อนจะลองเรียกครั้งถัดไป (0 = เรียกได้เลย)
+        with self.lock:
+            if self.failures < self.threshold:
+                return 0.0
+            return max(0.0, self.retry_at - time.monotonic())
+
+    def call(self, func):
+        with self.lock:
+            if self.failures >= self.threshold:
+                if self.probing or time.monotonic() < self.retry_at:
+                    METRICS.inc('mg_breaker_rejected_total', breaker=self.name)
+                    raise CircuitOpenError(self.last_error)
+                self.probing = True
+        try:
+            result = func()
+        except Exception as e:
+            self.failure(e)
+            raise
+        self.success()
+        return result
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.retry_at = 0.0
+            self.probing = False
+            self.last_error = None
+
+    def failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            self.last_error = str(error)
+            if self.failures >= self.threshold:
+                if self.failures == self.threshold:
+                    METRICS.inc('mg_breaker_open_total', breaker=self.name)
+                attempt = min(self.failures - self.threshold, 20)
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                self.retry_at = time.monotonic() + delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+# --- สถานะล่าสุดของ poller บนดิสก์ (Warm Start) ---
+# process เริ่มใหม่แล้วโหลดสถานะนี้ได้ทันที ไม่ต้องทำความสะอาด/สรุปข้อมูลย้อนหลังทั้งหมดก่อนแสดงผล
+# เป็นไฟล์ที่ process นี้เขียนเองเท่านั้น (pickle ห้ามใช้กับไฟล์จากแหล่งอื่น)
+def save_state(path, state):
+    # เขียนแบบไฟล์ชั่วคราวแล้ว rename ไฟล์ที่เขียนไม่ครบ (เช่นปิดเครื่องกลางคัน) จะไม่ทับไฟล์เดิม
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump((STATE_VERSION, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load_state(path):
+    # คืนค่า None ถ้าไม่มีไฟล์ ไฟล์เสีย หรือเป็นรูปแบบเก่า (เริ่มจากฐานข้อมูลแบบปกติแทน)
+    try:
+        with open(path, "rb") as f:
+            version, state = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[{time.strftime('%H:%M:%S')}] ignoring saved state {path}: {e}")
+        return None
+    return state if version == STATE_VERSION else None
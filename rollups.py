@@ -0,0 +1,90 @@
+import pandas as pd
+
+from cleaning import SENSOR_COLS, slice_time
+from downsample import MAX_POINTS, downsample_series
+
+# ความละเอียดของตารางสรุป เรียงจากละเอียดไปหยาบ
+RESOLUTIONS = {'1 นาที': '1min', '10 นาที': '10min', 'รายชั่วโมง': '1h', 'รายวัน': '1D'}
+STATS = ['sum', 'count', 'min', 'max']
+MERGE = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+# ตารางที่ถูกตัดตาม retention พร้อมข้อมูลดิบ (ช่วงยาวกว่า MAX_POINTS นาทีไม่ได้ใช้ตารางนี้อยู่แล้ว)
+HOT_RESOLUTIONS = ('1 นาที',)
+
+
+# --- ตารางสรุปค่าเซนเซอร์ตามช่วงเวลา (Rollup) ---
+# เก็บ sum/count/min/max ของแต่ละเซนเซอร์ต่อช่วงเวลา อัปเดตเฉพาะแถวที่เข้ามาใหม่
+# ช่วงสุดท้ายที่ยังไม่ครบจะถูกรวมกับแถวใหม่ ไม่ต้องคำนวณย้อนหลังทั้งตาราง
+class Rollup:
+    def __init__(self, freq):
+        self.freq = freq
+        self.table = pd.DataFrame()
+
+    def update(self, chunk):
+        cols = [c for c in SENSOR_COLS if c in chunk.columns]
+        chunk = chunk[chunk.index.notna()]
+        if chunk.empty or not cols:
+            return self.table
+
+        grouped = chunk[cols].groupby(chunk.index.floor(self.freq)).agg(STATS)
+        if self.table.empty:
+            self.table = grouped
+            return self.table
+
+        # ช่วงที่ทับกับของเดิม (ปกติคือช่วงสุดท้ายช่วงเดียว) รวมค่าเข้าด้วยกัน
+        pos = self.table.index.searchsorted(grouped.index[0], side='left')
+        overlap = pd.concat([self.table.iloc[pos:], grouped])
+        merge = {c: MERGE[c[1]] for c in overlap.columns}
+        merged = overlap.groupby(level=0).agg(merge)
+        self.table = pd.concat([self.table.iloc[:pos], merged])
+        return self.table
+
+    def trim(self, before):
+        pos = self.table.index.searchsorted(before.floor(self.freq), side='left') if not self.table.empty else 0
+        if pos:
+            self.table = self.table.iloc[pos:].copy()
+        return self.table
+
+
+class RollupSet:
+    def __init__(self):
+        self.rollups = {name: Rollup(freq) for name, freq in RESOLUTIONS.items()}
+
+    def update(self, chunk):
+        for rollup in self.rollups.values():
+            rollup.update(chunk)
+
+    def trim(self, before):
+        for name in HOT_RESOLUTIONS:
+            self.rollups[name].trim(before)
+
+    def tables(self):
+        # คืน dict ของตารางปัจจุบัน (update ครั้งถัดไปจะสร้างตารางใหม่ ตารางที่คืนไปจึงไม่ถูกแก้)
+        return {name: rollup.table for name, rollup in self.rollups.items()}
+
+
+def range_series(raw, tables, col, start=None, end=None, max_points=MAX_POINTS, hot_start=None):
+    # เลือกข้อมูลที่ละเอียดที่สุดที่ยังไม่เกิน max_points จุดในช่วงเวลาที่ขอ
+    # คืนค่า (ค่าเฉลี่ย, ค่าต่ำสุด, ค่าสูงสุด, ชื่อความละเอียด) ; ถ้าเป็นข้อมูลดิบ min/max = None
+    # hot_start คือเวลาเริ่มของข้อมูลดิบที่ยังอยู่ในหน่วยความจำ (None = ไม่ถูกตัด) ช่วงที่เก่ากว่านั้นใช้ตารางสรุป
+    in_hot = hot_start is None or (start is not None and start >= hot_start)
+    raw_slice = slice_time(raw, start, end)
+    if in_hot and len(raw_slice) <= max_points:
+        return raw_slice[col], None, None, 'ข้อมูลดิบ'
+
+    for name, freq in RESOLUTIONS.items():
+        table = tables.get(name)
+        if table is None or table.empty or col not in table.columns.get_level_values(0):
+            continue
+        if name in HOT_RESOLUTIONS and not in_hot:
+            continue
+        bucket_start = None if start is None else start.floor(freq)
+        part = slice_time(table, bucket_start, end)
+        if len(part) <= max_points or name == list(RESOLUTIONS)[-1]:
+            mean = (part[(col, 'sum')] / part[(col, 'count')]).rename(col)
+            if len(part) > max_points:
+                mean = downsample_series(mean, max_points)
+            lows = part[(col, 'min')].loc[mean.index]
+            highs = part[(col, 'max')].loc[mean.index]
+            return mean, lows, highs, name
+
+    return downsample_series(raw_slice[col], max_points), None, None, 'ข้อมูลดิบ'
@@ -0,0 +1,185 @@
+import re
+import threading
+import time
+
+import gspread
+from gspread.http_client import HTTPClient
+from gspread.utils import numericise_all, rowcol_to_a1
+from oauth2client.service_account import ServiceAccountCredentials
+
+from metrics import METRICS
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+def column_letter(col):
+    return re.sub(r'\d', '', rowcol_to_a1(1, col))
+
+
+# --- HTTP client ของ gspread ที่นับจำนวนครั้ง/เวลา/ขนาดข้อมูลของทุกการเรียก API ---
+# ทุกคำขอของ gspread ผ่าน request() ตัวนี้ จึงนับได้ครบโดยไม่ต้องแก้จุดที่เรียกใช้
+class InstrumentedHTTPClient(HTTPClient):
+    def request(self, method, endpoint, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = super().request(method, endpoint, *args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            METRICS.inc('mg_sheets_api_errors_total', status=getattr(e, "code", "error"))
+            raise
+        except Exception:
+            METRICS.inc('mg_sheets_api_errors_total', status="network")
+            raise
+        finally:
+            METRICS.inc('mg_sheets_api_calls_total', method=method.upper())
+            METRICS.observe('mg_sheets_api_seconds', time.perf_counter() - started, method=method.upper())
+        METRICS.inc('mg_sheets_api_bytes_total', len(response.content))
+        return response
+
+
+# --- ตัวจัดการการเชื่อมต่อ Google Sheets (ใช้ร่วมกันทั้ง process) ---
+# เก็บ client ที่ authorize แล้ว และ worksheet ที่เปิดไว้ ไม่ต้อง OAuth + open ใหม่ทุก rerun
+# token หมดอายุจะถูก refresh อัตโนมัติโดย session ของ google-auth ที่ gspread ใช้อยู่
+class SheetsConnection:
+    REAUTH_AFTER = 6 * 60 * 60  # สร้าง client ใหม่เป็นระยะ เผื่อ session ค้าง
+
+    def __init__(self, creds_info, spreadsheet_name="Project IOT"):
+        self.creds_info = dict(creds_info)
+        if "private_key" in self.creds_info:
+            self.creds_info["private_key"] = self.creds_info["private_key"].replace("\\n", "\n")
+        self.spreadsheet_name = spreadsheet_name
+        self.lock = threading.RLock()
+        self.invalidate()
+
+    def invalidate(self):
+        # ล้าง client/worksheet ที่ cache ไว้ (เช่นเมื่อเจอ 401 หรือชีตถูกลบ)
+        with self.lock:
+            self._client = None
+            self._authorized_at = 0
+            self._spreadsheets = {}
+            self._worksheets = {}
+
+    def client(self):
+        with self.lock:
+            if self._client is None or time.monotonic() - self._authorized_at > self.REAUTH_AFTER:
+                creds = ServiceAccountCredentials.from_json_keyfile_dict(self.creds_info, SCOPE)
+                self._client = gspread.authorize(creds, http_client=InstrumentedHTTPClient)
+                self._authorized_at = time.monotonic()
+                self._spreadsheets = {}
+                self._worksheets = {}
+            return self._client
+
+    def spreadsheet(self, name=None):
+        # name=None คือไฟล์หลัก (spreadsheet_name) ; แต่ละแปลงปลูกอาจใช้ไฟล์ของตัวเอง
+        name = name or self.spreadsheet_name
+        with self.lock:
+            client = self.client()
+            if name not in self._spreadsheets:
+                self._spreadsheets[name] = client.open(name)
+            return self._spreadsheets[name]
+
+    def worksheet(self, title=None, create=False, rows=100, cols=20, spreadsheet=None):
+        # title=None คือชีตแรก (ข้อมูลเซนเซอร์จาก ESP32) ; title เป็นตัวเลขคือลำดับชีต
+        with self.lock:
+            key = (spreadsheet or self.spreadsheet_name, title)
+            if key not in self._worksheets:
+                book = self.spreadsheet(spreadsheet)
+                if title is None or isinstance(title, int):
+                    sheet = book.get_worksheet(title or 0)
+                else:
+                    try:
+                        sheet = book.worksheet(title)
+                    except gspread.exceptions.WorksheetNotFound:
+                        if not create:
+                            raise
+                        sheet = book.add_worksheet(title=title, rows=str(rows), cols=str(cols))
+                self._worksheets[key] = sheet
+            return self._worksheets[key]
+
+    def run(self, func):
+        # func ต้องขอ worksheet ผ่าน connection นี้ภายในตัวเอง
+        # ถ้าสิทธิ์หมดอายุ (401) จะ authorize ใหม่แล้วเรียก func อีกครั้ง
+        try:
+            return func()
+        except gspread.exceptions.APIError as e:
+            if getattr(e, "code", None) != 401:
+                raise
+            self.invalidate()
+            return func()
+
+
+# --- ตัวอ่านชีตแบบดึงเฉพาะแถวใหม่ (Incremental Fetch) ---
+# จำแถวล่าสุดที่ดึงมาแล้ว แล้วขอเฉพาะช่วงแถวที่ต่อท้ายเข้ามาใหม่
+# แทนการเรียก get_all_records() ทั้งชีตทุกครั้ง
+# โหลดใหม่ทั้งชีตเมื่อหัวตารางเปลี่ยน (เพิ่ม/สลับ/เปลี่ยนชื่อคอลัมน์) หรือแถวล่าสุดที่เคยดึงถูกลบ/แก้ไข
+# การแก้ไขแถวที่เก่ากว่านั้นตรวจไม่พบ (ต้องอ่านทั้งชีต) และฐานข้อมูลเก็บแบบต่อท้ายอย่างเดียวอยู่แล้ว
+class SheetTail:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.header = []
+        self.last_row = 1          # เลขแถวล่าสุดที่ดึงมาแล้ว (แถวที่ 1 คือหัวตาราง)
+        self.last_values = None    # ค่าดิบของแถวล่าสุด ใช้ตรวจว่าแถวนั้นถูกลบ/แก้ไข (ชีตถูกล้างหรือตัดแถว) หรือไม่
+
+    def state(self):
+        return {"header": self.header, "last_row": self.last_row, "last_values": self.last_values}
+
+    def restore(self, state):
+        # ต่อจากตำแหน่งที่บันทึกไว้ในฐานข้อมูล (เช่นหลังรีสตาร์ท) โดยไม่ต้องโหลดใหม่ทั้งชีต
+        if state:
+            self.header = list(state["header"])
+            self.last_row = state["last_row"]
+            self.last_values = state["last_values"]
+        else:
+            self.reset()
+
+    def _pad(self, row):
+        row = list(row[:len(self.header)])
+        return row + [''] * (len(self.header) - len(row))
+
+    def fetch_new_rows(self):
+        # ขอตั้งแต่แถวล่าสุดที่เคยเห็น (ไม่ใช่แถวถัดไป) เพื่อเช็คว่าข้อมูลเดิมยังตรงกันอยู่
+        start = max(self.last_row, 2)
+        if not self.header:
+            self.header = [str(h) for h in self.worksheet.row_values(1)]
+            if not self.header:
+                return 0, []
+            rows = self.worksheet.get_values(f"A{start}:{column_letter(len(self.header))}")
+        else:
+            # อ่านหัวตารางซ้ำทุกรอบใน request เดียวกับแถวใหม่ (batch_get) ไม่เพิ่มจำนวนครั้งที่เรียก API
+            header_rows, rows = self.worksheet.batch_get(["1:1", f"A{start}:{column_letter(len(self.header))}"])
+            if [str(h) for h in (header_rows[0] if header_rows else [])] != self.header:
+                self.reset()
+                return None
+        rows = [self._pad(r) for r in rows]
+
+        first = start
+        if self.last_values is not None:
+            if not rows or rows[0] != self.last_values:
+                # แถวล่าสุดถูกลบ/แก้ไข (ล้างชีตหรือตัดแถวออก) -> โหลดใหม่ทั้งหมดครั้งเดียว
+                self.reset()
+                return None
+            rows = rows[1:]
+            first = start + 1
+
+        # ตัดแถวว่างท้ายชีตออก
+        while rows and not any(str(v).strip() for v in rows[-1]):
+            rows.pop()
+
+        if rows:
+            self.last_row = first + len(rows) - 1
+            self.last_values = rows[-1]
+        return first, rows
+
+    def read_new_rows(self):
+        # คืนค่า (เลขแถวแรก, แถวใหม่ที่แปลงตัวเลขแบบ get_all_records(), โหลดใหม่ทั้งชีตหรือไม่)
+        with self.lock:
+            reloaded = False
+            result = self.fetch_new_rows()
+            if result is None:
+                reloaded = True
+                result = self.fetch_new_rows()
+            first, rows = result
+            return first, [numericise_all(r) for r in rows], reloaded
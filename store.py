@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+DB_PATH = os.environ.get("MG_DB_PATH", os.path.join("data", "sensors.sqlite"))
+TIMEZONE = "Asia/Bangkok"
+TIMESTAMP_FORMATS = ["%d/%m/%Y, %H:%M:%S", "%d/%m/%Y, %H:%M"]
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def to_epoch_seconds(timestamps):
+    # แปลงสตริงเวลา "dd/mm/YYYY, HH:MM:SS" (เวลาไทย) เป็น epoch วินาที, แปลงไม่ได้ = NaN
+    text = pd.Series(timestamps, dtype="object").astype(str).str.strip()
+    parsed = pd.to_datetime(text, format=TIMESTAMP_FORMATS[0], errors="coerce")
+    for fmt in TIMESTAMP_FORMATS[1:]:
+        missing = parsed.isna()
+        if missing.any():
+            parsed[missing] = pd.to_datetime(text[missing], format=fmt, errors="coerce")
+    parsed = parsed.dt.tz_localize(TIMEZONE, ambiguous="NaT", nonexistent="NaT")
+    return (parsed - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+
+
+# --- ฐานข้อมูลเซนเซอร์ในเครื่อง (SQLite) ---
+# เก็บทุกแถวที่ sync มาจากชีต พร้อมคอลัมน์เวลา _ts (epoch วินาที) ที่มี index
+# คอลัมน์ข้อมูลสร้างตามหัวตารางของชีตโดยอัตโนมัติ
+class SensorStore:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.local = threading.local()
+        with self.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS readings ("
+                "_id INTEGER PRIMARY KEY AUTOINCREMENT, _sheet_row INTEGER, _ts INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS readings_ts ON readings (_ts)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def connection(self):
+        # แยก connection ต่อ thread (หลาย session ของ Streamlit อ่านพร้อมกันได้ด้วย WAL)
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE: มีผู้เขียนได้ทีละรายเดียว (กัน sync ซ้อนกันจากหลาย process)
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def get_meta(self, key, default=None):
+        row = self.connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        self.connection().execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value))
+        )
+
+    def columns(self):
+        return self.get_meta("columns", [])
+
+    def _ensure_columns(self, conn, header):
+        known = self.columns()
+        added = [h for h in header if h not in known]
+        for name in added:
+            conn.execute(f"ALTER TABLE readings ADD COLUMN {quote(name)}")
+        if added:
+            self.set_meta("columns", known + added)
+
+    def append_rows(self, header, records, sheet_rows=None, only_newer=False):
+        # ต้องเรียกภายใน transaction(); records คือ list ของ list เรียงตาม header
+        if not records:
+            return 0
+        conn = self.connection()
+        self._ensure_columns(conn, header)
+
+        frame = pd.DataFrame(records, columns=header)
+        frame["_sheet_row"] = sheet_rows if sheet_rows is not None else None
+        if "Timestamp" in frame.columns:
+            frame["_ts"] = to_epoch_seconds(frame["Timestamp"]).astype("Int64")
+        else:
+            frame["_ts"] = None
+
+        if only_newer:
+            # ชีตถูกโหลดใหม่ทั้งหมด: เก็บเฉพาะแถวที่ใหม่กว่าข้อมูลที่มีอยู่แล้ว
+            last_ts = conn.execute("SELECT MAX(_ts) FROM readings").fetchone()[0]
+            if last_ts is not None:
+                frame = frame[(frame["_ts"] > last_ts).fillna(False)]
+
+        frame = frame.astype(object).where(frame.notna(), None)
+        cols = list(frame.columns)
+        sql = (
+            f"INSERT INTO readings ({', '.join(quote(c) for c in cols)}) "
+            f"VALUES ({', '.join('?' * len(cols))})"
+        )
+        conn.executemany(sql, frame.itertuples(index=False, name=None))
+        return len(frame)
+
+    def version(self):
+        # เลข _id ล่าสุด ใช้เป็นกุญแจ cache ของข้อมูลที่อ่านออกไป
+        row = self.connection().execute("SELECT MAX(_id) FROM readings").fetchone()
+        return row[0] or 0
+
+    def first_id(self, start_ts):
+        # _id แรกของแถวที่เวลาตั้งแต่ start_ts (แถวแรกของ iter_chunks เมื่อกำหนด start_ts) ; None = ไม่มี
+        row = self.connection().execute("SELECT MIN(_id) FROM readings WHERE _ts >= ?", (int(start_ts),)).fetchone()
+        return row[0]
+
+    def recent_values(self, column, before_id, limit=50):
+        # ค่าที่ไม่ว่างล่าสุดของคอลัมน์ก่อนแถว before_id เรียงจากใหม่ไปเก่า
+        sql = (
+            f"SELECT {quote(column)} FROM readings WHERE _id < ? AND {quote(column)} IS NOT NULL "
+            f"AND TRIM({quote(column)}) != '' ORDER BY _id DESC LIMIT ?"
+        )
+        return [row[0] for row in self.connection().execute(sql, (int(before_id), int(limit)))]
+
+    def _select(self, start_ts=None, end_ts=None, after_id=None, with_internal=False, limit=None):
+        cols = self.columns()
+        if not cols:
+            return None, []
+        select = [quote(c) for c in cols]
+        if with_internal:
+            select = ["_id", "_ts"] + select
+        sql = f"SELECT {', '.join(select)} FROM readings"
+        where, params = [], []
+        if after_id is not None:
+            where.append("_id > ?")
+            params.append(int(after_id))
+        if start_ts is not None:
+            where.append("_ts >= ?")
+            params.append(int(start_ts))
+        if end_ts is not None:
+            where.append("_ts < ?")
+            params.append(int(end_ts))
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY _id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return sql, params
+
+    def load(self, start_ts=None, end_ts=None, after_id=None, with_internal=False, limit=None):
+        sql, params = self._select(start_ts, end_ts, after_id, with_internal, limit)
+        if sql is None:
+            return pd.DataFrame()
+        return pd.read_sql_query(sql, self.connection(), params=params)
+
+    def iter_chunks(self, start_ts=None, end_ts=None, chunksize=10000, with_internal=False):
+        # อ่านทีละก้อน สำหรับงานที่ไม่ควรโหลดทั้งตารางเข้าหน่วยความจำ (เช่น export)
+        sql, params = self._select(start_ts, end_ts, None, with_internal)
+        if sql is None:
+            return iter(())
+        return pd.read_sql_query(sql, self.connection(), params=params, chunksize=chunksize)
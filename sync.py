@@ -0,0 +1,75 @@
+import argparse
+import os
+import time
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS, write_textfile
+from resilience import CircuitBreaker, CircuitOpenError
+from sheets import SheetsConnection
+from store import SensorStore
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+
+
+def sync_once(tail, store, device_id="default"):
+    # ดึงแถวใหม่จากชีตลงฐานข้อมูลในเครื่อง คืนค่าจำนวนแถวที่เพิ่ม
+    # ตำแหน่งล่าสุดของชีตเก็บใน meta ของฐานข้อมูล ทำให้หลาย process sync ร่วมกันได้
+    # อ่านชีตนอก transaction (ไม่ถือ write lock ของ SQLite ระหว่างรอ Sheets API ซึ่งอาจลองใหม่/ขอ token ใหม่)
+    # ผู้เขียนอื่น (ingest, alert) จึงไม่ต้องรอ ; transaction ครอบเฉพาะการเขียนแถวและตำแหน่งชีต
+    with METRICS.timer('mg_sync_seconds', device=device_id):
+        start = store.get_meta("sheet_tail")
+        tail.restore(start)
+        first, rows, reloaded = tail.read_new_rows()
+        sheet_rows = list(range(first, first + len(rows)))
+        with store.transaction():
+            if store.get_meta("sheet_tail") != start:
+                # process อื่น sync ช่วงเดียวกันไปแล้วระหว่างที่อ่านชีต: ทิ้งผลรอบนี้ (รอบถัดไปอ่านต่อจากตำแหน่งใหม่)
+                added = 0
+            else:
+                added = store.append_rows(tail.header, rows, sheet_rows=sheet_rows, only_newer=reloaded)
+                store.set_meta("sheet_tail", tail.state())
+    METRICS.inc('mg_sync_rows_total', added, device=device_id)
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync Project IOT sheet into the local sensor store")
+    parser.add_argument("--interval", type=float, default=30, help="seconds between syncs")
+    parser.add_argument("--once", action="store_true", help="sync a single time and exit")
+    parser.add_argument("--secrets", default=SECRETS_PATH)
+    parser.add_argument("--metrics", help="write Prometheus text metrics to this file after every sync")
+    args = parser.parse_args()
+
+    with open(args.secrets, "rb") as f:
+        secrets = tomllib.load(f)
+
+    # ทุกแปลงใน [[devices]] sync พร้อมกันผ่าน thread pool ขนาดจำกัด แต่ละแปลงเขียนฐานข้อมูลของตัวเอง
+    from devices import MAX_WORKERS, device_db_path, device_sync, load_devices
+    sheets = SheetsConnection(secrets["gcp_service_account"])
+    devices = load_devices(secrets)
+    stores = {d.id: SensorStore(device_db_path(d.id)) for d in devices}
+    syncs = {d.id: device_sync(sheets, d, stores[d.id]) for d in devices}
+    # ชีตของแปลงที่ล้มเหลวติดกันจะถูกเว้นไปก่อน (exponential backoff) ไม่เรียก API ซ้ำทุกรอบ
+    breakers = {d.id: CircuitBreaker(f"sync:{d.id}") for d in devices}
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        while True:
+            futures = {device_id: pool.submit(breakers[device_id].call, sync) for device_id, sync in syncs.items()}
+            for device_id, future in futures.items():
+                try:
+                    added = future.result()
+                    print(f"[{time.strftime('%H:%M:%S')}] {device_id}: +{added} rows (total id {stores[device_id].version()})")
+                except CircuitOpenError:
+                    print(f"[{time.strftime('%H:%M:%S')}] {device_id}: skipped, retry in {breakers[device_id].retry_in():.0f}s")
+                except Exception as e:
+                    print(f"[{time.strftime('%H:%M:%S')}] {device_id}: sync failed: {e}")
+            if args.metrics:
+                write_textfile(args.metrics)
+            if args.once:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from actuators import ACTUATORS, ActuatorLog, normalize_state
+from health import MAX_GAP
+
+
+def updated(chunks, **kwargs):
+    log = ActuatorLog(**kwargs)
+    for chunk in chunks:
+        log.update(chunk)
+    return log.report()
+
+
+def recount(frame, actuator, active):
+    # คำนวณจากทั้งตาราง: ช่วงเวลาระหว่างแถว i-1 ถึง i นับเป็นสถานะของแถว i-1
+    states = pd.Series(normalize_state(frame[actuator]), index=frame.index)
+    seconds = frame.index.as_unit('s').asi8.astype(float)
+    gaps = pd.Series(np.clip(np.diff(seconds, prepend=seconds[0]), 0, MAX_GAP), index=frame.index)
+    days = pd.Series(frame.index.tz_localize(None).normalize().date, index=frame.index)
+    previous = states.shift(1)
+    on = previous == active
+    runtime = gaps[on].groupby(days.shift(1)[on]).sum().to_dict()
+    starts = states != previous
+    activations = days[starts & (states == active)].value_counts().to_dict()
+    bounds = list(np.flatnonzero(starts)) + [len(states)]
+    events = [
+        (states.iloc[lo], frame.index[lo], frame.index[hi] if hi < len(states) else None,
+         gaps.iloc[lo + 1:hi + 1].sum())
+        for lo, hi in zip(bounds, bounds[1:])
+    ]
+    return runtime, activations, events
+
+
+def test_incremental_log_matches_a_full_recount(sensor_frame, sensor_chunks):
+    report = updated(sensor_chunks)
+    expected = updated([sensor_frame])
+    assert report[:3] == expected[:3] and report.activations == expected.activations
+    for actuator, active in ACTUATORS.items():
+        assert report.runtime[actuator] == pytest.approx(expected.runtime[actuator])
+        runtime, activations, events = recount(sensor_frame, actuator, active)
+        assert report.runtime[actuator] == pytest.approx(runtime)
+        assert report.activations[actuator] == activations
+        assert [e[1:4] for e in report.events[actuator]] == [e[:3] for e in events]
+        assert [e.seconds for e in report.events[actuator]] == pytest.approx([e[3] for e in events])
+        assert report.last_on[actuator] == max(e.start for e in report.events[actuator] if e.state == active)
+        assert report.state[actuator] == events[-1][0]
+    assert sum(report.activations['Pump'].values()) == 5     # รดน้ำทุก 6 ชม. ในข้อมูล 25 ชม.
+
+
+def test_event_history_keeps_the_latest_events(sensor_frame, sensor_chunks):
+    full = updated([sensor_frame])
+    report = updated(sensor_chunks, max_events=5)
+    for actuator, events in full.events.items():
+        # 5 ช่วงที่จบแล้วล่าสุด + ช่วงที่กำลังดำเนินอยู่
+        kept = report.events[actuator]
+        assert len(events) > 6 and [e[:4] for e in kept] == [e[:4] for e in events[-6:]]
+        assert [e.seconds for e in kept] == pytest.approx([e.seconds for e in events[-6:]])
+        assert report.runtime[actuator] == pytest.approx(full.runtime[actuator])
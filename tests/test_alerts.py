@@ -0,0 +1,84 @@
+import pandas as pd
+
+from alerts import HOLD, AlertMonitor
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ListSink:
+    def __init__(self):
+        self.alerts = []
+
+    def send(self, alert):
+        self.alerts.append(alert)
+
+
+class Readings:
+    # แถวต่อเนื่องทุก 30 วินาที ; มีแค่อุณหภูมิที่เปลี่ยน ค่าอื่นอยู่ในช่วงปกติ
+    def __init__(self):
+        self.rows = 0
+
+    def __call__(self, *temps):
+        index = pd.date_range("2026-03-01 12:00", periods=self.rows + len(temps), freq="30s", tz="Asia/Bangkok", name="Time")
+        self.rows += len(temps)
+        return pd.DataFrame(
+            {'AirTemp': temps, 'AirHumid': 60.0, 'SoilHumid': 60.0, 'LightLux': 0.0}, index=index[-len(temps):]
+        ).astype('float32')
+
+
+def levels(alerts):
+    return [(a.key, a.level) for a in alerts]
+
+
+def test_conditions_must_hold_before_alerting_and_resolving():
+    sink, feed = ListSink(), Readings()
+    monitor = AlertMonitor([sink], clock=Clock())
+    spike = feed(27, 27, 32, 32, 32, 27)      # เกินช่วงแค่ 60 วินาที
+    assert monitor.update(spike) == []
+    hot = feed(*[32.0] * 6)
+    assert levels(monitor.update(hot)) == [('AirTemp', 'warning')]
+    assert sink.alerts[0].time == hot.index[HOLD // 30]
+    assert "32.0" in sink.alerts[0].message
+    cool = feed(*[27.0] * 6)
+    assert levels(monitor.update(cool)) == [('AirTemp', 'resolved')]
+    assert sink.alerts[1].time == cool.index[HOLD // 30]
+
+
+def test_cooldown_and_hourly_limit_suppress_repeats():
+    clock, sink, feed = Clock(), ListSink(), Readings()
+    monitor = AlertMonitor([sink], clock=clock, cooldown=600, max_per_hour=4)
+
+    def cycle():
+        return levels(monitor.update(feed(*[32.0] * 5))) + levels(monitor.update(feed(*[27.0] * 5)))
+
+    assert cycle() == [('AirTemp', 'warning'), ('AirTemp', 'resolved')]
+    # หัวข้อเดิมซ้ำภายใน COOLDOWN ไม่ส่ง และไม่ส่ง "resolved" ของการแจ้งเตือนที่ไม่ได้ส่ง
+    clock.now += 60
+    assert cycle() == [] and monitor.suppressed == 1
+    clock.now += monitor.cooldown
+    assert cycle() == [('AirTemp', 'warning'), ('AirTemp', 'resolved')]
+    # ส่งครบ 4 ครั้งในชั่วโมงนี้แล้ว
+    clock.now += monitor.cooldown
+    assert cycle() == [] and monitor.suppressed == 2
+    clock.now += 3600
+    assert cycle() == [('AirTemp', 'warning'), ('AirTemp', 'resolved')]
+    assert len(sink.alerts) == 6
+
+
+def test_chunked_updates_send_the_same_alerts(sensor_frame, sensor_chunks):
+    def run(chunks):
+        sink = ListSink()
+        monitor = AlertMonitor([sink], cooldown=0, max_per_hour=10000, clock=Clock())
+        for chunk in chunks:
+            monitor.update(chunk)
+        return sink.alerts
+
+    alerts = run(sensor_chunks)
+    assert alerts == run([sensor_frame])
+    assert {'warning', 'resolved'} <= {a.level for a in alerts}
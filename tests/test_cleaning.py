@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import synthetic_rows
+from cleaning import CATEGORY_COLS, SensorCleaner, slice_time
+from store import SensorStore
+
+ROWS = 3000
+# จุดแบ่ง chunk: แถวเดียว, ขนาดไม่เท่ากัน, และตรงจุดเริ่มรอบการทดลองใหม่ (แถว 1000, 2000)
+SPLITS = [0, 1, 7, 500, 1000, 1001, 2000, 2500, ROWS]
+
+
+def frame_at(minutes):
+    index = pd.DatetimeIndex(
+        [pd.NaT if m is None else pd.Timestamp("2026-03-01", tz="Asia/Bangkok") + pd.Timedelta(minutes=m) for m in minutes]
+    )
+    return pd.DataFrame({'AirTemp': np.arange(len(minutes), dtype='float32')}, index=index)
+
+
+def at(minute):
+    return pd.Timestamp("2026-03-01", tz="Asia/Bangkok") + pd.Timedelta(minutes=minute)
+
+
+def test_slice_time_sorted_index():
+    frame = frame_at([0, 5, 10, 15, 20])
+    assert slice_time(frame, at(5), at(15))['AirTemp'].tolist() == [1, 2]
+    assert slice_time(frame, at(12))['AirTemp'].tolist() == [3, 4]
+    assert slice_time(frame, end=at(10))['AirTemp'].tolist() == [0, 1]
+    assert len(slice_time(frame)) == 5
+
+
+def test_slice_time_out_of_order_index():
+    # แถวที่ 3 มาช้า (นาฬิกาอุปกรณ์ย้อนหลัง) binary search จะตัดผิด
+    frame = frame_at([0, 5, 10, 2, 15, 20])
+    assert slice_time(frame, at(1), at(12))['AirTemp'].tolist() == [1, 2, 3]
+    assert slice_time(frame, at(12))['AirTemp'].tolist() == [4, 5]
+    assert slice_time(frame, at(1), at(4))['AirTemp'].tolist() == [3]
+
+
+def test_slice_time_skips_missing_times():
+    frame = frame_at([0, None, 10, 20])
+    assert slice_time(frame, at(5))['AirTemp'].tolist() == [2, 3]
+    assert slice_time(frame, end=at(15))['AirTemp'].tolist() == [0, 2]
+
+
+@pytest.fixture
+def raw(tmp_path):
+    # ข้อมูลดิบแบบที่ poller อ่านจากฐานข้อมูล ; แถวแรกของทุก chunk อ่านค่าเซนเซอร์ไม่ได้ (ต้อง ffill ข้าม chunk)
+    header, rows = synthetic_rows(ROWS)
+    for start in SPLITS[1:-1]:
+        rows[start][2], rows[start][3] = '', 'n/a'
+    store = SensorStore(str(tmp_path / "sensors.sqlite"))
+    store.append_rows(header, rows)
+    return store.load(with_internal=True)
+
+
+def chunks(frame, splits=SPLITS):
+    return [frame.iloc[lo:hi] for lo, hi in zip(splits, splits[1:])]
+
+
+def as_values(frame):
+    # ชุด category ของ chunk ต่างกันตามเวลาที่ประมวลผล เทียบเฉพาะค่า
+    return frame.astype({c: object for c in CATEGORY_COLS if c in frame.columns})
+
+
+def test_incremental_cleaning_matches_one_pass(raw):
+    full = SensorCleaner()
+    full.update(raw)
+    cleaner = SensorCleaner()
+    parts = [cleaner.update(part) for part in chunks(raw)]
+
+    pd.testing.assert_frame_equal(cleaner.frame, full.frame)
+    assert cleaner.carry == full.carry and cleaner.last_id == full.last_id == ROWS
+    for part, expected in zip(parts, chunks(full.frame)):
+        pd.testing.assert_frame_equal(as_values(part), as_values(expected))
+    assert cleaner.frame['AirTemp'].iloc[1000] == cleaner.frame['AirTemp'].iloc[999] != 0
+
+
+def test_published_frames_stay_unchanged_by_appends_and_trims(raw, monkeypatch):
+    monkeypatch.setattr(SensorCleaner, 'MIN_CAPACITY', 16)
+    cleaner = SensorCleaner()
+    published = []
+    for part in chunks(raw):
+        cleaner.update(part)
+        published.append((cleaner.frame, cleaner.frame.copy()))
+        if len(cleaner.frame) > 1500:
+            cleaner.trim(cleaner.frame.index[500])
+            published.append((cleaner.frame, cleaner.frame.copy()))
+    for frame, copy in published:
+        pd.testing.assert_frame_equal(frame, copy)
+
+
+def test_trim_keeps_the_same_rows_as_slicing_a_full_clean(raw, monkeypatch):
+    monkeypatch.setattr(SensorCleaner, 'MIN_CAPACITY', 16)
+    full = SensorCleaner()
+    full.update(raw)
+    cutoff = full.frame.index[1200]
+
+    cleaner = SensorCleaner()
+    cleaner.update(raw.iloc[:2000])
+    assert cleaner.trim(full.frame.index[0]) == 0
+    assert cleaner.trim(cutoff) == 1200
+    pd.testing.assert_frame_equal(cleaner.frame, full.frame.iloc[1200:2000])
+    cleaner.update(raw.iloc[2000:2500])
+    cleaner.update(raw.iloc[2500:])
+    pd.testing.assert_frame_equal(cleaner.frame, full.frame.iloc[1200:])
+    assert cleaner.carry == full.carry
+
+
+def test_trim_past_the_last_row_empties_the_frame(raw):
+    full = SensorCleaner()
+    full.update(raw)
+    cleaner = SensorCleaner()
+    cleaner.update(raw.iloc[:1000])
+    assert cleaner.trim(full.frame.index[1000]) == 1000
+    assert cleaner.frame.empty
+    cleaner.update(raw.iloc[1000:])
+    pd.testing.assert_frame_equal(cleaner.frame, full.frame.iloc[1000:])
@@ -0,0 +1,60 @@
+import gzip
+from functools import partial
+
+import pandas as pd
+import pytest
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+from benchmark import synthetic_rows
+from export import EXPORT_FORMATS, export_file
+from store import SensorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    header, rows = synthetic_rows(500)
+    store = SensorStore(str(tmp_path / "sensors.sqlite"))
+    store.append_rows(header, rows)
+    return store
+
+
+def run_deferred(callable_, mime):
+    # เรียกผ่านเส้นทางเดียวกับที่ st.download_button ใช้ตอนผู้ใช้กดดาวน์โหลด
+    storage = MemoryMediaFileStorage("/media")
+    manager = MediaFileManager(storage)
+    file_id = manager.add_deferred(callable_, mime, "test-coordinates", "export")
+    url = manager.execute_deferred(file_id)
+    return storage.get_file(url.rsplit("/", 1)[-1].split(".")[0]).content
+
+
+@pytest.mark.parametrize("label", list(EXPORT_FORMATS))
+def test_export_runs_through_deferred_download(store, label):
+    ext, mime = EXPORT_FORMATS[label]
+    content = run_deferred(partial(export_file, store, ext), mime)
+    assert content == export_file(store, ext)
+    if ext == 'csv':
+        assert content.startswith(b'\xef\xbb\xbf')
+        assert content.decode('utf-8-sig').count('\n') == 501
+    elif ext == 'csv.gz':
+        assert gzip.decompress(content).decode('utf-8-sig').count('\n') == 501
+
+
+def test_range_export_carries_values_from_before_the_start(tmp_path):
+    store = SensorStore(str(tmp_path / "sensors.sqlite"))
+    header = ['Timestamp', 'Air Temp', 'SoilHumid']
+    store.append_rows(header, [
+        ["01/01/2026, 00:00:00", "27.5", "61%"],
+        ["01/01/2026, 00:01:00", "", "bad"],
+        ["01/01/2026, 00:02:00", "", ""],
+        ["01/01/2026, 00:03:00", "28.0", ""],
+    ])
+    start = pd.Timestamp("2026-01-01 00:02", tz="Asia/Bangkok").timestamp()
+    lines = export_file(store, 'csv', start).decode('utf-8-sig').splitlines()
+    assert lines[1:] == ['"01/01/2026, 00:02:00",27.5,61.0', '"01/01/2026, 00:03:00",28.0,61.0']
+
+
+def test_export_respects_start(store):
+    start = pd.Timestamp("2026-01-01 02:00", tz="Asia/Bangkok")
+    lines = export_file(store, 'csv', start.timestamp()).decode('utf-8-sig').splitlines()
+    assert 1 < len(lines) < 501
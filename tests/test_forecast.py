@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from forecast import BOUNDS, HORIZON_STEPS, SensorForecaster
+
+
+def assert_same_forecasts(forecasts, expected):
+    assert forecasts.keys() == expected.keys()
+    for col, series in expected.items():
+        pd.testing.assert_series_equal(forecasts[col], series)
+
+
+def test_incremental_forecasts_match_one_pass_after_every_chunk(sensor_frame, sensor_chunks):
+    forecaster = SensorForecaster()
+    rows = 0
+    for chunk in sensor_chunks:
+        forecaster.update(chunk)
+        rows += len(chunk)
+        # ช่วง 10 นาทีสุดท้ายที่ยังไม่ครบ (แบ่ง chunk กลางช่วง) ต้องให้ผลเหมือนอ่านครั้งเดียว
+        expected = SensorForecaster()
+        expected.update(sensor_frame.iloc[:rows])
+        assert_same_forecasts(forecaster.forecasts(), expected.forecasts())
+        assert forecaster.buckets == expected.buckets
+        np.testing.assert_allclose(forecaster.baseline, expected.baseline)
+        np.testing.assert_allclose(forecaster.level, expected.level)
+
+
+def test_forecast_starts_at_the_last_reading_and_stays_in_bounds(sensor_frame):
+    forecaster = SensorForecaster()
+    assert forecaster.forecasts() == {}
+    forecaster.update(sensor_frame.iloc[:20])     # ยังไม่ครบ 1 ชม.
+    assert forecaster.forecasts() == {}
+    forecaster.update(sensor_frame.iloc[20:])
+    forecasts = forecaster.forecasts()
+    last = sensor_frame.iloc[-1]
+    for col, series in forecasts.items():
+        assert len(series) == HORIZON_STEPS + 1 and series.index[0] == sensor_frame.index[-1]
+        assert series.iloc[0] == last[col]
+        low, high = BOUNDS.get(col, (None, None))
+        assert low is None or series.min() >= low
+        assert high is None or series.max() <= high
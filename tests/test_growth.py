@@ -0,0 +1,137 @@
+import pandas as pd
+import pytest
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol
+
+from growth import GrowthCache, GrowthConflictError, changed_ranges, frame_to_grid, grid_version, save_growth
+
+
+class FakeSheet:
+    def __init__(self, grid):
+        self.grid = [list(row) for row in grid]
+        self.reads = 0
+        self.range_reads = []
+        self.updates = []
+
+    def get_all_values(self, value_render_option=None):
+        self.reads += 1
+        return [list(row) for row in self.grid]
+
+    def batch_get(self, ranges, value_render_option=None):
+        self.range_reads.append(list(ranges))
+        out = []
+        for a1 in ranges:
+            bounds = a1_range_to_grid_range(a1)
+            rows = self.grid[bounds['startRowIndex']:bounds['endRowIndex']]
+            out.append([row[bounds['startColumnIndex']:bounds['endColumnIndex']] for row in rows])
+        return out
+
+    def batch_update(self, updates):
+        self.updates.append(updates)
+        for update in updates:
+            row, col = a1_to_rowcol(update['range'].split(':')[0])
+            values = update['values'][0]
+            while len(self.grid) < row:
+                self.grid.append([])
+            cells = self.grid[row - 1]
+            cells += [''] * (col - 1 + len(values) - len(cells))
+            cells[col - 1:col - 1 + len(values)] = values
+
+
+GRID = [['Period', 'Stem_Trial1'], ['วันที่ 4', 2], ['วันที่ 6', 5]]
+
+
+def growth(stems):
+    return pd.DataFrame({'Period': [f"วันที่ {4 + 2 * i}" for i in range(len(stems))], 'Stem_Trial1': stems})
+
+
+def test_changed_ranges_merges_adjacent_cells_in_a_row():
+    old = [['a', 'b', 'c', 'd'], ['1', '2', '3', '4']]
+    new = [['a', 'x', 'y', 'd'], ['1', '2', '3', 'z']]
+    assert changed_ranges(old, new) == [
+        {'range': 'B1:C1', 'values': [['x', 'y']]},
+        {'range': 'D2:D2', 'values': [['z']]},
+    ]
+
+
+def test_changed_ranges_splits_on_unchanged_cells():
+    assert [u['range'] for u in changed_ranges([['1', '2', '3']], [['9', '2', '9']])] == ['A1:A1', 'C1:C1']
+
+
+def test_changed_ranges_ignores_number_formatting_and_blanks():
+    old = [['Period', 'Stem'], ['วันที่ 4', 2]]
+    new = [['Period', 'Stem', ''], ['วันที่ 4', '2.0'], [None, float('nan')]]
+    assert changed_ranges(old, new) == []
+
+
+def test_changed_ranges_blanks_removed_rows_and_fills_new_ones():
+    updates = changed_ranges([['a'], ['b'], ['c']], [['a'], ['d', 'e']])
+    assert updates == [
+        {'range': 'A2:B2', 'values': [['d', 'e']]},
+        {'range': 'A3:A3', 'values': [['']]},
+    ]
+
+
+def test_grid_version_ignores_formatting_but_not_values():
+    assert grid_version([['a', 2], ['', '']]) == grid_version([['a', '2.0', '']])
+    assert grid_version([['a', 2]]) != grid_version([['a', 3]])
+
+
+def test_save_writes_only_changed_cells_and_updates_version():
+    sheet = FakeSheet(GRID)
+    cache = GrowthCache(lambda: sheet)
+    df, version = cache.get()
+    df.loc[1, 'Stem_Trial1'] = 6.0
+    new_version = cache.save(df, version)
+    assert sheet.updates == [[{'range': 'B3:B3', 'values': [[6.0]]}]]
+    assert sheet.reads == 1 and sheet.range_reads == [['B3:B3']]
+    assert new_version == grid_version(sheet.grid) != version
+    saved, current = cache.get()
+    assert current == new_version and saved['Stem_Trial1'].tolist() == [2.0, 6.0]
+
+
+def test_save_from_stale_session_is_rejected_without_api_call():
+    sheet = FakeSheet(GRID)
+    cache = GrowthCache(lambda: sheet)
+    first, version = cache.get()
+    second, _ = cache.get()
+    cache.save(growth([2.0, 7.0]), version)
+    reads = sheet.reads
+    with pytest.raises(GrowthConflictError):
+        cache.save(second, version)
+    assert sheet.reads == reads and len(sheet.updates) == 1
+
+
+def test_save_after_direct_sheet_edit_conflicts_and_reloads():
+    sheet = FakeSheet(GRID)
+    cache = GrowthCache(lambda: sheet)
+    df, version = cache.get()
+    sheet.grid[2][1] = 9
+    with pytest.raises(GrowthConflictError):
+        cache.save(growth([2.0, 5.5]), version)
+    assert sheet.updates == []
+    reloaded, current = cache.get()
+    assert current == grid_version(sheet.grid) and reloaded['Stem_Trial1'].tolist() == [2.0, 9.0]
+
+
+def test_direct_edit_of_other_cells_is_kept():
+    sheet = FakeSheet(GRID)
+    cache = GrowthCache(lambda: sheet)
+    df, version = cache.get()
+    sheet.grid[1][1] = 3
+    df.loc[1, 'Stem_Trial1'] = 6.0
+    cache.save(df, version)
+    assert [row[1] for row in sheet.grid[1:]] == [3, 6.0]
+
+
+def test_save_without_base_grid_checks_the_whole_sheet():
+    sheet = FakeSheet(GRID)
+    version = grid_version(GRID)
+    save_growth(sheet, growth([2.0, 6.0]), version)
+    assert sheet.reads == 1 and sheet.range_reads == []
+    with pytest.raises(GrowthConflictError):
+        save_growth(sheet, growth([2.0, 7.0]), version)
+
+
+def test_frame_round_trip_has_no_changes():
+    df = growth([2.0, 5.0])
+    assert changed_ranges(GRID, frame_to_grid(df)) == []
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from health import MAX_GAP, OPERATORS, WINDOWS, HealthEngine, RollingStats
+
+LIMITS = (('>', 30.0), ('<', 25.0))
+
+
+def test_rolling_stats_match_a_full_window_scan():
+    rng = np.random.default_rng(1)
+    # ระยะห่างแบบสุ่ม มีช่วงข้อมูลขาดหายเกิน MAX_GAP และค่าที่อ่านไม่ได้ (NaN)
+    times = np.cumsum(rng.choice([0, 30, 30, 30, 90, 900], size=400)).astype(float)
+    values = rng.normal(28, 3, size=400)
+    values[rng.random(400) < 0.05] = np.nan
+    stats = RollingStats(pd.Timedelta(minutes=20), LIMITS)
+    history = []
+    for t, v in zip(times, values):
+        stats.update(t, v)
+        if not np.isnan(v):
+            dt = 0.0 if not history else min(max(t - history[-1][0], 0.0), MAX_GAP)
+            history.append((t, v, dt))
+        window = [(s, x, d) for s, x, d in history if s > history[-1][0] - 20 * 60]
+        assert stats.mean() == pytest.approx(np.mean([x for _, x, _ in window]))
+        assert stats.max() == max(x for _, x, _ in window)
+        for op, limit in LIMITS:
+            expected = sum(d for _, x, d in window if OPERATORS[op](x, limit))
+            assert stats.time_above(op, limit) == pytest.approx(expected, abs=1e-6)
+
+
+def test_incremental_health_matches_one_pass(sensor_frame, sensor_chunks):
+    engine = HealthEngine()
+    for chunk in sensor_chunks:
+        engine.update(chunk)
+    expected = HealthEngine()
+    expected.update(sensor_frame)
+    report = engine.report()
+    assert report == expected.report()
+    assert len(report.transitions) > 3 and report.time == sensor_frame.index[-1]
+
+    # ค่าเฉลี่ยย้อนหลังและเวลาที่เกินเกณฑ์เทียบกับการคำนวณจากทั้งตาราง
+    mold = sensor_frame.index > sensor_frame.index[-1] - WINDOWS['mold']
+    for col in ('AirTemp', 'AirHumid'):
+        assert report.means[col] == pytest.approx(sensor_frame[col][mold].astype('float64').mean())
+    seconds = sensor_frame.index.as_unit('s').asi8.astype(float)
+    gaps = np.clip(np.diff(seconds, prepend=seconds[0]), 0, MAX_GAP)
+    recent = sensor_frame.index > sensor_frame.index[-1] - WINDOWS['exposure']
+    for col, op, limit in report.exposure:
+        over = OPERATORS[op](sensor_frame[col].to_numpy(), limit) & recent
+        assert report.exposure[(col, op, limit)] == pytest.approx(gaps[over].sum() / 3600)
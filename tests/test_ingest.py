@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from ingest import Batch, IngestServer, ReadingBroker, StoreWriter, is_loopback, to_records
+from store import SensorStore
+
+
+def test_to_records_shapes_and_timestamps():
+    header, records = to_records({"readings": [{"AirTemp": 27.5, "ts": 1773200000}, {"SoilHumid": "60%"}]}, received_at=1773200060)
+    assert header == ["AirTemp", "Timestamp", "SoilHumid"]
+    assert records == [[27.5, "11/03/2026, 10:33:20", None], [None, "11/03/2026, 10:34:20", "60%"]]
+
+    header, records = to_records({"device": "bed2", "Timestamp": "01/01/2026, 00:00:00", "Pump": "ON"})
+    assert header == ["Timestamp", "Pump"]
+    assert records == [["01/01/2026, 00:00:00", "ON"]]
+
+
+@pytest.mark.parametrize("payload, message", [
+    ({"_id": 1}, "reserved column"),
+    ({"_ts": 1, "AirTemp": 1}, "reserved column"),
+    ({"Garbage": 1}, "unknown column"),
+    ({"AirTemp": {"nested": 1}}, "must be a number"),
+    ({"AirTemp": [1, 2]}, "must be a number"),
+    ("text", "expected a reading"),
+    ([{"AirTemp": 1}, 5], "expected a reading"),
+])
+def test_to_records_rejects_bad_payloads(payload, message):
+    with pytest.raises(ValueError, match=message):
+        to_records(payload)
+
+
+def test_to_records_accepts_existing_store_columns():
+    header, _ = to_records({"Leaf Count": 12}, allowed={"Leaf Count", "Timestamp"})
+    assert header == ["Leaf Count", "Timestamp"]
+
+
+class FailingStore(SensorStore):
+    def append_rows(self, header, records, sheet_rows=None, only_newer=False):
+        super().append_rows(header, records, sheet_rows, only_newer)
+        raise OSError("disk full")
+
+
+def test_writer_fails_only_the_device_that_rolled_back(tmp_path):
+    stores = {"a": SensorStore(str(tmp_path / "a.sqlite")), "b": FailingStore(str(tmp_path / "b.sqlite"))}
+
+    async def scenario():
+        broker = ReadingBroker()
+        writer = StoreWriter(stores, broker)
+        loop = asyncio.get_running_loop()
+        batches = [Batch(device, ["AirTemp"], [[27.0], [28.0]], loop.create_future()) for device in ("a", "b", "a")]
+        for batch in batches:
+            broker.publish("readings", batch)
+        task = asyncio.create_task(writer.run())
+        results = await asyncio.gather(*(b.done for b in batches), return_exceptions=True)
+        task.cancel()
+        return results
+
+    results = asyncio.run(scenario())
+    assert results[0] == 2 and results[2] == 2
+    assert isinstance(results[1], OSError)
+    assert stores["a"].version() == 4
+    assert stores["b"].version() == 0
+
+
+async def request(port, line, headers=""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{line} HTTP/1.1\r\n{headers}Connection: close\r\n\r\n".encode())
+    await writer.drain()
+    status = (await reader.read()).split(b"\r\n", 1)[0].decode()
+    writer.close()
+    return status
+
+
+def test_metrics_require_the_ingest_token(tmp_path):
+    async def scenario():
+        stores = {"a": SensorStore(str(tmp_path / "a.sqlite"))}
+        server = await asyncio.start_server(IngestServer(ReadingBroker(), stores, token="secret").handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return [
+                await request(port, "GET /metrics"),
+                await request(port, "GET /metrics", "Authorization: Bearer wrong\r\n"),
+                await request(port, "GET /metrics", "Authorization: Bearer secret\r\n"),
+                await request(port, "GET /health"),
+            ]
+
+    assert asyncio.run(scenario()) == ["HTTP/1.1 401 Unauthorized", "HTTP/1.1 401 Unauthorized", "HTTP/1.1 200 OK", "HTTP/1.1 200 OK"]
+
+
+def test_columns_added_after_startup_are_accepted(tmp_path):
+    store = SensorStore(str(tmp_path / "a.sqlite"))
+    server = IngestServer(ReadingBroker(), {"a": store})
+    assert "Leaf Count" not in server.columns("a")
+    with store.transaction():
+        store.append_rows(["Timestamp", "Leaf Count"], [["01/01/2026, 00:00:00", 3]])
+    assert "Leaf Count" in server.columns("a")
+
+
+def test_is_loopback():
+    assert is_loopback("127.0.0.1") and is_loopback("localhost") and is_loopback("::1")
+    assert not is_loopback("0.0.0.0") and not is_loopback("192.168.1.10")
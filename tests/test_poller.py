@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+
+import poller
+from benchmark import synthetic_rows
+from cleaning import slice_time
+from poller import SensorPoller
+from store import SensorStore
+
+ROWS = 3000     # 25 ชั่วโมง (แถวละ 30 วินาที)
+
+
+@pytest.fixture
+def rows():
+    return synthetic_rows(ROWS)
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    # อ่านทีละไม่กี่ร้อยแถว ให้ทุกขั้นตอนอัปเดตหลายรอบและตัดตาม retention ระหว่างทาง
+    monkeypatch.setattr(poller, 'LOAD_BATCH', 700)
+    monkeypatch.setattr(poller, 'TRIM_SLACK', pd.Timedelta(hours=2))
+
+
+def assert_same_results(snapshot, expected):
+    # ทุกอย่างยกเว้นข้อมูลดิบและตาราง 1 นาที (ขึ้นกับ retention) ; ผลรวมทศนิยมอาจต่างตามลำดับการบวก
+    for name, table in expected.rollups.items():
+        if name != '1 นาที':
+            pd.testing.assert_frame_equal(snapshot.rollups[name], table)
+    assert [t[:6] for t in snapshot.trials] == [t[:6] for t in expected.trials]
+    for trial, other in zip(snapshot.trials, expected.trials):
+        assert trial.sums == pytest.approx(other.sums)
+    assert snapshot.forecasts.keys() == expected.forecasts.keys()
+    for col, series in expected.forecasts.items():
+        pd.testing.assert_series_equal(snapshot.forecasts[col], series)
+    assert snapshot.health == expected.health
+    report, other = snapshot.actuators, expected.actuators
+    assert report[:3] == other[:3]
+    assert report.activations == other.activations
+    for actuator, runtime in other.runtime.items():
+        assert report.runtime[actuator] == pytest.approx(runtime)
+    for actuator, events in other.events.items():
+        assert [e[:4] for e in report.events[actuator]] == [e[:4] for e in events]
+        assert [e.seconds for e in report.events[actuator]] == pytest.approx([e.seconds for e in events])
+
+
+def test_retention_trims_raw_rows_but_keeps_every_summary(tmp_path, rows):
+    header, records = rows
+    store = SensorStore(str(tmp_path / "sensors.sqlite"))
+    store.append_rows(header, records[:2000])
+    hot = SensorPoller(store, retention=pd.Timedelta(hours=6))
+    full = SensorPoller(store, retention=None)
+    hot.poll_once()
+    full.poll_once()
+    first_start = hot.hot_start
+    store.append_rows(header, records[2000:])
+    snapshot, expected = hot.poll_once(), full.poll_once()
+
+    assert first_start is not None and snapshot.hot_start > first_start
+    assert snapshot.hot_start >= snapshot.frame.index[-1] - pd.Timedelta(hours=6) - poller.TRIM_SLACK
+    pd.testing.assert_frame_equal(snapshot.frame, slice_time(expected.frame, snapshot.hot_start))
+    minutes = expected.rollups['1 นาที']
+    pd.testing.assert_frame_equal(snapshot.rollups['1 นาที'], minutes[minutes.index >= snapshot.hot_start.floor('1min')])
+    assert_same_results(snapshot, expected)
+
+
+def test_warm_start_continues_from_saved_state(tmp_path, rows, monkeypatch):
+    header, records = rows
+    records[2000][2] = ''    # แถวแรกหลังบันทึกสถานะต้อง ffill จากค่าที่บันทึกไว้
+    state_path = str(tmp_path / "state" / "poller.pkl")
+    store = SensorStore(str(tmp_path / "sensors.sqlite"))
+    store.append_rows(header, records[:2000])
+    SensorPoller(store, retention=pd.Timedelta(hours=6), state_path=state_path).poll_once()
+    store.append_rows(header, records[2000:])
+
+    warm = SensorPoller(store, retention=pd.Timedelta(hours=6), state_path=state_path)
+    assert warm.restore() and warm.snapshot.version == 2000
+    loads = []
+    load = store.load
+    monkeypatch.setattr(store, 'load', lambda **kw: loads.append(kw['after_id']) or load(**kw))
+    snapshot = warm.poll_once()
+    monkeypatch.setattr(store, 'load', load)
+    expected = SensorPoller(store, retention=pd.Timedelta(hours=6)).poll_once()
+
+    assert loads[0] == 2000 and snapshot.version == expected.version == ROWS
+    start = max(snapshot.hot_start, expected.hot_start)
+    pd.testing.assert_frame_equal(slice_time(snapshot.frame, start), slice_time(expected.frame, start))
+    assert_same_results(snapshot, expected)
+
+
+def test_saved_state_is_ignored_when_the_database_was_replaced(tmp_path, rows):
+    header, records = rows
+    state_path = str(tmp_path / "poller.pkl")
+    store = SensorStore(str(tmp_path / "old.sqlite"))
+    store.append_rows(header, records[:2000])
+    SensorPoller(store, state_path=state_path).poll_once()
+
+    store = SensorStore(str(tmp_path / "new.sqlite"))
+    store.append_rows(header, records[:500])
+    warm = SensorPoller(store, state_path=state_path)
+    assert not warm.restore() and warm.snapshot.version == 0
+    assert len(warm.poll_once().frame) == 500
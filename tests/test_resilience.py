@@ -0,0 +1,98 @@
+import pickle
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, load_state, save_state
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, 'monotonic', clock)
+    monkeypatch.setattr(resilience.random, 'uniform', lambda lo, hi: 1.0)
+    return clock
+
+
+def fail():
+    raise RuntimeError("503")
+
+
+def trip(breaker, times):
+    for _ in range(times):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+
+
+def test_opens_after_threshold_and_rejects_without_calling(clock):
+    breaker = CircuitBreaker(threshold=3, base_delay=60)
+    trip(breaker, 2)
+    assert breaker.state == "closed" and breaker.retry_in() == 0
+    trip(breaker, 1)
+    assert breaker.state == "open" and breaker.retry_in() == 60
+    calls = []
+    with pytest.raises(CircuitOpenError, match="503"):
+        breaker.call(lambda: calls.append(1))
+    assert calls == []
+
+
+def test_half_open_allows_one_probe_and_success_closes(clock):
+    breaker = CircuitBreaker(threshold=1, base_delay=60)
+    trip(breaker, 1)
+    clock.now += 60
+    assert breaker.state == "half-open"
+
+    def probe():
+        # ระหว่าง probe ยังไม่ปล่อยให้เรียกซ้อน
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: None)
+        return "ok"
+
+    assert breaker.call(probe) == "ok"
+    assert breaker.state == "closed" and breaker.failures == 0 and breaker.last_error is None
+
+
+def test_failed_probe_doubles_delay_up_to_max(clock):
+    breaker = CircuitBreaker(threshold=1, base_delay=60, max_delay=200)
+    delays = []
+    trip(breaker, 1)
+    for _ in range(3):
+        delays.append(breaker.retry_in())
+        clock.now += breaker.retry_in()
+        trip(breaker, 1)
+    delays.append(breaker.retry_in())
+    assert delays == [60, 120, 200, 200]
+
+
+def test_jitter_stays_within_bounds(monkeypatch, clock):
+    bounds = []
+    monkeypatch.setattr(resilience.random, 'uniform', lambda lo, hi: bounds.append((lo, hi)) or hi)
+    breaker = CircuitBreaker(threshold=1, base_delay=100, jitter=0.2)
+    trip(breaker, 1)
+    assert bounds == [(0.8, 1.2)]
+    assert breaker.retry_in() == pytest.approx(120)
+
+
+def test_state_round_trip(tmp_path):
+    path = str(tmp_path / "state" / "poller.pkl")
+    assert load_state(path) is None
+    save_state(path, {'last_id': 42})
+    assert load_state(path) == {'last_id': 42}
+    assert list((tmp_path / "state").iterdir()) == [tmp_path / "state" / "poller.pkl"]
+
+
+def test_corrupt_or_old_state_is_ignored(tmp_path):
+    path = tmp_path / "poller.pkl"
+    path.write_bytes(b"not a pickle")
+    assert load_state(str(path)) is None
+    path.write_bytes(pickle.dumps((resilience.STATE_VERSION - 1, {'last_id': 42})))
+    assert load_state(str(path)) is None
@@ -0,0 +1,50 @@
+import pandas as pd
+
+from rollups import RESOLUTIONS, RollupSet
+
+
+def updated(chunks):
+    rollups = RollupSet()
+    for chunk in chunks:
+        rollups.update(chunk)
+    return rollups
+
+
+def test_incremental_rollups_match_one_pass(sensor_frame, sensor_chunks):
+    expected = updated([sensor_frame]).tables()
+    tables = updated(sensor_chunks).tables()
+    assert list(tables) == list(RESOLUTIONS)
+    for name, table in expected.items():
+        pd.testing.assert_frame_equal(tables[name], table)
+    minutes = sensor_frame['AirTemp'].groupby(sensor_frame.index.floor('1min')).mean()
+    pd.testing.assert_series_equal(
+        tables['1 นาที'][('AirTemp', 'sum')] / tables['1 นาที'][('AirTemp', 'count')], minutes,
+        check_names=False, check_dtype=False, check_index_type=False, check_freq=False
+    )
+
+
+def test_returned_tables_are_not_changed_by_later_updates(sensor_chunks):
+    rollups = RollupSet()
+    rollups.update(sensor_chunks[0])
+    rollups.update(sensor_chunks[1])
+    tables = rollups.tables()
+    copies = {name: table.copy() for name, table in tables.items()}
+    for chunk in sensor_chunks[2:]:
+        rollups.update(chunk)
+    for name, table in tables.items():
+        pd.testing.assert_frame_equal(table, copies[name])
+
+
+def test_trim_drops_only_old_minute_buckets(sensor_frame, sensor_chunks):
+    expected = updated([sensor_frame]).tables()
+    cutoff = sensor_frame.index[1201]     # กลางนาที: ช่วงที่มี cutoff ต้องยังอยู่
+    rollups = updated(sensor_chunks[:6])
+    rollups.trim(cutoff)
+    for chunk in sensor_chunks[6:]:
+        rollups.update(chunk)
+    tables = rollups.tables()
+    minutes = expected['1 นาที']
+    pd.testing.assert_frame_equal(tables['1 นาที'], minutes[minutes.index >= cutoff.floor('1min')])
+    assert tables['1 นาที'].index[0] < cutoff
+    for name in list(RESOLUTIONS)[1:]:
+        pd.testing.assert_frame_equal(tables[name], expected[name])
@@ -0,0 +1,59 @@
+from benchmark import MockWorksheet
+from sheets import SheetTail
+
+HEADER = ['Timestamp', 'AirTemp']
+
+
+def rows(n, start=0):
+    return [[f"01/03/2026, 00:{i:02d}:00", f"{20 + i}.0"] for i in range(start, start + n)]
+
+
+def test_reads_only_appended_rows():
+    sheet = MockWorksheet(HEADER, rows(3))
+    tail = SheetTail(sheet)
+    first, values, reloaded = tail.read_new_rows()
+    assert (first, len(values), reloaded) == (2, 3, False)
+    assert values[0] == ["01/03/2026, 00:00:00", 20]
+
+    sheet.rows.extend(rows(2, start=3))
+    first, values, reloaded = tail.read_new_rows()
+    assert (first, [v[1] for v in values], reloaded) == (5, [23, 24], False)
+
+    first, values, reloaded = tail.read_new_rows()
+    assert values == [] and not reloaded
+
+
+def test_state_round_trip_resumes_at_last_row():
+    sheet = MockWorksheet(HEADER, rows(3))
+    tail = SheetTail(sheet)
+    tail.read_new_rows()
+    sheet.rows.extend(rows(1, start=3))
+    resumed = SheetTail(sheet)
+    resumed.restore(tail.state())
+    first, values, reloaded = resumed.read_new_rows()
+    assert (first, len(values), reloaded) == (5, 1, False)
+
+
+def test_header_change_reloads_with_new_columns():
+    sheet = MockWorksheet(HEADER, rows(3))
+    tail = SheetTail(sheet)
+    tail.read_new_rows()
+    sheet.header.append('SoilHumid')
+    sheet.rows.append(["01/03/2026, 00:03:00", "23.0", "61.5"])
+    first, values, reloaded = tail.read_new_rows()
+    assert reloaded and first == 2 and len(values) == 4
+    assert tail.header == HEADER + ['SoilHumid']
+    assert values[-1] == ["01/03/2026, 00:03:00", 23, 61.5]
+
+
+def test_edited_or_removed_last_row_reloads():
+    sheet = MockWorksheet(HEADER, rows(3))
+    tail = SheetTail(sheet)
+    tail.read_new_rows()
+    sheet.rows[-1] = ["01/03/2026, 00:02:00", "99.0"]
+    first, values, reloaded = tail.read_new_rows()
+    assert reloaded and len(values) == 3
+
+    del sheet.rows[1:]
+    first, values, reloaded = tail.read_new_rows()
+    assert reloaded and len(values) == 1
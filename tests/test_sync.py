@@ -0,0 +1,58 @@
+import sqlite3
+
+from benchmark import MockWorksheet
+from sheets import SheetTail
+from store import SensorStore
+from sync import sync_once
+
+HEADER = ['Timestamp', 'AirTemp']
+
+
+def rows(n, start=0):
+    return [[f"01/03/2026, 00:{i:02d}:00", f"{20 + i}.0"] for i in range(start, start + n)]
+
+
+class WatchedSheet(MockWorksheet):
+    # เรียก on_read ระหว่างที่ sync กำลังรอ "API" อ่านชีต
+    on_read = None
+
+    def batch_get(self, ranges):
+        if self.on_read:
+            self.on_read()
+        return super().batch_get(ranges)
+
+
+def test_sheet_is_read_without_holding_the_write_lock(tmp_path):
+    store = SensorStore(str(tmp_path / "s.sqlite"))
+    sheet = WatchedSheet(HEADER, rows(3))
+    sync_once(SheetTail(sheet), store)
+    sheet.rows.extend(rows(2, start=3))
+
+    def write_from_other_process():
+        other = sqlite3.connect(store.path, timeout=0, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        other.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('alert', '1')")
+        other.execute("COMMIT")
+        other.close()
+
+    sheet.on_read = write_from_other_process
+    assert sync_once(SheetTail(sheet), store) == 2
+    assert store.version() == 5
+
+
+def test_rows_synced_by_another_process_meanwhile_are_not_duplicated(tmp_path):
+    store = SensorStore(str(tmp_path / "s.sqlite"))
+    sheet = WatchedSheet(HEADER, rows(3))
+    sync_once(SheetTail(sheet), store)
+    sheet.rows.extend(rows(2, start=3))
+
+    def sync_from_other_process():
+        sheet.on_read = None
+        sync_once(SheetTail(sheet), store)
+
+    sheet.on_read = sync_from_other_process
+    assert sync_once(SheetTail(sheet), store) == 0
+    assert store.version() == 5
+    sheet.rows.extend(rows(1, start=5))
+    assert sync_once(SheetTail(sheet), store) == 1
+    assert store.load()['AirTemp'].tolist() == [20, 21, 22, 23, 24, 25]
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from trials import TrialIndex, trial_mean
+
+
+def updated(chunks):
+    index = TrialIndex()
+    for chunk in chunks:
+        trials = index.update(chunk)
+    return trials
+
+
+def test_incremental_trials_match_a_full_recount(sensor_frame, sensor_chunks):
+    trials = updated(sensor_chunks)
+    expected = updated([sensor_frame])
+    assert [t[:6] for t in trials] == [t[:6] for t in expected]
+    for trial, other in zip(trials, expected):
+        assert trial.sums == pytest.approx(other.sums)
+
+    # นับใหม่จากทั้งตาราง: รอบใหม่เริ่มเมื่อ Day ลดลงมากกว่า 1
+    day = sensor_frame['Day'].astype('float64')
+    groups = sensor_frame.groupby(((day.diff() < -1).cumsum() + 1).to_numpy())
+    assert [t.number for t in trials] == [1, 2, 3]
+    assert [t.count for t in trials] == groups.size().tolist()
+    assert [t.start_row for t in trials] == [0, 1000, 2000]
+    assert [t.start_time for t in trials] == [g.index[0] for _, g in groups]
+    assert [t.end_time for t in trials] == [g.index[-1] for _, g in groups]
+    for col in ('AirTemp', 'SoilHumid'):
+        assert [trial_mean(t, col) for t in trials] == pytest.approx(groups[col].mean().tolist(), rel=1e-6)
+
+
+def test_new_trial_needs_day_to_drop_by_more_than_one():
+    times = pd.date_range("2026-03-01", periods=7, freq="30s", tz="Asia/Bangkok", name="Time")
+    frame = pd.DataFrame({'Day': [1, 2, 3, 2, 3, 1, 2], 'AirTemp': np.arange(7, dtype='float32')}, index=times)
+    for splits in ([0, 7], [0, 3, 5, 7], [0, 1, 2, 3, 4, 5, 6, 7]):
+        trials = updated([frame.iloc[lo:hi] for lo, hi in zip(splits, splits[1:])])
+        assert [(t.start_row, t.end_row, t.count, t.sums['AirTemp']) for t in trials] == [(0, 5, 5, 10.0), (5, 7, 2, 11.0)]
@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from cleaning import SENSOR_COLS
+
+# ข้อมูลสรุปของรอบการทดลอง 1 รอบ
+# start_row/end_row คือลำดับแถวนับจากแถวแรกที่ poller ประมวลผล (end_row ไม่รวม) ไม่ใช่ตำแหน่งใน frame ที่ถูกตัดตาม retention
+# sums คือผลรวมค่าเซนเซอร์ในรอบ ใช้คู่กับ count หาค่าเฉลี่ยโดยไม่ต้องกรองทั้งตาราง
+Trial = namedtuple("Trial", ["number", "start_row", "end_row", "start_time", "end_time", "count", "sums"])
+
+
+def trial_mean(trial, col):
+    if not trial.count or col not in trial.sums:
+        return 0
+    return trial.sums[col] / trial.count
+
+
+# --- ดัชนีรอบการทดลอง (Trial Index) ---
+# รอบใหม่เริ่มเมื่อค่า Day ลดลงมากกว่า 1 (เริ่มปลูกใหม่) เหมือนเงื่อนไขเดิม diff() < -1
+# อัปเดตเฉพาะแถวใหม่: แถวที่ต่อท้ายจะบวกเข้าผลรวมของรอบล่าสุด ไม่ต้องคำนวณย้อนหลัง
+class TrialIndex:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.trials = []
+        self.rows = 0
+        self.last_day = None
+
+    def update(self, chunk):
+        if chunk.empty or 'Day' not in chunk.columns:
+            self.rows += len(chunk)
+            return self.snapshot()
+
+        day = pd.to_numeric(chunk['Day'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        previous = day[0] if self.last_day is None else self.last_day
+        starts_new = np.diff(day, prepend=previous) < -1
+        if not self.trials:
+            starts_new[0] = True
+
+        # แบ่ง chunk เป็นช่วง ๆ ตามจุดเริ่มรอบใหม่ (ปกติทั้ง chunk อยู่ในรอบเดียว)
+        cuts = np.flatnonzero(starts_new)
+        bounds = np.concatenate([[0], cuts, [len(day)]])
+        bounds = np.unique(bounds)
+        cols = [c for c in SENSOR_COLS if c in chunk.columns]
+        sums = {c: np.add.reduceat(chunk[c].to_numpy(dtype='float64'), bounds[:-1]) for c in cols}
+        times = chunk.index
+
+        for k in range(len(bounds) - 1):
+            lo, hi = bounds[k], bounds[k + 1]
+            part_sums = {c: float(sums[c][k]) for c in cols}
+            if starts_new[lo]:
+                self.trials.append({
+                    'number': len(self.trials) + 1, 'start_row': self.rows + lo,
+                    'start_time': times[lo], 'count': 0, 'sums': dict.fromkeys(cols, 0.0)
+                })
+            trial = self.trials[-1]
+            trial['end_row'] = self.rows + hi
+            trial['end_time'] = times[hi - 1]
+            trial['count'] += hi - lo
+            for c in cols:
+                trial['sums'][c] = trial['sums'].get(c, 0.0) + part_sums[c]
+
+        self.rows += len(day)
+        self.last_day = day[-1]
+        return self.snapshot()
+
+    def snapshot(self):
+        # สำเนาแบบอ่านอย่างเดียวสำหรับเผยแพร่ให้ทุก session
+        return tuple(
+            Trial(t['number'], t['start_row'], t['end_row'], t['start_time'], t['end_time'], t['count'], dict(t['sums']))
+            for t in self.trials
+        )